@@ -0,0 +1,185 @@
+import datetime
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from device_commands import normalize_message
+from log_catchup import device_log_key, parse_device_time
+
+GRANTED = "granted"
+UNKNOWN_USER = "unknown_user"
+NO_ACCESS = "no_access"
+OUTSIDE_SCHEDULE = "outside_schedule"
+
+MINUTES_PER_DAY = 24 * 60
+# Seeded into access_rules on first run. days are Python weekdays (0 = Monday);
+# a permission without any rule is never granted.
+DEFAULT_ACCESS_RULES = (
+    ("Open", "0123456", 0, MINUTES_PER_DAY),
+    ("Limited", "0123456", 6 * 60, 22 * 60),
+)
+LATENCY_SAMPLES = 4096
+
+def init_access_rules(conn):
+    # Time windows per permission, end_minute exclusive
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS access_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            permission TEXT NOT NULL,
+            days TEXT NOT NULL,
+            start_minute INTEGER NOT NULL,
+            end_minute INTEGER NOT NULL
+        )
+    """)
+    if conn.execute("SELECT COUNT(*) FROM access_rules").fetchone()[0] == 0:
+        conn.executemany("INSERT INTO access_rules (permission, days, start_minute, end_minute) VALUES (?, ?, ?, ?)",
+                         DEFAULT_ACCESS_RULES)
+    conn.commit()
+
+def compile_rules(rows):
+    # permission -> bytearray with one flag per minute of the week, so a
+    # decision is a single index instead of a walk over the rules
+    windows = {}
+    for permission, days, start, end in rows:
+        window = windows.setdefault(permission, bytearray(7 * MINUTES_PER_DAY))
+        start = max(0, start)
+        end = min(MINUTES_PER_DAY, end)
+        for day in str(days):
+            if day.isdigit() and int(day) < 7 and start < end:
+                offset = int(day) * MINUTES_PER_DAY
+                window[offset + start:offset + end] = b"\x01" * (end - start)
+    return windows
+
+class AccessDecisionEngine:
+    # Answers "may this user open the door now?" for every punch a device
+    # reports. Users and rules are held in memory (loaded once, then patched
+    # by reload_users when the users table changes) so the WebSocket loop
+    # never waits on SQLite before replying to the device.
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # (card -> user id, user id -> (card, permission), permission -> window)
+        self._state = ({}, {}, {})
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.decisions = 0
+        self.max_latency_us = 0
+        self.load()
+
+    def load(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            init_access_rules(conn)
+            users = conn.execute("SELECT id, card_number, permission FROM users").fetchall()
+            rules = conn.execute("SELECT permission, days, start_minute, end_minute FROM access_rules").fetchall()
+        finally:
+            conn.close()
+        by_card = {}
+        by_id = {}
+        for user_id, card, permission in users:
+            by_id[user_id] = (card, permission)
+            if card:
+                by_card[card] = user_id
+        with self._lock:
+            self._state = (by_card, by_id, compile_rules(rules))
+
+    def reload_users(self, user_ids=None):
+        # Call after users are added, edited or deleted; None reloads everything
+        if user_ids is None:
+            self.load()
+            return
+        user_ids = [int(user_id) for user_id in user_ids]
+        if not user_ids:
+            return
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute("SELECT id, card_number, permission FROM users WHERE id IN ("
+                                + ", ".join("?" * len(user_ids)) + ")", user_ids).fetchall()
+        finally:
+            conn.close()
+        found = {row[0]: row for row in rows}
+        with self._lock:
+            by_card, by_id, _ = self._state
+            for user_id in user_ids:
+                old = by_id.pop(user_id, None)
+                if old and by_card.get(old[0]) == user_id:
+                    del by_card[old[0]]
+                if user_id in found:
+                    _, card, permission = found[user_id]
+                    by_id[user_id] = (card, permission)
+                    if card:
+                        by_card[card] = user_id
+
+    def decide(self, enrollid=None, card=None, now=None):
+        # Returns (decision, card_number). Devices identify users by enrollid
+        # (= users.id); the simulator and older terminals send the card.
+        by_card, by_id, windows = self._state
+        user_id = by_card.get(str(card)) if card else enrollid
+        user = by_id.get(user_id) if user_id else None
+        if user is None:
+            return UNKNOWN_USER, card or ""
+        card, permission = user
+        window = windows.get(permission)
+        if window is None:
+            return NO_ACCESS, card
+        t = time.localtime(now)
+        if not window[t.tm_wday * MINUTES_PER_DAY + t.tm_hour * 60 + t.tm_min]:
+            return OUTSIDE_SCHEDULE, card
+        return GRANTED, card
+
+    def answer_sendlog(self, data, device_serial):
+        # Returns (reply for the device, one pipeline event per record). The
+        # reply's "access" is the decision for the newest record, the punch the
+        # device is waiting on.
+        data = normalize_message(data)
+        serial = data.get("sn") or device_serial
+        records = data.get("record") or []
+        now = time.time()
+        access = 0
+        events = []
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            decision, card = self.decide(enrollid=record.get("enrollid"), now=now)
+            access = 1 if decision == GRANTED else 0
+            events.append({
+                "cmd": "sendlog",
+                "device_serial": serial,
+                "user_id": record.get("enrollid"),
+                "card_number": card,
+                "direction": "out" if record.get("inout") == 1 else "in",
+                "timestamp": parse_device_time(record.get("time")) or int(now),
+                "decision": decision,
+                "log_key": device_log_key(record),
+                # The base64 punch photo is not kept in raw_data
+                "record": {key: value for key, value in record.items() if key != "image"},
+            })
+        reply = {
+            "ret": "sendlog",
+            "result": True,
+            "count": len(records),
+            "logindex": data.get("logindex"),
+            "cloudtime": datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+            "access": access,
+        }
+        return reply, events
+
+    def record_latency(self, started_ns):
+        # Microseconds from receiving the punch to answering it
+        latency_us = (time.perf_counter_ns() - started_ns) // 1000
+        self._latencies.append(latency_us)
+        self.decisions += 1
+        self.max_latency_us = max(self.max_latency_us, latency_us)
+        return latency_us
+
+    def stats(self):
+        samples = sorted(self._latencies)
+        by_card, by_id, windows = self._state
+        return {
+            "users": len(by_id),
+            "rules": len(windows),
+            "decisions": self.decisions,
+            "p50_latency_us": samples[len(samples) // 2] if samples else 0,
+            "p99_latency_us": samples[min(len(samples) - 1, len(samples) * 99 // 100)] if samples else 0,
+            "max_latency_us": self.max_latency_us,
+        }
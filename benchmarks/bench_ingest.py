@@ -0,0 +1,276 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# End-to-end ingestion benchmark. Runs the real MainDashboard offscreen in a
+# scratch directory, with synthetic cameras instead of RTSP and a fleet of
+# simulated devices from load_generator, then writes one JSON result file:
+#
+#   python benchmarks/bench_ingest.py --devices 50 --rate 2 --duration 30
+#   python benchmarks/compare.py benchmarks/results/old.json benchmarks/results/new.json
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+GUI_PROBE_INTERVAL_MS = 5
+
+def rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Peak rather than current on platforms without /proc
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    result = {f"p{p}": samples[min(len(samples) - 1, len(samples) * p // 100)] for p in (50, 90, 99)}
+    result["max"] = samples[-1]
+    return result
+
+def dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def db_bytes(path):
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def seed_users(db_path, count):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    permissions = ("Open", "Open", "Open", "Limited", "Restricted")
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (id, name, card_number, unit_number, plate_number, permission) VALUES (?, ?, ?, ?, ?, ?)",
+                [(i, f"user {letters[i % 26]}{letters[i // 26 % 26]}", str(100000 + i), str(i % 200), "",
+                  permissions[i % len(permissions)]) for i in range(1, count + 1)])
+    finally:
+        conn.close()
+
+class PersistLatency:
+    # LogWriter.on_commit hook: commit time minus the "sent_at" the load
+    # generator put in each event, for events sent after the warm-up
+    def __init__(self, measure_from):
+        self.measure_from = measure_from
+        self.samples_ms = []
+        self.rows = 0
+
+    def __call__(self, rows, committed_at):
+        for row in rows:
+            try:
+                data = json.loads(row[10])
+            except (TypeError, ValueError):
+                continue
+            sent_at = data.get("sent_at") or (data.get("record") or {}).get("sent_at")
+            if sent_at and sent_at >= self.measure_from:
+                self.rows += 1
+                self.samples_ms.append((committed_at - sent_at) * 1000.0)
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="ingest-bench-")
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtCore, QtWidgets
+    import main
+
+    main.init_db()
+    seed_users(main.DB_PATH, args.users)
+    camera_url = f"synthetic://{args.frame_size}@{args.camera_fps}"
+    main.ENTRANCE_CAMERA_URL = camera_url
+    main.EXIT_CAMERA_URL = camera_url
+    main.WEBSOCKET_PORT = args.port or free_port()
+    main.METRICS_HTTP_PORT = None
+
+    app = QtWidgets.QApplication([])
+    window = main.MainDashboard()
+    window.show()
+    # Same WAL state as the measurement at the end
+    conn = sqlite3.connect(main.DB_PATH)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    db_before = db_bytes(main.DB_PATH)
+
+    started = time.time()
+    latency = PersistLatency(started + args.warmup)
+    window.log_writer.on_commit = latency
+
+    # GUI-thread responsiveness: how late a short repeating timer fires
+    gui_lag_ms = []
+    last_tick = [time.perf_counter()]
+
+    def gui_tick():
+        now = time.perf_counter()
+        gui_lag_ms.append(max(0.0, (now - last_tick[0]) * 1000.0 - GUI_PROBE_INTERVAL_MS))
+        last_tick[0] = now
+
+    probe = QtCore.QTimer()
+    probe.setTimerType(QtCore.Qt.PreciseTimer)
+    probe.timeout.connect(gui_tick)
+    probe.start(GUI_PROBE_INTERVAL_MS)
+
+    # The device fleet runs in its own process so it does not compete with
+    # the server for the GIL
+    command = [
+        sys.executable, os.path.join(REPO_ROOT, "load_generator.py"), "--json", "--stamp",
+        "--url", f"ws://127.0.0.1:{main.WEBSOCKET_PORT}", "--db", os.path.abspath(main.DB_PATH),
+        "--devices", str(args.devices), "--rate", str(args.rate), "--duration", str(args.duration),
+        "--mode", args.mode, "--burst-factor", str(args.burst_factor), "--burst-seconds", str(args.burst_seconds),
+        "--burst-every", str(args.burst_every), "--storm-every", str(args.storm_every), "--ramp", str(args.ramp),
+        "--unknown-ratio", str(args.unknown_ratio),
+    ]
+    load_report = {}
+    rss_start = [rss_bytes()]
+
+    def drive():
+        time.sleep(0.5)
+        rss_start[0] = rss_bytes()
+        output = subprocess.run(command, capture_output=True, text=True).stdout
+        try:
+            load_report.update(json.loads(output))
+        except ValueError:
+            load_report["error"] = output[-2000:]
+
+    driver = threading.Thread(target=drive, name="load", daemon=True)
+    driver.start()
+
+    load_ended = [0.0]
+
+    def finish_when_drained():
+        if driver.is_alive():
+            return
+        if not load_ended[0]:
+            load_ended[0] = time.time()
+        depth = window.pipeline.stats()["queue_depth"]
+        if depth == 0 or time.time() - load_ended[0] > args.drain_timeout:
+            window.log_writer.flush(timeout=args.drain_timeout)
+            app.quit()
+
+    drain_check = QtCore.QTimer()
+    drain_check.timeout.connect(finish_when_drained)
+    drain_check.start(100)
+    app.exec_()
+    probe.stop()
+    rss_end = rss_bytes()
+
+    result = {
+        "benchmark": "ingest",
+        "started": datetime.datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "load": load_report,
+        "events_persisted": latency.rows,
+        # Events sent after the warm-up over the time they were being sent
+        "events_per_s": latency.rows / max(0.001, load_ended[0] - started - args.warmup),
+        "persist_latency_ms": percentiles(latency.samples_ms),
+        "gui": {
+            "blocked_ms": sum(lag for lag in gui_lag_ms if lag > GUI_PROBE_INTERVAL_MS),
+            "lag_ms": percentiles(gui_lag_ms),
+            "stalls_over_50ms": sum(1 for lag in gui_lag_ms if lag > 50),
+        },
+        "rss": {"start_bytes": rss_start[0], "end_bytes": rss_end, "growth_bytes": rss_end - rss_start[0]},
+        "pipeline": {k: v for k, v in window.pipeline.stats().items() if k != "devices"},
+        "log_writer": window.log_writer.stats(),
+        "snapshot_encoder": window.snapshot_encoder.stats(),
+        "access": window.access.stats(),
+        # Per-stage latency from metrics.METRICS over the whole run
+        "stages": {name: {k: v for k, v in stats.items() if k != "total_ms"}
+                   for name, stats in main.METRICS.summary()["stages"].items()},
+    }
+    window.close()
+    app.processEvents()
+
+    conn = sqlite3.connect(main.DB_PATH)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        log_rows = conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+    finally:
+        conn.close()
+    db_growth = db_bytes(main.DB_PATH) - db_before
+    photo_bytes = dir_bytes("photos")
+    result["db"] = {
+        "log_rows": log_rows,
+        "growth_bytes": db_growth,
+        "bytes_per_million_events": db_growth * 1_000_000 // log_rows if log_rows else None,
+        "photo_bytes": photo_bytes,
+        "photo_bytes_per_million_events": photo_bytes * 1_000_000 // log_rows if log_rows else None,
+    }
+    os.chdir(REPO_ROOT)
+    if args.keep:
+        result["workdir"] = workdir
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end ingestion benchmark (offline, headless).")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=2.0, help="events per second per device")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds excluded from rates and latencies")
+    parser.add_argument("--mode", choices=("sendlog", "event"), default="sendlog")
+    parser.add_argument("--burst-factor", type=float, default=1.0)
+    parser.add_argument("--burst-seconds", type=float, default=0.0)
+    parser.add_argument("--burst-every", type=float, default=0.0)
+    parser.add_argument("--storm-every", type=float, default=0.0)
+    parser.add_argument("--ramp", type=float, default=1.0)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--unknown-ratio", type=float, default=0.02)
+    parser.add_argument("--frame-size", default="1280x720")
+    parser.add_argument("--camera-fps", type=float, default=25)
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="result file (default benchmarks/results/ingest-<time>.json)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    result = run(args)
+    output = args.output or os.path.join(
+        RESULTS_DIR, "ingest-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    latency = result["persist_latency_ms"]
+    print(f"{result['events_persisted']} events, {result['events_per_s']:.1f}/s; "
+          f"persist p50 {latency.get('p50', 0):.1f} ms, p99 {latency.get('p99', 0):.1f} ms; "
+          f"GUI blocked {result['gui']['blocked_ms']:.0f} ms; RSS +{result['rss']['growth_bytes'] // 1024} KiB")
+    print("wrote " + output)
+
+if __name__ == "__main__":
+    main()
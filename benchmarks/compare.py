@@ -0,0 +1,40 @@
+import json
+import sys
+
+# Prints every numeric result of two bench_ingest.py runs side by side:
+#
+#   python benchmarks/compare.py before.json after.json
+
+SKIP = ("params",)
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not prefix and key in SKIP:
+                continue
+            yield from flatten(item, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+def main(argv):
+    if len(argv) != 3:
+        print("usage: compare.py OLD.json NEW.json")
+        return 2
+    with open(argv[1]) as f:
+        old = json.load(f)
+    with open(argv[2]) as f:
+        new = json.load(f)
+    old_values = dict(flatten(old))
+    new_values = dict(flatten(new))
+    if old.get("params") != new.get("params"):
+        print("warning: the runs used different parameters")
+    print(f"{'metric':48} {'old':>14} {'new':>14} {'change':>9}")
+    for name in list(old_values) + [name for name in new_values if name not in old_values]:
+        a = old_values.get(name)
+        b = new_values.get(name)
+        change = f"{(b - a) * 100.0 / a:+.1f}%" if a and b is not None else ""
+        print(f"{name:48} {'' if a is None else f'{a:.6g}':>14} {'' if b is None else f'{b:.6g}':>14} {change:>9}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,282 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+from PyQt5 import QtGui, QtCore
+
+from metrics import METRICS
+
+SYNTHETIC_SCHEME = "synthetic://"
+
+class SyntheticCapture:
+    # cv2.VideoCapture stand-in for "synthetic://640x360@25" URLs: a noisy
+    # test pattern with a moving bar and the frame time, paced like a live
+    # stream, for benchmarks and demos without a camera on the network
+    def __init__(self, url):
+        size, _, fps = url[len(SYNTHETIC_SCHEME):].partition("@")
+        width, _, height = size.partition("x")
+        self.width = int(width or 640)
+        self.height = int(height or 360)
+        self.interval = 1.0 / float(fps or 25)
+        rng = np.random.default_rng(0)
+        gradient = np.linspace(40, 200, self.width, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 12, (self.height, self.width, 3)).astype(np.float32)
+        self._base = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+        self._next = time.monotonic()
+        self._count = 0
+
+    def isOpened(self):
+        return True
+
+    def grab(self):
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = max(self._next + self.interval, time.monotonic() - self.interval)
+        self._count += 1
+        return True
+
+    def retrieve(self, image=None):
+        if image is None or image.shape != self._base.shape:
+            image = np.empty_like(self._base)
+        np.copyto(image, self._base)
+        x = (self._count * 8) % self.width
+        cv2.rectangle(image, (x, 0), (min(self.width - 1, x + 40), self.height - 1), (255, 255, 255), -1)
+        cv2.putText(image, f"{time.time():.3f}", (10, self.height - 12), cv2.FONT_HERSHEY_SIMPLEX, 0.8,
+                    (0, 0, 255), 2)
+        return True, image
+
+    def release(self):
+        pass
+
+def open_capture(camera_url):
+    if camera_url.startswith(SYNTHETIC_SCHEME):
+        return SyntheticCapture(camera_url)
+    return cv2.VideoCapture(camera_url)
+
+class CameraView(QtCore.QObject):
+    # One subscriber of a CameraThread, with its own output size and rate
+    image_update = QtCore.pyqtSignal(QtGui.QImage)
+
+    def __init__(self, camera, width, height, fps, parent=None):
+        super().__init__(parent)
+        self.camera = camera
+        self.width = width
+        self.height = height
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_due = 0.0
+
+    def scaled_image(self, frame):
+        h, w = frame.shape[:2]
+        scale = min(self.width / w, self.height / h)
+        small = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        sh, sw, ch = small.shape
+        # rgbSwapped() returns an image that owns its pixels, converted from BGR
+        return QtGui.QImage(small.data, sw, sh, ch * sw, QtGui.QImage.Format_RGB888).rgbSwapped()
+
+class FrameRing:
+    # Recent frames kept as JPEG bytes, bounded by total size and age, so an
+    # access event can be matched to the frame closest to its own timestamp.
+    def __init__(self, fps=5, max_bytes=32 * 1024 * 1024, max_age=10.0, max_width=1280, quality=80):
+        self.interval = 1.0 / fps if fps else 0.0
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_width = max_width
+        self.quality = quality
+        self.next_due = 0.0
+        self._times = deque()
+        self._frames = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, frame_time, frame):
+        h, w = frame.shape[:2]
+        if self.max_width and w > self.max_width:
+            scale = self.max_width / w
+            frame = cv2.resize(frame, (self.max_width, int(h * scale)), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        jpeg = encoded.tobytes()
+        with self._lock:
+            self._times.append(frame_time)
+            self._frames.append(jpeg)
+            self._bytes += len(jpeg)
+            while self._times and (self._bytes > self.max_bytes or frame_time - self._times[0] > self.max_age):
+                self._times.popleft()
+                self._bytes -= len(self._frames.popleft())
+
+    def newest_time(self):
+        with self._lock:
+            return self._times[-1] if self._times else 0.0
+
+    def closest(self, event_time):
+        # Returns (frame_time, jpeg) nearest to event_time, or None when empty
+        with self._lock:
+            if not self._times:
+                return None
+            i = bisect.bisect_left(self._times, event_time)
+            if i == len(self._times) or (i > 0 and event_time - self._times[i - 1] <= self._times[i] - event_time):
+                i -= 1
+            return self._times[i], self._frames[i]
+
+    def between(self, start, end):
+        with self._lock:
+            lo = bisect.bisect_left(self._times, start)
+            hi = bisect.bisect_right(self._times, end)
+            return [(self._times[i], self._frames[i]) for i in range(lo, hi)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "frames": len(self._times),
+                "bytes": self._bytes,
+                "span_s": self._times[-1] - self._times[0] if self._times else 0.0,
+            }
+
+class CameraThread(QtCore.QThread):
+    # One decoder per stream. Frames are grabbed at grab_fps but only decoded
+    # when a view is due, into one of two preallocated buffers that are swapped
+    # after each decode. Views get a small pre-scaled QImage; full-resolution
+    # frames leave this thread only when snapshot() is called.
+    error = QtCore.pyqtSignal(str)
+
+    def __init__(self, camera_url, grab_fps=30, parent=None):
+        super().__init__(parent)
+        self.camera_url = camera_url
+        self.grab_fps = grab_fps
+        self.running = False
+        self._views = ()
+        self.ring = None
+        self._buffers = [None, None]
+        self._front = 0
+        self._frame_time = 0.0
+        self._has_frame = False
+        self._lock = threading.Lock()
+
+    def run(self):
+        self.running = True
+        cap = open_capture(self.camera_url)
+        if not cap.isOpened():
+            self.error.emit("Failed to open camera stream")
+            return
+        grab_interval = 1.0 / self.grab_fps if self.grab_fps else 0.0
+        while self.running:
+            started = time.monotonic()
+            if not cap.grab():
+                self.error.emit("No frame received")
+                break
+            grabbed_at = time.time()
+            due = [view for view in self._views if started >= view.next_due]
+            ring = self.ring
+            ring_due = ring is not None and started >= ring.next_due
+            if due or ring_due:
+                step = time.perf_counter()
+                if not self._decode(cap, grabbed_at):
+                    self.error.emit("No frame received")
+                    break
+                METRICS.since("camera_decode", step)
+                frame = self._buffers[self._front]
+                for view in due:
+                    view.next_due = started + view.interval
+                    step = time.perf_counter()
+                    image = view.scaled_image(frame)
+                    METRICS.since("camera_scale", step)
+                    view.image_update.emit(image)
+                if ring_due:
+                    ring.next_due = started + ring.interval
+                    step = time.perf_counter()
+                    ring.add(grabbed_at, frame)
+                    METRICS.since("camera_ring_encode", step)
+            remaining = grab_interval - (time.monotonic() - started)
+            if remaining > 0:
+                self.msleep(int(remaining * 1000))
+        cap.release()
+
+    def _decode(self, cap, grabbed_at):
+        back = 1 - self._front
+        ret, frame = cap.retrieve(self._buffers[back])
+        if not ret:
+            return False
+        # retrieve() writes into the buffer we passed when shape and type match
+        self._buffers[back] = frame
+        with self._lock:
+            self._front = back
+            self._frame_time = grabbed_at
+            self._has_frame = True
+        return True
+
+    def add_view(self, width, height, fps):
+        view = CameraView(self, width, height, fps)
+        # Replaced rather than mutated so the capture loop can iterate without a lock
+        self._views = self._views + (view,)
+        return view
+
+    def enable_ring(self, **kwargs):
+        # kwargs are passed to FrameRing (fps, max_bytes, max_age, max_width, quality)
+        if self.ring is None:
+            self.ring = FrameRing(**kwargs)
+        return self.ring
+
+    def remove_view(self, view):
+        self._views = tuple(v for v in self._views if v is not view)
+        return len(self._views)
+
+    def latest_frame(self):
+        # Returns (frame, capture_time) without copying. The array is reused
+        # two decodes later, so callers must not keep it; use snapshot() for that.
+        with self._lock:
+            if not self._has_frame:
+                return None, 0.0
+            return self._buffers[self._front], self._frame_time
+
+    def snapshot(self):
+        # Full-resolution BGR copy of the most recent frame, or None
+        with self._lock:
+            if not self._has_frame:
+                return None
+            return self._buffers[self._front].copy()
+
+    def snapshot_with_time(self):
+        with self._lock:
+            if not self._has_frame:
+                return None, 0.0
+            return self._buffers[self._front].copy(), self._frame_time
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
+class CameraRegistry:
+    # Opens each stream URL once and shares its CameraThread between all views
+    # on it, so entrance and exit pointed at the same camera decode it once.
+    def __init__(self, grab_fps=30):
+        self.grab_fps = grab_fps
+        self._cameras = {}
+
+    def subscribe(self, camera_url, width=320, height=180, fps=15):
+        camera = self._cameras.get(camera_url)
+        if camera is None:
+            camera = CameraThread(camera_url, grab_fps=self.grab_fps)
+            self._cameras[camera_url] = camera
+            view = camera.add_view(width, height, fps)
+            camera.start()
+            return view
+        return camera.add_view(width, height, fps)
+
+    def unsubscribe(self, view):
+        camera = view.camera
+        if camera.remove_view(view) == 0:
+            camera.stop()
+            self._cameras.pop(camera.camera_url, None)
+
+    def cameras(self):
+        return list(self._cameras.values())
+
+    def stop_all(self):
+        for camera in self._cameras.values():
+            camera.stop()
+        self._cameras.clear()
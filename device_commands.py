@@ -0,0 +1,229 @@
+import asyncio
+import datetime
+import json
+import time
+from collections import defaultdict, deque
+
+DEFAULT_TIMEOUT = 10.0
+MAX_IN_FLIGHT = 16
+RETRY_BACKOFF = 0.5
+# Commands that are safe to send again when a reply times out. Paged reads
+# (getuserlist, getnewlog, ...) are not: the device tracks the page position.
+DEFAULT_RETRIES = {
+    "getdevinfo": 2,
+    "getuserinfo": 2,
+    "setuserinfo": 2,
+    "deleteuser": 2,
+    "settime": 2,
+}
+
+class DeviceCommandError(Exception):
+    pass
+
+def normalize_message(data):
+    # Some firmware pads keys and "ret" values with spaces ("count ", "getnewlog ")
+    result = {}
+    for key, value in data.items():
+        key = key.strip() if isinstance(key, str) else key
+        if key in ("ret", "cmd") and isinstance(value, str):
+            value = value.strip()
+        elif key == "record" and isinstance(value, list):
+            value = [normalize_message(item) if isinstance(item, dict) else item for item in value]
+        result[key] = value
+    return result
+
+class DeviceSession:
+    # One connected device. Protocol replies carry the command name ("ret")
+    # and the device serial ("sn") but no request id, so replies are matched
+    # by (sn, ret) to requests of that command in the order they were sent.
+    # Up to max_in_flight requests may be outstanding at once.
+    def __init__(self, serial, websocket, protocol=False, max_in_flight=MAX_IN_FLIGHT):
+        self.serial = serial
+        self.websocket = websocket
+        # True for devices that registered with "reg" and accept server commands
+        self.protocol = protocol
+        self.connected_at = time.time()
+        self._waiters = defaultdict(deque)
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self.sent = 0
+        self.replies = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.failures = 0
+        self.unmatched = 0
+        self.last_rtt_ms = 0.0
+        self.max_rtt_ms = 0.0
+        self.total_rtt_ms = 0.0
+
+    async def send(self, message):
+        await self.websocket.send(json.dumps(message, ensure_ascii=False))
+
+    async def request(self, cmd, timeout=DEFAULT_TIMEOUT, retries=None, **fields):
+        # Returns the reply dict. Raises DeviceCommandError when the device
+        # answers result=false and asyncio.TimeoutError once retries run out.
+        if retries is None:
+            retries = DEFAULT_RETRIES.get(cmd, 0)
+        attempt = 0
+        while True:
+            try:
+                reply = await self._request_once(cmd, timeout, fields)
+                break
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+        if reply.get("result") is False:
+            self.failures += 1
+            raise DeviceCommandError(f"{self.serial}: {cmd} failed (reason {reply.get('reason')})")
+        return reply
+
+    async def _request_once(self, cmd, timeout, fields):
+        async with self._in_flight:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[cmd].append(future)
+            started = time.perf_counter()
+            self.sent += 1
+            try:
+                await self.send(dict(cmd=cmd, **fields))
+            except Exception as e:
+                # Socket closed under us; nothing will answer this request
+                future.cancel()
+                raise ConnectionError(f"{self.serial} disconnected") from e
+            reply = await asyncio.wait_for(future, timeout)
+        rtt_ms = (time.perf_counter() - started) * 1000.0
+        self.replies += 1
+        self.last_rtt_ms = rtt_ms
+        self.max_rtt_ms = max(self.max_rtt_ms, rtt_ms)
+        self.total_rtt_ms += rtt_ms
+        return reply
+
+    def handle_reply(self, data):
+        waiters = self._waiters.get(data.get("ret"))
+        # Requests that timed out were cancelled and are skipped
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(data)
+                return True
+        self.unmatched += 1
+        return False
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "replies": self.replies,
+            "in_flight": sum(not f.done() for w in self._waiters.values() for f in w),
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "failures": self.failures,
+            "unmatched": self.unmatched,
+            "last_rtt_ms": self.last_rtt_ms,
+            "max_rtt_ms": self.max_rtt_ms,
+            "avg_rtt_ms": self.total_rtt_ms / self.replies if self.replies else 0.0,
+        }
+
+    # Protocol 2.7 commands
+
+    async def opendoor(self, doornum=1):
+        return await self.request("opendoor", doornum=doornum)
+
+    async def settime(self, when=None):
+        when = when or datetime.datetime.now()
+        return await self.request("settime", cloudtime=when.strftime("%Y-%m-%d %H:%M:%S"))
+
+    async def getdevinfo(self):
+        return await self.request("getdevinfo")
+
+    async def getuserinfo(self, enrollid, backupnum):
+        return await self.request("getuserinfo", enrollid=enrollid, backupnum=backupnum)
+
+    async def setuserinfo(self, enrollid, name, backupnum, record, admin=0):
+        return await self.request("setuserinfo", enrollid=enrollid, name=name, backupnum=backupnum,
+                                  admin=admin, record=record)
+
+    async def deleteuser(self, enrollid, backupnum):
+        return await self.request("deleteuser", enrollid=enrollid, backupnum=backupnum)
+
+    def close(self):
+        for waiters in self._waiters.values():
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError(f"{self.serial} disconnected"))
+
+async def request_pages(session, cmd, page_size, **fields):
+    # Yields the record lists of a paged command (getuserlist, getnewlog, ...).
+    # "count" is the page size on some firmware and the grand total on others.
+    stn = True
+    while True:
+        reply = await session.request(cmd, stn=stn, **fields)
+        records = reply.get("record") or []
+        if records:
+            yield records
+        total = reply.get("count") or 0
+        if not records:
+            return
+        if total > len(records):
+            if (reply.get("to") or 0) + 1 >= total:
+                return
+        elif len(records) < page_size:
+            return
+        stn = False
+        fields = {}
+
+class DeviceRegistry:
+    # Connected devices by serial. Sessions live on the WebSocket server's
+    # loop; other threads go through run_coroutine.
+    def __init__(self):
+        self.sessions = {}
+        self.loop = None
+        # Called on the loop with the session when a device registers
+        self.on_registered = []
+
+    def add(self, session):
+        self.sessions[session.serial] = session
+        if session.protocol:
+            for callback in self.on_registered:
+                callback(session)
+
+    def remove(self, session):
+        if self.sessions.get(session.serial) is session:
+            del self.sessions[session.serial]
+        session.close()
+
+    def get(self, serial):
+        return self.sessions.get(serial)
+
+    def dispatch_reply(self, data, session):
+        # A reply belongs to the session of the socket it arrived on; its
+        # "sn" is only used when that socket has not registered yet
+        data = normalize_message(data)
+        target = session if session is not None else self.sessions.get(data.get("sn"))
+        if target is None:
+            return False
+        return target.handle_reply(data)
+
+    def command(self, serial, name, *args, **kwargs):
+        # Thread-safe: runs session.<name>(...) on the server loop, e.g.
+        # devices.command("ZX0006827500", "opendoor", doornum=1).
+        # Returns a concurrent.futures.Future (None if the server is not running).
+        return self.run_coroutine(self._command(serial, name, args, kwargs))
+
+    async def _command(self, serial, name, args, kwargs):
+        session = self.sessions.get(serial)
+        if session is None or not session.protocol:
+            raise DeviceCommandError(f"{serial} is not connected")
+        return await getattr(session, name)(*args, **kwargs)
+
+    def protocol_sessions(self):
+        return [session for session in self.sessions.values() if session.protocol]
+
+    def run_coroutine(self, coro):
+        # Returns a concurrent.futures.Future, or None when the server is not running
+        if self.loop is None or self.loop.is_closed():
+            coro.close()
+            return None
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
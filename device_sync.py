@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import sqlite3
+import time
+
+from device_commands import DeviceCommandError, request_pages
+
+USER_LIST_PAGE_SIZE = 40
+CARD_BACKUPNUM = 11
+DELETE_ALL_BACKUPNUM = 13
+# Devices synced at the same time; a reconnect storm queues the rest
+MAX_PARALLEL_SYNCS = 4
+
+def user_content_hash(name, card):
+    # What the device stores for a user; a changed hash means a push is due
+    return hashlib.sha1(f"{name}\x1f{card}".encode("utf-8")).hexdigest()
+
+def init_device_users(conn):
+    # Last content pushed to each device, per enrollid (= users.id)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS device_users (
+            device_serial TEXT NOT NULL,
+            enrollid INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            synced_at INTEGER NOT NULL,
+            PRIMARY KEY (device_serial, enrollid)
+        ) WITHOUT ROWID
+    """)
+    conn.commit()
+
+class DeviceSync:
+    # Keeps the card users on every registered device in step with the users
+    # table. A full sync pulls the device's user list (getuserlist pages) and
+    # pushes only users whose content hash differs from what was last pushed;
+    # sync_users does the same for a few changed ids without listing the device.
+    # Pushes are pipelined, up to `window` in flight per device.
+    def __init__(self, devices, db_path, window=8, prune_unknown=False):
+        self.devices = devices
+        self.db_path = db_path
+        self.window = window
+        # Also delete device users that were never pushed from here (e.g.
+        # admins enrolled on the device itself); off by default
+        self.prune_unknown = prune_unknown
+        self._locks = {}
+        self._parallel = None
+        self.pushed = 0
+        self.deleted = 0
+        self.failed = 0
+        self.last_sync = {}
+        conn = sqlite3.connect(db_path)
+        try:
+            init_device_users(conn)
+        finally:
+            conn.close()
+        devices.on_registered.append(self._on_registered)
+
+    def _on_registered(self, session):
+        asyncio.ensure_future(self._sync_registered(session))
+
+    async def _sync_registered(self, session):
+        if self._parallel is None:
+            self._parallel = asyncio.Semaphore(MAX_PARALLEL_SYNCS)
+        try:
+            async with self._parallel:
+                if self.devices.get(session.serial) is not session:
+                    # Disconnected while waiting for its turn
+                    return
+                await self.sync_device(session)
+        except (asyncio.TimeoutError, ConnectionError, DeviceCommandError):
+            # Retried on the next registration or user change
+            self.failed += 1
+
+    def request_sync(self, user_ids=None):
+        # Thread-safe; None re-diffs every device in full
+        coro = self.sync_all() if user_ids is None else self.sync_users(user_ids)
+        return self.devices.run_coroutine(coro)
+
+    def stats(self):
+        return {
+            "pushed": self.pushed,
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "last_sync": dict(self.last_sync),
+        }
+
+    async def sync_all(self):
+        await asyncio.gather(*(self._sync_registered(s) for s in self.devices.protocol_sessions()))
+
+    async def sync_device(self, session):
+        lock = self._locks.setdefault(session.serial, asyncio.Lock())
+        async with lock:
+            on_device = {}
+            async for records in request_pages(session, "getuserlist", USER_LIST_PAGE_SIZE):
+                for record in records:
+                    on_device.setdefault(record.get("enrollid"), set()).add(record.get("backupnum"))
+            loop = asyncio.get_running_loop()
+            local, known = await loop.run_in_executor(None, self._load, session.serial, None)
+            upserts = [user for user_id, user in local.items()
+                       if CARD_BACKUPNUM not in on_device.get(user_id, ()) or known.get(user_id) != user[3]]
+            deletes = [enrollid for enrollid in known if enrollid not in local]
+            if self.prune_unknown:
+                deletes += [enrollid for enrollid in on_device
+                            if enrollid not in local and enrollid not in known]
+            await self._apply(session, upserts, deletes)
+            self.last_sync[session.serial] = time.time()
+
+    async def sync_users(self, user_ids):
+        user_ids = [int(user_id) for user_id in user_ids]
+        loop = asyncio.get_running_loop()
+
+        async def sync_one(session):
+            async with self._locks.setdefault(session.serial, asyncio.Lock()):
+                local, known = await loop.run_in_executor(None, self._load, session.serial, user_ids)
+                upserts = [user for user_id, user in local.items() if known.get(user_id) != user[3]]
+                deletes = [user_id for user_id in user_ids if user_id not in local and user_id in known]
+                await self._apply(session, upserts, deletes)
+
+        await asyncio.gather(*(sync_one(s) for s in self.devices.protocol_sessions()), return_exceptions=True)
+
+    async def _apply(self, session, upserts, deletes):
+        if not upserts and not deletes:
+            return
+        # `window` workers share one job list, rather than one task per user
+        # parked on a semaphore, which floods the loop on a first sync
+        jobs = iter([(True, user) for user in upserts] + [(False, enrollid) for enrollid in deletes])
+        pushed_ok = []
+        deleted_ok = []
+
+        async def worker():
+            for push, job in jobs:
+                try:
+                    if push:
+                        user_id, name, card, content_hash = job
+                        await session.setuserinfo(user_id, name, CARD_BACKUPNUM, int(card))
+                        pushed_ok.append((user_id, content_hash))
+                    else:
+                        await session.deleteuser(job, DELETE_ALL_BACKUPNUM)
+                        deleted_ok.append(job)
+                except Exception:
+                    self.failed += 1
+
+        await asyncio.gather(*(worker() for _ in range(min(self.window, len(upserts) + len(deletes)))))
+        self.pushed += len(pushed_ok)
+        self.deleted += len(deleted_ok)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._record, session.serial, pushed_ok, deleted_ok)
+
+    def _load(self, serial, user_ids):
+        # Runs on the executor: local users as id -> (id, name, card, hash), and
+        # the hashes last pushed to this device as enrollid -> hash
+        conn = sqlite3.connect(self.db_path)
+        try:
+            query = "SELECT id, name, card_number FROM users"
+            known_query = "SELECT enrollid, content_hash FROM device_users WHERE device_serial=?"
+            params = ()
+            if user_ids is not None:
+                placeholders = ", ".join("?" * len(user_ids))
+                query += " WHERE id IN (" + placeholders + ")"
+                known_query += " AND enrollid IN (" + placeholders + ")"
+                params = tuple(user_ids)
+            local = {
+                user_id: (user_id, name, card, user_content_hash(name, card))
+                for user_id, name, card in conn.execute(query, params)
+            }
+            known = dict(conn.execute(known_query, (serial,) + params))
+        finally:
+            conn.close()
+        return local, known
+
+    def _record(self, serial, pushed, deleted):
+        now = int(time.time())
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO device_users (device_serial, enrollid, content_hash, synced_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    [(serial, user_id, content_hash, now) for user_id, content_hash in pushed])
+                conn.executemany("DELETE FROM device_users WHERE device_serial=? AND enrollid=?",
+                                 [(serial, enrollid) for enrollid in deleted])
+        finally:
+            conn.close()
@@ -0,0 +1,259 @@
+import asyncio
+import datetime
+import json
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jdatetime
+
+from fair_queue import FairQueue
+from metrics import METRICS
+
+# How often a worker retries while the LogWriter's queue is full
+LOG_BACKPRESSURE_S = 0.05
+
+def get_datetimes(lang, dt=None):
+    now = dt if dt else datetime.datetime.now()
+    if lang == "fa":
+        jnow = jdatetime.datetime.fromgregorian(datetime=now)
+        date_str = jnow.strftime("%Y/%m/%d")
+        time_str = now.strftime("%H:%M:%S")
+    else:
+        date_str = now.strftime("%Y-%m-%d")
+        time_str = now.strftime("%H:%M:%S")
+    return date_str, time_str
+
+def get_datetimes_bulk(lang, timestamps):
+    # Same output as get_datetimes for many epoch timestamps, converting each
+    # calendar day (the expensive Jalali part) only once.
+    day_cache = {}
+    result = []
+    for ts in timestamps:
+        if ts is None:
+            result.append(("", ""))
+            continue
+        dt = datetime.datetime.fromtimestamp(ts)
+        day = dt.date()
+        date_str = day_cache.get(day)
+        if date_str is None:
+            date_str = get_datetimes(lang, dt)[0]
+            day_cache[day] = date_str
+        result.append((date_str, dt.strftime("%H:%M:%S")))
+    return result
+
+def event_timestamp(value, received_at=None):
+    # Devices send numbers or numeric strings ("1700000000", "1700000000.5");
+    # a missing or unusable one falls back to when the event arrived
+    try:
+        timestamp = float(value)
+        datetime.datetime.fromtimestamp(timestamp)
+    except (TypeError, ValueError, OverflowError, OSError):
+        timestamp = 0
+    if not timestamp:
+        return int(received_at or time.time())
+    return int(timestamp) if timestamp.is_integer() else timestamp
+
+def direction_label(lang, direction):
+    if lang == "fa":
+        return "ورود" if direction.lower() == "in" else "خروج"
+    return "In" if direction.lower() == "in" else "Out"
+
+class EventPipeline:
+    # decode -> enrich -> snapshot -> persist, run on the WebSocket server's
+    # asyncio loop. DB misses go to a small thread pool and JPEG encoding to
+    # the SnapshotEncoder; the GUI only gets the finished display record
+    # through on_record. Each device has its own bounded queue and workers
+    # serve the devices round-robin; a full queue makes that device's
+    # ws_handler wait, which stops reading from its socket only.
+    def __init__(self, log_writer, user_cache, snapshots=None, encoder=None, workers=4, max_pending=200):
+        self.log_writer = log_writer
+        self.user_cache = user_cache
+        self.snapshots = snapshots
+        self.encoder = encoder
+        self.workers = workers
+        # Per device
+        self.max_pending = max_pending
+        self.language = "en"
+        self.on_record = None
+        self.queue = None
+        self._tasks = []
+        self._executor = None
+        self.received = 0
+        self.processed = 0
+        self.errors = 0
+        # Failures that still got the event persisted, just without a user or photo
+        self.enrich_errors = 0
+        self.snapshot_errors = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    async def start(self, on_record):
+        self.on_record = on_record
+        self.queue = FairQueue(self.max_pending)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="ingest")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        if self.queue is not None:
+            await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def submit(self, data, device_serial=""):
+        self.received += 1
+        await self.queue.put(device_serial or "", (data, time.perf_counter(), time.time()))
+
+    def device_disconnected(self, device_serial):
+        if self.queue is not None:
+            self.queue.discard(device_serial or "")
+
+    def decode(self, message):
+        try:
+            data = json.loads(message)
+        except Exception:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def encode(self, data):
+        return json.dumps(data, ensure_ascii=False)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "received": self.received,
+            "processed": self.processed,
+            "errors": self.errors,
+            "enrich_errors": self.enrich_errors,
+            "snapshot_errors": self.snapshot_errors,
+            "avg_latency_ms": self.total_latency_ms / self.processed if self.processed else 0.0,
+            "max_latency_ms": self.max_latency_ms,
+            "devices": self.queue.stats() if self.queue is not None else {},
+        }
+
+    async def _worker(self):
+        while True:
+            device_serial, (data, queued_at, received_at), lag = await self.queue.get()
+            METRICS.observe("queue_wait", lag * 1000.0)
+            try:
+                record = await self.process(data, received_at)
+            except Exception:
+                self.errors += 1
+            else:
+                latency_ms = METRICS.since("event_total", queued_at)
+                self.processed += 1
+                self.total_latency_ms += latency_ms
+                self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+                if self.on_record:
+                    # For the GUI side to time how long the record waited for it
+                    record["ready_at"] = time.perf_counter()
+                    self.on_record(record)
+            finally:
+                self.queue.task_done(device_serial, lag)
+
+    def _snapshot_written(self, future, ts, photo_path):
+        # Runs on an encoder thread (or right away if the encode already
+        # finished); the encoder counts the failure itself
+        if future.cancelled() or future.exception() is not None:
+            try:
+                self.log_writer.clear_photo(ts, photo_path)
+            except queue.Full:
+                pass
+
+    async def process(self, data, received_at=None):
+        loop = asyncio.get_running_loop()
+        lang = self.language
+        timestamp = event_timestamp(data.get("timestamp"), received_at)
+        dt = datetime.datetime.fromtimestamp(timestamp)
+        date, time_str = get_datetimes(lang, dt)
+        user_name = data.get("user_name", "")
+        user_id = data.get("user_id", data.get("card_number", ""))
+        direction = data.get("direction", "in")
+        direction_text = direction_label(lang, direction)
+        unit = data.get("unit_number", "")
+        plate = data.get("plate_number", "")
+        permission = data.get("permission", "")
+        device_serial = data.get("device_serial", "")
+
+        # Enrich: cache hits are served on the loop, only misses read SQLite
+        # in the executor
+        started = time.perf_counter()
+        card_number = data.get("card_number", "")
+        try:
+            found, user = self.user_cache.peek(card_number)
+            if not found:
+                user = await loop.run_in_executor(self._executor, self.user_cache.get, card_number)
+        except Exception:
+            self.enrich_errors += 1
+            user = None
+        METRICS.since("user_lookup", started)
+        if user:
+            user_name = user["name"]
+            if not user_id: user_id = user["id"]
+            if not unit: unit = user["unit_number"]
+            if not plate: plate = user["plate_number"]
+            # The users table decides access, not the permission a device reports
+            permission = user["permission"]
+
+        # Snapshot: the frame closest to the device's timestamp, not the current one
+        # A failed capture or encode loses the photo, never the log row
+        started = time.perf_counter()
+        photo_path = ""
+        thumb_path = ""
+        encoded = None
+        skew_ms = None
+        try:
+            snapshot = await self.snapshots.capture(direction, timestamp) if self.snapshots else None
+            if snapshot is not None and self.encoder is not None:
+                skew_ms = snapshot.skew_ms
+                photo_path, thumb_path, encoded = self.encoder.submit(snapshot, direction, timestamp, device_serial)
+        except Exception:
+            self.snapshot_errors += 1
+            photo_path = ""
+            thumb_path = ""
+            encoded = None
+            skew_ms = None
+        METRICS.since("snapshot_capture", started)
+
+        # Persist. The writer's queue is a thread queue, so never block the
+        # loop on it: when it is full this worker sleeps and retries, which
+        # backs up this device's queue and, through it, its socket.
+        started = time.perf_counter()
+        row = (date, time_str, user_name, user_id, direction_text, unit, plate, permission, device_serial,
+               photo_path, json.dumps(data, ensure_ascii=False), skew_ms, thumb_path, int(timestamp),
+               data.get("log_key"), data.get("decision"), data.get("decision_us"))
+        while True:
+            try:
+                self.log_writer.insert_log(*row, block=False)
+                break
+            except queue.Full:
+                await asyncio.sleep(LOG_BACKPRESSURE_S)
+        METRICS.since("log_enqueue", started)
+        if encoded is not None:
+            # Added after the row is queued, so the fix-up is queued behind it
+            encoded.add_done_callback(lambda future: self._snapshot_written(future, int(timestamp), photo_path))
+
+        return {
+            "timestamp": timestamp,
+            "date": date,
+            "time": time_str,
+            "user_name": user_name,
+            "user_id": str(user_id),
+            "direction": direction.lower(),
+            "direction_text": direction_text,
+            "unit": unit,
+            "plate": plate,
+            "permission": permission,
+            "device_serial": device_serial,
+            "decision": data.get("decision"),
+            "photo_path": photo_path,
+            "thumb_path": thumb_path,
+            "snapshot_skew_ms": skew_ms,
+            # concurrent.futures.Future resolving to an EncodedSnapshot, or None
+            "snapshot": encoded,
+        }
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from collections import deque
+
+RATE_WINDOW = 5.0
+
+class DeviceQueueStats:
+    __slots__ = ("received", "processed", "max_depth", "last_lag_ms", "max_lag_ms", "total_lag_ms",
+                 "rate", "_window_start", "_window_count")
+
+    def __init__(self):
+        self.received = 0
+        self.processed = 0
+        self.max_depth = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.total_lag_ms = 0.0
+        # Events per second processed over the last RATE_WINDOW seconds
+        self.rate = 0.0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def done(self, lag_ms):
+        self.processed += 1
+        self.last_lag_ms = lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        self.total_lag_ms += lag_ms
+        self._window_count += 1
+        now = time.monotonic()
+        if now - self._window_start >= RATE_WINDOW:
+            self._roll(now)
+
+    def current_rate(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= RATE_WINDOW:
+            # Idle since the last event: close the stale window
+            self._roll(now)
+        elif not self.rate and elapsed > 0:
+            # First window still filling
+            return self._window_count / elapsed
+        return self.rate
+
+    def _roll(self, now):
+        self.rate = self._window_count / (now - self._window_start)
+        self._window_start = now
+        self._window_count = 0
+
+class FairQueue:
+    # One bounded FIFO per device, served round-robin: get() takes one item
+    # from the device at the head of the ready ring and puts that device at
+    # the back if it still has items. A device that floods only fills its
+    # own queue, and put() then makes its ws_handler wait while the other
+    # devices keep being served.
+    def __init__(self, max_per_key=200):
+        self.max_per_key = max_per_key
+        self._queues = {}
+        # Keys whose queue is non-empty, in service order
+        self._ready = deque()
+        self._items = asyncio.Semaphore(0)
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self._stats = {}
+
+    async def put(self, key, item):
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue(self.max_per_key)
+            self._stats.setdefault(key, DeviceQueueStats())
+        await queue.put((time.perf_counter(), item))
+        # No await since the put: size 1 means the queue was empty before it
+        if queue.qsize() == 1:
+            self._ready.append(key)
+        stats = self._stats[key]
+        stats.received += 1
+        stats.max_depth = max(stats.max_depth, queue.qsize())
+        self._unfinished += 1
+        self._finished.clear()
+        self._items.release()
+
+    async def get(self):
+        # Returns (key, item, seconds the item waited in the queue)
+        await self._items.acquire()
+        key = self._ready.popleft()
+        queue = self._queues[key]
+        queued_at, item = queue.get_nowait()
+        if queue.qsize():
+            self._ready.append(key)
+        return key, item, time.perf_counter() - queued_at
+
+    def task_done(self, key, lag):
+        self._stats[key].done(lag * 1000.0)
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+    def discard(self, key):
+        # Drops a disconnected device's queue once it has drained; its
+        # counters are kept for stats()
+        queue = self._queues.get(key)
+        if queue is not None and queue.empty():
+            del self._queues[key]
+
+    def qsize(self):
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    def stats(self):
+        result = {}
+        for key, stats in self._stats.items():
+            queue = self._queues.get(key)
+            result[key] = {
+                "depth": queue.qsize() if queue is not None else 0,
+                "max_depth": stats.max_depth,
+                "received": stats.received,
+                "processed": stats.processed,
+                "events_per_s": stats.current_rate(),
+                "last_lag_ms": stats.last_lag_ms,
+                "max_lag_ms": stats.max_lag_ms,
+                "avg_lag_ms": stats.total_lag_ms / stats.processed if stats.processed else 0.0,
+            }
+        return result
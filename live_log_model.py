@@ -0,0 +1,137 @@
+from PyQt5 import QtCore, QtGui
+
+class LiveLogRecord:
+    __slots__ = ("date", "time", "user_name", "user_id", "direction", "unit", "plate", "permission")
+
+    def __init__(self, date, time, user_name, user_id, direction, unit, plate, permission):
+        self.date = date
+        self.time = time
+        self.user_name = user_name
+        self.user_id = user_id
+        self.direction = direction
+        self.unit = unit
+        self.plate = plate
+        self.permission = permission
+
+    @classmethod
+    def from_display_record(cls, record):
+        return cls(
+            record["date"], record["time"], record["user_name"] or "", str(record["user_id"]),
+            record["direction"], record["unit"] or "", record["plate"] or "", record["permission"] or ""
+        )
+
+    def value(self, column):
+        return (self.date, self.time, self.user_name, self.user_id, None,
+                self.unit, self.plate, self.permission)[column]
+
+class LiveLogModel(QtCore.QAbstractTableModel):
+    # Newest record is row 0. Records live in a fixed-size ring so appending is
+    # O(1) and memory stays bounded; once max_rows is reached the oldest row is
+    # dropped. Row numbers are derived from the running total instead of being
+    # stored per row.
+    DIRECTION_COLUMN = 4
+    PERMISSION_COLUMN = 7
+    COLUMN_COUNT = 8
+
+    def __init__(self, headers, max_rows=5000, parent=None):
+        super().__init__(parent)
+        self.headers = list(headers)
+        self.max_rows = max_rows
+        self._ring = [None] * max_rows
+        self._head = 0
+        self._count = 0
+        self._total = 0
+        self._header_alignment = QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter
+
+        self._font = QtGui.QFont("Tahoma")
+        self._bold_font = QtGui.QFont("Tahoma")
+        self._bold_font.setBold(True)
+        self._arrow_font = QtGui.QFont("Tahoma")
+        self._arrow_font.setPointSize(14)
+        self._arrow_font.setBold(True)
+        self._header_font = QtGui.QFont()
+        self._header_font.setBold(True)
+        self._brushes = {
+            "in": QtGui.QBrush(QtGui.QColor("green")),
+            "out": QtGui.QBrush(QtGui.QColor("blue")),
+            "open": QtGui.QBrush(QtGui.QColor("green")),
+            "limited": QtGui.QBrush(QtGui.QColor("blue")),
+            "restricted": QtGui.QBrush(QtGui.QColor("red")),
+        }
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self._count
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self.COLUMN_COUNT
+
+    def record(self, row):
+        return self._ring[(self._head - 1 - row) % self.max_rows]
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.record(index.row())
+        column = index.column()
+        if role == QtCore.Qt.DisplayRole:
+            if column == self.DIRECTION_COLUMN:
+                return "→" if record.direction == "in" else "←"
+            return record.value(column)
+        if role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.Qt.AlignCenter
+        if role == QtCore.Qt.FontRole:
+            if column == self.DIRECTION_COLUMN:
+                return self._arrow_font
+            if column == self.PERMISSION_COLUMN:
+                return self._bold_font
+            return self._font
+        if role == QtCore.Qt.ForegroundRole:
+            if column == self.DIRECTION_COLUMN:
+                return self._brushes["in" if record.direction == "in" else "out"]
+            if column == self.PERMISSION_COLUMN:
+                return self._brushes.get(record.permission.lower())
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal:
+            if role == QtCore.Qt.DisplayRole and section < len(self.headers):
+                return self.headers[section]
+            if role == QtCore.Qt.FontRole:
+                return self._header_font
+            if role == QtCore.Qt.TextAlignmentRole:
+                return self._header_alignment
+            return None
+        # The oldest log ever received gets No. 1
+        if role == QtCore.Qt.DisplayRole:
+            return str(self._total - section)
+        if role == QtCore.Qt.FontRole:
+            return self._bold_font
+        if role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.Qt.AlignCenter
+        return None
+
+    def set_headers(self, headers, alignment):
+        self.headers = list(headers)
+        self._header_alignment = alignment | QtCore.Qt.AlignVCenter
+        self.headerDataChanged.emit(QtCore.Qt.Horizontal, 0, self.COLUMN_COUNT - 1)
+
+    def add_records(self, records):
+        # records are in arrival order; the last one ends up on row 0. Rows
+        # that would scroll off at once are not shown but still counted.
+        received = len(records)
+        records = records[-self.max_rows:]
+        if not records:
+            return
+        overflow = self._count + len(records) - self.max_rows
+        if overflow > 0:
+            self.beginRemoveRows(QtCore.QModelIndex(), self._count - overflow, self._count - 1)
+            self._count -= overflow
+            self.endRemoveRows()
+        self.beginInsertRows(QtCore.QModelIndex(), 0, len(records) - 1)
+        for record in records:
+            self._ring[self._head] = record
+            self._head = (self._head + 1) % self.max_rows
+        self._count += len(records)
+        self._total += received
+        self.endInsertRows()
+        self.headerDataChanged.emit(QtCore.Qt.Vertical, 0, self._count - 1)
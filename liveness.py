@@ -0,0 +1,155 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+IDLE_PING_AFTER = 10.0
+STALE_AFTER = 30.0
+
+class _Connection:
+    __slots__ = ("serial", "websocket", "last_seen", "pinging")
+
+    def __init__(self, serial, websocket, now):
+        self.serial = serial
+        self.websocket = websocket
+        self.last_seen = now
+        self.pinging = False
+
+class DeviceHistory:
+    __slots__ = ("first_seen", "connects", "stale", "online_since", "uptime", "last_seen")
+
+    def __init__(self, now):
+        self.first_seen = now
+        self.connects = 0
+        self.stale = 0
+        self.online_since = None
+        # Seconds online over all closed connections
+        self.uptime = 0.0
+        self.last_seen = None
+
+class LivenessMonitor:
+    # Tracks when each device connection last sent anything. Connections sit
+    # in a heap ordered by their next check time, with one entry each, so a
+    # message only stores a timestamp and the monitor wakes once per due
+    # check instead of scanning every device. A connection idle for
+    # idle_ping seconds is pinged; one silent for stale_after seconds (no
+    # traffic and no pong) is aborted, which runs the normal disconnect path.
+    def __init__(self, idle_ping=IDLE_PING_AFTER, stale_after=STALE_AFTER):
+        self.idle_ping = idle_ping
+        self.stale_after = stale_after
+        self._connections = {}
+        self._heap = []
+        self._order = itertools.count()
+        self._changed = None
+        # Guards _connections and history, which stats() reads from other threads
+        self._lock = threading.Lock()
+        self.history = {}
+        self.pings = 0
+        self.stale = 0
+
+    def connected(self, serial, websocket):
+        now = time.monotonic()
+        connection = _Connection(serial, websocket, now)
+        with self._lock:
+            self._connections[websocket] = connection
+            history = self.history.get(serial)
+            if history is None:
+                history = self.history[serial] = DeviceHistory(time.time())
+            history.connects += 1
+            if history.online_since is None:
+                history.online_since = time.time()
+        self._push(now + self.idle_ping, connection)
+
+    def seen(self, websocket):
+        connection = self._connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+
+    def disconnected(self, websocket):
+        with self._lock:
+            connection = self._connections.pop(websocket, None)
+            if connection is None:
+                return
+            history = self.history[connection.serial]
+            history.last_seen = time.time() - (time.monotonic() - connection.last_seen)
+            # Still online if another connection from the same device is open
+            if history.online_since is not None and not any(
+                    c.serial == connection.serial for c in self._connections.values()):
+                history.uptime += time.time() - history.online_since
+                history.online_since = None
+
+    async def run(self):
+        self._changed = asyncio.Event()
+        while True:
+            delay = self._heap[0][0] - time.monotonic() if self._heap else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._changed.clear()
+                continue
+            _, _, connection = heapq.heappop(self._heap)
+            if self._connections.get(connection.websocket) is connection:
+                self._check(connection, time.monotonic())
+
+    def _check(self, connection, now):
+        idle = now - connection.last_seen
+        if idle >= self.stale_after:
+            self.stale += 1
+            with self._lock:
+                self.history[connection.serial].stale += 1
+            self.disconnected(connection.websocket)
+            # Half-open TCP would never finish a closing handshake
+            connection.websocket.transport.abort()
+        elif idle >= self.idle_ping:
+            if not connection.pinging:
+                asyncio.ensure_future(self._ping(connection))
+            self._push(connection.last_seen + self.stale_after, connection)
+        else:
+            self._push(connection.last_seen + self.idle_ping, connection)
+
+    async def _ping(self, connection):
+        connection.pinging = True
+        self.pings += 1
+        try:
+            pong = await connection.websocket.ping()
+            await asyncio.wait_for(pong, self.stale_after)
+        except Exception:
+            # Closed or timed out; the stale check handles it
+            return
+        finally:
+            connection.pinging = False
+        connection.last_seen = time.monotonic()
+
+    def _push(self, when, connection):
+        heapq.heappush(self._heap, (when, next(self._order), connection))
+        if self._changed is not None and self._heap[0][2] is connection:
+            self._changed.set()
+
+    def stats(self):
+        # Safe to call from any thread; returns copies
+        with self._lock:
+            return self._stats()
+
+    def _stats(self):
+        now = time.time()
+        devices = {}
+        for serial, history in self.history.items():
+            uptime = history.uptime
+            if history.online_since is not None:
+                uptime += now - history.online_since
+            devices[serial] = {
+                "online": history.online_since is not None,
+                "connects": history.connects,
+                "reconnects": max(0, history.connects - 1),
+                "stale": history.stale,
+                "uptime_s": uptime,
+                "availability": uptime / (now - history.first_seen) if now > history.first_seen else 1.0,
+                "last_seen": history.last_seen,
+            }
+        for connection in self._connections.values():
+            devices[connection.serial]["last_seen"] = now - (time.monotonic() - connection.last_seen)
+        return {"connections": len(self._connections), "pings": self.pings, "stale": self.stale,
+                "devices": devices}
@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sqlite3
+import sys
+import time
+
+import websockets
+
+from device_simulator import build_event_json, build_sendlog_json
+from user_management import DB_PATH
+
+# The n-th user in draw order swipes with weight 1 / n ** ZIPF_S
+ZIPF_S = 0.8
+# Seconds to wait for outstanding replies before a device disconnects
+ACK_DRAIN_TIMEOUT = 1.0
+USER_LIST_PAGE_SIZE = 40
+
+def load_population(db_path, limit=50000):
+    # (enrollid, card_number) of enrolled users in random order, so the
+    # busiest users are a random subset
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT id, card_number FROM users ORDER BY random() LIMIT ?", (limit,)).fetchall()
+    finally:
+        conn.close()
+
+class CardPicker:
+    # Draws users with a Zipf-like skew (a few badge many times a day, most
+    # once or twice) plus a share of cards that are not enrolled at all
+    def __init__(self, population, unknown_ratio=0.02):
+        self.population = population or [(0, "0")]
+        self.unknown_ratio = unknown_ratio if population else 1.0
+        self.cum_weights = list(itertools.accumulate(1.0 / (rank + 1) ** ZIPF_S for rank in range(len(self.population))))
+
+    def pick(self):
+        if random.random() < self.unknown_ratio:
+            return 900000 + random.randint(0, 99999), str(random.randint(10 ** 9, 10 ** 10 - 1))
+        return random.choices(self.population, cum_weights=self.cum_weights)[0]
+
+class LoadProfile:
+    # Events per second for one device at a given second of the run: a base
+    # rate, multiplied by burst_factor for burst_seconds once every burst_every
+    # seconds (a shift change at the gates)
+    def __init__(self, rate, burst_factor=1.0, burst_seconds=0.0, burst_every=0.0):
+        self.rate = rate
+        self.burst_factor = burst_factor
+        self.burst_seconds = burst_seconds
+        self.burst_every = burst_every
+
+    def rate_at(self, elapsed):
+        if self.burst_every and elapsed % self.burst_every < self.burst_seconds:
+            return self.rate * self.burst_factor
+        return self.rate
+
+class LoadStats:
+    def __init__(self):
+        self.sent = 0
+        self.acked = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.disconnects = 0
+        self.ack_latencies_ms = []
+        self.connect_latencies_ms = []
+
+    def report(self, elapsed, devices, acknowledged=True):
+        def percentiles(samples):
+            samples = sorted(samples)
+            if not samples:
+                return {}
+            result = {f"p{p}": samples[min(len(samples) - 1, len(samples) * p // 100)] for p in (50, 90, 99)}
+            result["max"] = samples[-1]
+            return result
+        return {
+            "devices": devices,
+            "seconds": elapsed,
+            "sent": self.sent,
+            "send_rate": self.sent / elapsed if elapsed else 0.0,
+            "acked": self.acked,
+            # access_event messages are never answered
+            "unacked": self.sent - self.acked if acknowledged else 0,
+            "ack_latency_ms": percentiles(self.ack_latencies_ms),
+            "connects": self.connects,
+            "connect_failures": self.connect_failures,
+            "disconnects": self.disconnects,
+            "connect_latency_ms": percentiles(self.connect_latencies_ms),
+        }
+
+class SimulatedDevice:
+    # One controller: registers, sends punches at the profile's rate with
+    # exponential gaps, and in sendlog mode times the server's reply to each
+    def __init__(self, serial, url, picker, profile, stats, mode="sendlog", stamp=False):
+        self.serial = serial
+        self.url = url
+        self.picker = picker
+        self.profile = profile
+        self.stats = stats
+        self.mode = mode
+        # Adds the wall-clock send time to each event ("sent_at"), which the
+        # server keeps in raw_data; used to measure event-to-disk latency
+        self.stamp = stamp
+        self.logindex = 0
+        self._pending = {}
+        self._reconnect = asyncio.Event()
+        self._until = 0.0
+        # Users the server pushed, kept across reconnects like a real terminal
+        self.users = set()
+        self._list_position = 0
+
+    def reconnect(self):
+        self._reconnect.set()
+
+    async def run(self, started, until):
+        self._until = until
+        while time.monotonic() < until:
+            connect_started = time.perf_counter()
+            ws = None
+            try:
+                ws = await websockets.connect(self.url, ping_interval=None, open_timeout=10)
+                if self.mode == "sendlog":
+                    await ws.send(json.dumps({"cmd": "reg", "sn": self.serial, "devinfo": {"modelname": "loadgen"}}))
+                    await asyncio.wait_for(ws.recv(), 10)
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException):
+                self.stats.connect_failures += 1
+                if ws is not None:
+                    await ws.close()
+                await asyncio.sleep(random.uniform(0.1, 1.0))
+                continue
+            self.stats.connects += 1
+            self.stats.connect_latencies_ms.append((time.perf_counter() - connect_started) * 1000.0)
+            self._reconnect.clear()
+            reader = asyncio.ensure_future(self._read(ws))
+            try:
+                await self._send(ws, started, until)
+                if self._pending and not self._reconnect.is_set():
+                    await asyncio.wait([reader], timeout=ACK_DRAIN_TIMEOUT)
+            except websockets.exceptions.ConnectionClosed:
+                pass
+            finally:
+                reader.cancel()
+                self._pending.clear()
+                self.stats.disconnects += 1
+                await ws.close()
+
+    async def _send(self, ws, started, until):
+        next_at = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now >= until or self._reconnect.is_set():
+                return
+            rate = self.profile.rate_at(now - started)
+            next_at = max(next_at, now - 1.0) + random.expovariate(rate) if rate > 0 else now + 1.0
+            delay = next_at - now
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._reconnect.wait(), delay)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+            enrollid, card = self.picker.pick()
+            extra = {"sent_at": time.time()} if self.stamp else None
+            if self.mode == "sendlog":
+                self.logindex += 1
+                message = build_sendlog_json(self.serial, enrollid, self.logindex, extra=extra)
+                self._pending[self.logindex] = time.perf_counter()
+            else:
+                message = build_event_json(self.serial, "1", card, extra=extra)
+            await ws.send(message)
+            self.stats.sent += 1
+
+    async def _read(self, ws):
+        async for message in ws:
+            try:
+                data = json.loads(message)
+            except ValueError:
+                continue
+            cmd = data.get("cmd")
+            if cmd:
+                await ws.send(json.dumps(self._answer(cmd, data)))
+            elif str(data.get("ret", "")).strip() == "sendlog":
+                sent_at = self._pending.pop(data.get("logindex"), None)
+                if sent_at is not None:
+                    self.stats.acked += 1
+                    self.stats.ack_latencies_ms.append((time.perf_counter() - sent_at) * 1000.0)
+                    if not self._pending and time.monotonic() >= self._until:
+                        return
+
+    def _answer(self, cmd, data):
+        # Server commands (user sync, log catch-up): keeps pushed users and
+        # lists them back in pages of 40; the device holds no stored logs
+        reply = {"ret": cmd, "sn": self.serial, "result": True}
+        if cmd == "setuserinfo":
+            self.users.add(data.get("enrollid"))
+        elif cmd == "deleteuser":
+            self.users.discard(data.get("enrollid"))
+        elif cmd == "getuserlist":
+            if data.get("stn"):
+                self._list_position = 0
+            ids = sorted(self.users)[self._list_position:self._list_position + USER_LIST_PAGE_SIZE]
+            reply.update(count=len(self.users), to=self._list_position + len(ids) - 1,
+                         record=[{"enrollid": enrollid, "admin": 0, "backupnum": 11} for enrollid in ids])
+            reply["from"] = self._list_position
+            self._list_position += len(ids)
+        elif cmd in ("getnewlog", "getalllog"):
+            reply.update(count=0, record=[])
+        return reply
+
+async def run_load(url, devices, duration, profile, picker, mode="sendlog", storm_every=0.0, ramp=1.0,
+                   stamp=False):
+    stats = LoadStats()
+    started = time.monotonic()
+    until = started + duration
+    sims = [SimulatedDevice(f"LG{index:05d}", url, picker, profile, stats, mode, stamp) for index in range(devices)]
+
+    async def start(sim, index):
+        # Spread the initial connects over `ramp` seconds
+        await asyncio.sleep(ramp * index / max(1, devices))
+        await sim.run(started, until)
+
+    async def storms():
+        # Every storm_every seconds all devices drop and reconnect at once
+        while storm_every and time.monotonic() + storm_every < until:
+            await asyncio.sleep(storm_every)
+            for sim in sims:
+                sim.reconnect()
+
+    storm = asyncio.ensure_future(storms())
+    await asyncio.gather(*(start(sim, index) for index, sim in enumerate(sims)))
+    storm.cancel()
+    return stats.report(time.monotonic() - started, devices, mode == "sendlog")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless load generator for the access control server.")
+    parser.add_argument("--url", default="ws://127.0.0.1:8765")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=0.5, help="events per second per device")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--mode", choices=("sendlog", "event"), default="sendlog",
+                        help="protocol sendlog (acknowledged by the server) or simulator access_event")
+    parser.add_argument("--burst-factor", type=float, default=1.0)
+    parser.add_argument("--burst-seconds", type=float, default=0.0)
+    parser.add_argument("--burst-every", type=float, default=0.0)
+    parser.add_argument("--storm-every", type=float, default=0.0, help="reconnect all devices every N seconds")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which devices first connect")
+    parser.add_argument("--db", default=DB_PATH, help="users database the cards are drawn from")
+    parser.add_argument("--unknown-ratio", type=float, default=0.02)
+    parser.add_argument("--stamp", action="store_true", help="add the send time to each event (sent_at)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    picker = CardPicker(load_population(args.db), args.unknown_ratio)
+    profile = LoadProfile(args.rate, args.burst_factor, args.burst_seconds, args.burst_every)
+    report = asyncio.run(run_load(args.url, args.devices, args.duration, profile, picker, args.mode,
+                                  args.storm_every, args.ramp, args.stamp))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['devices']} devices, {report['seconds']:.1f} s: sent {report['sent']} "
+          f"({report['send_rate']:.1f}/s), acked {report['acked']}")
+    print(f"connects {report['connects']}, failures {report['connect_failures']}, "
+          f"disconnects {report['disconnects']}")
+    for name in ("ack_latency_ms", "connect_latency_ms"):
+        if report[name]:
+            print(name + ": " + ", ".join(f"{key} {value:.2f}" for key, value in report[name].items()))
+
+if __name__ == "__main__":
+    # e.g. python load_generator.py --devices 200 --rate 0.2 --burst-factor 10 --burst-seconds 120 --burst-every 600
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import asyncio
+import datetime
+import json
+import sqlite3
+import time
+
+from device_commands import DeviceCommandError, request_pages
+from event_pipeline import direction_label, get_datetimes_bulk
+
+LOG_PAGE_SIZE = 50
+# Pages are collected into transactions of about this many rows
+BACKLOG_BATCH_ROWS = 2000
+
+def init_device_log_sync(conn):
+    # Per-device catch-up cursor. complete=0 means the last run was cut off
+    # and the next one resumes with getalllog from last_ts instead of getnewlog.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS device_log_sync (
+            device_serial TEXT PRIMARY KEY,
+            last_ts INTEGER,
+            last_sync INTEGER,
+            complete INTEGER NOT NULL DEFAULT 1,
+            fetched INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.commit()
+
+def device_log_key(record):
+    # Device records have no id of their own; these fields identify one punch
+    return "{}|{}|{}|{}|{}".format(record.get("enrollid"), record.get("time"), record.get("inout"),
+                                   record.get("mode"), record.get("event"))
+
+def parse_device_time(value):
+    try:
+        return int(datetime.datetime.strptime(str(value).strip(), "%Y-%m-%d %H:%M:%S").timestamp())
+    except ValueError:
+        return None
+
+class LogCatchup:
+    # Fetches logs a device buffered while it could not reach us. Runs on the
+    # WebSocket server loop when a protocol device registers; pages are
+    # written straight to LogWriter.insert_backlog, never to the live GUI path.
+    def __init__(self, devices, log_writer, db_path, on_synced=None):
+        self.devices = devices
+        self.log_writer = log_writer
+        self.db_path = db_path
+        # Called from the server thread with (device_serial, sync time, rows inserted)
+        self.on_synced = on_synced
+        self.language = "en"
+        self._running = set()
+        self.fetched = 0
+        self.inserted = 0
+        self.failed = 0
+        conn = sqlite3.connect(db_path)
+        try:
+            init_device_log_sync(conn)
+        finally:
+            conn.close()
+        devices.on_registered.append(self._on_registered)
+
+    def _on_registered(self, session):
+        if session.serial not in self._running:
+            asyncio.ensure_future(self.catch_up(session))
+
+    def last_sync(self):
+        # Newest sync time over all devices, or None
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("SELECT MAX(last_sync) FROM device_log_sync").fetchone()[0]
+        finally:
+            conn.close()
+
+    def stats(self):
+        return {"fetched": self.fetched, "inserted": self.inserted, "failed": self.failed}
+
+    async def catch_up(self, session, full=False):
+        # full=True re-reads everything the device holds (getalllog); duplicates are skipped
+        serial = session.serial
+        self._running.add(serial)
+        loop = asyncio.get_running_loop()
+        try:
+            cursor = await loop.run_in_executor(None, self._load_cursor, serial)
+            if full:
+                cmd, fields = "getalllog", {}
+            elif cursor and not cursor[1] and cursor[0]:
+                # Resume an interrupted run from the day of the last stored log
+                day = datetime.date.fromtimestamp(cursor[0])
+                cmd, fields = "getalllog", {"from": f"{day.year}-{day.month}-{day.day}"}
+            else:
+                cmd, fields = "getnewlog", {}
+            await loop.run_in_executor(None, self._save_cursor, serial, None, False, 0, 0)
+            pending = []
+            fetched = inserted = 0
+            last_ts = cursor[0] if cursor else None
+            async for records in request_pages(session, cmd, LOG_PAGE_SIZE, **fields):
+                pending.extend(records)
+                if len(pending) >= BACKLOG_BATCH_ROWS:
+                    count, last_ts = await self._write(loop, serial, pending, last_ts)
+                    fetched += len(pending)
+                    inserted += count
+                    pending = []
+            if pending:
+                count, last_ts = await self._write(loop, serial, pending, last_ts)
+                fetched += len(pending)
+                inserted += count
+            await loop.run_in_executor(None, self._save_cursor, serial, last_ts, True, fetched, inserted)
+        except (asyncio.TimeoutError, ConnectionError, DeviceCommandError, sqlite3.Error):
+            # The cursor stays incomplete; the next registration resumes from it
+            self.failed += 1
+            return
+        finally:
+            self._running.discard(serial)
+        self.fetched += fetched
+        self.inserted += inserted
+        if self.on_synced:
+            self.on_synced(serial, time.time(), inserted)
+
+    async def _write(self, loop, serial, records, last_ts):
+        rows, newest = await loop.run_in_executor(None, self._build_rows, serial, records)
+        inserted = await asyncio.wrap_future(self.log_writer.insert_backlog(rows))
+        if newest is not None and (last_ts is None or newest > last_ts):
+            last_ts = newest
+        await loop.run_in_executor(None, self._save_cursor, serial, last_ts, False, 0, 0)
+        return inserted, last_ts
+
+    def _build_rows(self, serial, records):
+        # Runs on the executor: resolve enrollids (= users.id) and format the
+        # same columns the live pipeline writes
+        ids = {record.get("enrollid") for record in records if isinstance(record.get("enrollid"), int)}
+        users = {}
+        if ids:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                placeholders = ", ".join("?" * len(ids))
+                for row in conn.execute(
+                        "SELECT id, name, unit_number, plate_number, permission FROM users WHERE id IN ("
+                        + placeholders + ")", tuple(ids)):
+                    users[row[0]] = row
+            finally:
+                conn.close()
+        timestamps = [parse_device_time(record.get("time")) for record in records]
+        localized = get_datetimes_bulk(self.language, timestamps)
+        rows = []
+        for record, ts, (date, time_str) in zip(records, timestamps, localized):
+            enrollid = record.get("enrollid")
+            _, name, unit, plate, permission = users.get(enrollid, (None, "", "", "", ""))
+            direction = "out" if record.get("inout") == 1 else "in"
+            rows.append((
+                date, time_str, name, str(enrollid), direction_label(self.language, direction),
+                unit or "", plate or "", permission or "", serial, "",
+                json.dumps(record, ensure_ascii=False), None, "", ts, device_log_key(record), None, None,
+            ))
+        valid = [ts for ts in timestamps if ts is not None]
+        return rows, max(valid) if valid else None
+
+    def _load_cursor(self, serial):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("SELECT last_ts, complete FROM device_log_sync WHERE device_serial=?",
+                                (serial,)).fetchone()
+        finally:
+            conn.close()
+
+    def _save_cursor(self, serial, last_ts, complete, fetched, inserted):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                conn.execute(
+                    """INSERT INTO device_log_sync (device_serial, last_ts, last_sync, complete, fetched, inserted)
+                       VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(device_serial) DO UPDATE SET
+                           last_ts=coalesce(excluded.last_ts, last_ts),
+                           last_sync=CASE WHEN excluded.complete THEN excluded.last_sync ELSE last_sync END,
+                           complete=excluded.complete,
+                           fetched=fetched + excluded.fetched,
+                           inserted=inserted + excluded.inserted""",
+                    (serial, last_ts, int(time.time()) if complete else None, int(complete), fetched, inserted))
+        finally:
+            conn.close()
@@ -0,0 +1,138 @@
+import csv
+import re
+import sqlite3
+
+from PyQt5 import QtCore
+
+try:
+    import openpyxl  # optional, only needed for .xlsx exports
+except ImportError:
+    openpyxl = None
+
+from user_management import DB_PATH
+from event_pipeline import get_datetimes_bulk
+from retention import LogArchive, attach_archives, union_select
+
+EXPORT_COLUMNS = (
+    "ts", "user_name", "user_id", "direction", "unit", "plate", "permission", "device_serial", "photo_path"
+)
+XLSX_MAX_ROWS = 1048576  # per worksheet, including the header row
+# Control characters XML cannot hold; openpyxl refuses cells containing them
+XLSX_ILLEGAL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+EXPORT_HEADERS = [
+    "Date", "Time", "User Name", "User ID", "Direction", "Unit", "Plate", "Permission", "Device Code", "Photo"
+]
+
+class ExportCancelled(Exception):
+    pass
+
+class LogExportThread(QtCore.QThread):
+    # Streams the rows matching a ReportFilter to CSV or XLSX, oldest first,
+    # reading chunk_size rows at a time so memory does not grow with the export.
+    progress = QtCore.pyqtSignal(int, int)
+    finished_ok = QtCore.pyqtSignal(str, int)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, path, report_filter, language="en", db_path=DB_PATH, chunk_size=5000, archive=None,
+                 parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.report_filter = report_filter
+        self.language = language
+        self.db_path = db_path
+        # Archived months in the filter's range are exported too
+        self.archive = archive or LogArchive()
+        self.chunk_size = chunk_size
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        # An exception escaping QThread.run aborts the whole application
+        try:
+            self._export()
+        except Exception as e:
+            self.failed.emit(f"Export failed: {e}")
+
+    def _export(self):
+        xlsx = self.path.lower().endswith(".xlsx")
+        if xlsx and openpyxl is None:
+            self.failed.emit("XLSX export requires openpyxl (pip install openpyxl).")
+            return
+        conn = sqlite3.connect(self.db_path)
+        try:
+            clauses, params = self.report_filter.where()
+            # Oldest archive group first; the newest group includes the live table
+            groups = self.archive.groups(self.report_filter.start_ts, self.report_filter.end_ts)
+            groups = [(months, index == 0) for index, months in enumerate(groups)][::-1]
+            attached = {}
+            total = 0
+            for months, live in groups:
+                tables = attach_archives(conn, self.archive, months, attached) + (["main.logs"] if live else [])
+                total += conn.execute("SELECT COUNT(*) FROM (" + union_select(("id",), tables, clauses) + ")",
+                                      params * len(tables)).fetchone()[0]
+
+            def cursors():
+                for months, live in groups:
+                    tables = attach_archives(conn, self.archive, months, attached) + (["main.logs"] if live else [])
+                    # A compound SELECT can only be ordered by its own columns
+                    yield conn.execute("SELECT " + ", ".join(EXPORT_COLUMNS) + " FROM ("
+                                       + union_select(EXPORT_COLUMNS + ("id",), tables, clauses)
+                                       + ") ORDER BY ts, id", params * len(tables))
+
+            written = self._write_xlsx(cursors(), total) if xlsx else self._write_csv(cursors(), total)
+        except ExportCancelled:
+            self.failed.emit("Export cancelled.")
+        except (sqlite3.Error, OSError) as e:
+            self.failed.emit(f"Export failed: {e}")
+        else:
+            self.finished_ok.emit(self.path, written)
+        finally:
+            conn.close()
+
+    def _chunks(self, cursors, total):
+        written = 0
+        for cursor in cursors:
+            while True:
+                if self._cancelled:
+                    raise ExportCancelled()
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                localized = get_datetimes_bulk(self.language, [row[0] for row in rows])
+                yield [(date, time_str) + tuple(row[1:]) for (date, time_str), row in zip(localized, rows)]
+                written += len(rows)
+                self.progress.emit(written, total)
+
+    def _write_csv(self, cursors, total):
+        written = 0
+        # utf-8-sig so Excel opens Persian names correctly
+        with open(self.path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_HEADERS)
+            for chunk in self._chunks(cursors, total):
+                writer.writerows(chunk)
+                written += len(chunk)
+        return written
+
+    def _write_xlsx(self, cursors, total):
+        written = 0
+        # write_only workbooks stream rows to disk instead of keeping cells in memory
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Logs")
+        sheet.append(EXPORT_HEADERS)
+        sheet_rows = 1
+        for chunk in self._chunks(cursors, total):
+            for row in chunk:
+                if sheet_rows == XLSX_MAX_ROWS:
+                    sheet = workbook.create_sheet(f"Logs {len(workbook.worksheets) + 1}")
+                    sheet.append(EXPORT_HEADERS)
+                    sheet_rows = 1
+                # Names and serials come from devices and may hold control characters
+                sheet.append([XLSX_ILLEGAL_CHARS.sub("", value) if isinstance(value, str) else value
+                              for value in row])
+                sheet_rows += 1
+            written += len(chunk)
+        workbook.save(self.path)
+        return written
@@ -0,0 +1,384 @@
+import datetime
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import jdatetime
+
+from metrics import METRICS
+from user_management import DB_PATH
+
+LOG_COLUMNS = (
+    "date", "time", "user_name", "user_id", "direction", "unit", "plate",
+    "permission", "device_serial", "photo_path", "raw_data", "snapshot_skew_ms", "thumb_path", "ts", "log_key",
+    "decision", "decision_us"
+)
+
+# Columns added after the original schema, created on existing databases
+LOG_EXTRA_COLUMNS = (
+    ("snapshot_skew_ms", "INTEGER"),
+    ("thumb_path", "TEXT"),
+    # Event time as integer epoch seconds; date/time are display strings
+    ("ts", "INTEGER"),
+    # Identity of a device-side log record, so a record fetched twice is stored once
+    ("log_key", "TEXT"),
+    # Server-side door decision for live punches and how long answering took
+    ("decision", "TEXT"),
+    ("decision_us", "INTEGER"),
+)
+
+LOG_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs(ts)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_user_ts ON logs(user_id, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_device_ts ON logs(device_serial, ts)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_device_key ON logs(device_serial, log_key) WHERE log_key IS NOT NULL",
+)
+
+LOG_INSERT_SQL = (
+    # OR IGNORE only drops rows whose (device_serial, log_key) is already stored
+    "INSERT OR IGNORE INTO logs (" + ", ".join(LOG_COLUMNS) + ") VALUES ("
+    + ", ".join("?" * len(LOG_COLUMNS)) + ")"
+)
+
+# A failed commit or connect is retried this many times, sleeping
+# WRITE_BACKOFF_S, then twice that, ... in between
+WRITE_ATTEMPTS = 4
+WRITE_BACKOFF_S = 0.1
+
+def init_logs_table(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT, time TEXT, user_name TEXT, user_id TEXT,
+            direction TEXT, unit TEXT, plate TEXT, permission TEXT,
+            device_serial TEXT, photo_path TEXT, raw_data TEXT
+        )"""
+    )
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(logs)")]
+    for name, sql_type in LOG_EXTRA_COLUMNS:
+        if name not in columns:
+            conn.execute(f"ALTER TABLE logs ADD COLUMN {name} {sql_type}")
+    if "ts" not in columns:
+        _backfill_ts(conn)
+    for sql in LOG_INDEXES:
+        conn.execute(sql)
+    conn.commit()
+
+def _backfill_ts(conn, batch_size=10000):
+    # Rows written before the ts column existed: take the device timestamp
+    # from raw_data, else parse the Gregorian or Jalali date/time strings.
+    conn.execute(
+        """UPDATE logs SET ts = CAST(json_extract(raw_data, '$.timestamp') AS INTEGER)
+           WHERE ts IS NULL AND json_valid(raw_data) AND json_extract(raw_data, '$.timestamp') IS NOT NULL"""
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, date, time FROM logs WHERE ts IS NULL AND id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for row_id, date, time_str in rows:
+            ts = parse_log_datetime(date, time_str)
+            if ts is not None:
+                updates.append((ts, row_id))
+        conn.executemany("UPDATE logs SET ts=? WHERE id=?", updates)
+        conn.commit()
+        last_id = rows[-1][0]
+
+def parse_log_datetime(date, time_str):
+    try:
+        if "/" in date:
+            y, m, d = (int(p) for p in date.split("/"))
+            day = jdatetime.date(y, m, d).togregorian()
+        else:
+            day = datetime.date.fromisoformat(date)
+        t = datetime.time.fromisoformat(time_str)
+    except (TypeError, ValueError, AttributeError):
+        return None
+    return int(datetime.datetime.combine(day, t).timestamp())
+
+class LogWriter(threading.Thread):
+    # Owns the only connection that writes to `logs`. Events are queued by
+    # producers and group-committed here, so a burst of swipes costs one
+    # fsync per batch instead of one per event.
+    _FLUSH = object()
+    _STOP = object()
+    _BULK = object()
+    _TASK = object()
+
+    def __init__(self, db_path=DB_PATH, batch_size=200, batch_interval=0.25, max_queue=10000):
+        super().__init__(name="LogWriter", daemon=True)
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.queue = queue.Queue(max_queue)
+        self._stats_lock = threading.Lock()
+        self.rows_written = 0
+        self.commits = 0
+        self.last_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+        self.total_commit_ms = 0.0
+        self.errors = 0
+        # Rows given up on after retries (the database or the row itself is bad)
+        self.rows_dropped = 0
+        # Optional callable(rows, committed_at) run on this thread after each
+        # successful commit, e.g. to measure event-to-disk latency
+        self.on_commit = None
+
+    def insert_log(self, date, time_str, user_name, user_id, direction, unit, plate, permission,
+                   device_serial, photo_path, raw_data, snapshot_skew_ms=None, thumb_path=None, ts=None,
+                   log_key=None, decision=None, decision_us=None, block=True):
+        # With block=False raises queue.Full instead of waiting for room.
+        self.queue.put((date, time_str, user_name, user_id, direction, unit, plate, permission,
+                        device_serial, photo_path, raw_data, snapshot_skew_ms, thumb_path, ts, log_key,
+                        decision, decision_us), block)
+
+    def insert_backlog(self, rows):
+        # rows are LOG_COLUMNS tuples, written in one transaction. Returns a
+        # Future with the number of rows actually inserted (duplicates skipped).
+        future = Future()
+        if not self.is_alive():
+            future.set_exception(RuntimeError("log writer is not running"))
+            return future
+        self.queue.put((self._BULK, rows, future))
+        return future
+
+    def run_task(self, task, block=True):
+        # Runs task(conn) on this thread between batches, for maintenance that
+        # writes to `logs` (see retention.py). Returns a Future with its result.
+        # With block=False raises queue.Full instead of waiting for room.
+        future = Future()
+        if not self.is_alive():
+            future.set_exception(RuntimeError("log writer is not running"))
+            return future
+        self.queue.put((self._TASK, task, future), block)
+        return future
+
+    def clear_photo(self, ts, photo_path):
+        # For a snapshot that failed to write after its row was queued: the
+        # row stops pointing at files that do not exist. Never blocks.
+        def clear(conn):
+            conn.execute("UPDATE logs SET photo_path = '', thumb_path = '' WHERE ts = ? AND photo_path = ?",
+                         (ts, photo_path))
+            conn.commit()
+        return self.run_task(clear, block=False)
+
+    def flush(self, timeout=None):
+        # Blocks until everything queued before this call has been committed.
+        if not self.is_alive():
+            return False
+        done = threading.Event()
+        self.queue.put((self._FLUSH, done))
+        return done.wait(timeout)
+
+    def shutdown(self, timeout=5.0):
+        if not self.is_alive():
+            return
+        self.queue.put((self._STOP, None))
+        self.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            commits = self.commits
+            return {
+                "queue_depth": self.queue.qsize(),
+                "rows_written": self.rows_written,
+                "commits": commits,
+                "last_commit_ms": self.last_commit_ms,
+                "max_commit_ms": self.max_commit_ms,
+                "avg_commit_ms": self.total_commit_ms / commits if commits else 0.0,
+                "errors": self.errors,
+                "rows_dropped": self.rows_dropped,
+            }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            init_logs_table(conn)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _try_connect(self):
+        # Returns a connection, or None if the database stayed unavailable
+        delay = WRITE_BACKOFF_S
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                return self._connect()
+            except sqlite3.Error:
+                with self._stats_lock:
+                    self.errors += 1
+            if attempt + 1 < WRITE_ATTEMPTS:
+                time.sleep(delay)
+                delay *= 2
+        return None
+
+    def _rollback(self, conn):
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _commit(self, conn, rows):
+        # Returns the number of rows inserted, or None if the batch failed
+        if not rows:
+            return 0
+        start = time.perf_counter()
+        delay = WRITE_BACKOFF_S
+        for attempt in range(WRITE_ATTEMPTS):
+            # total_changes also counts rows of a rolled back attempt
+            changes = conn.total_changes
+            try:
+                conn.executemany(LOG_INSERT_SQL, rows)
+                conn.commit()
+                break
+            except sqlite3.Error:
+                # Usually transient ("database is locked"), so back off and retry
+                self._rollback(conn)
+                with self._stats_lock:
+                    self.errors += 1
+            if attempt + 1 < WRITE_ATTEMPTS:
+                time.sleep(delay)
+                delay *= 2
+        else:
+            changes = conn.total_changes
+            dropped = self._commit_rows(conn, rows)
+            with self._stats_lock:
+                self.rows_dropped += dropped
+            if dropped == len(rows):
+                return None
+        inserted = conn.total_changes - changes
+        elapsed_ms = METRICS.since("log_commit", start)
+        with self._stats_lock:
+            self.rows_written += inserted
+            self.commits += 1
+            self.last_commit_ms = elapsed_ms
+            self.max_commit_ms = max(self.max_commit_ms, elapsed_ms)
+            self.total_commit_ms += elapsed_ms
+        if self.on_commit is not None:
+            try:
+                self.on_commit(rows, time.time())
+            except Exception:
+                with self._stats_lock:
+                    self.errors += 1
+        return inserted
+
+    def _commit_rows(self, conn, rows):
+        # Last resort for a batch that keeps failing: one statement per row in
+        # a single transaction, so a row SQLite rejects is skipped on its own.
+        # Returns the number of rows lost.
+        dropped = 0
+        try:
+            for row in rows:
+                try:
+                    conn.execute(LOG_INSERT_SQL, row)
+                except sqlite3.OperationalError:
+                    # Not about this row (locked, disk full, ...): give up the batch
+                    raise
+                except sqlite3.Error:
+                    dropped += 1
+            conn.commit()
+        except sqlite3.Error:
+            self._rollback(conn)
+            return len(rows)
+        return dropped
+
+    def _fail_batch(self, rows, bulks, tasks):
+        # No database connection: fail everything so nobody waits on it forever
+        with self._stats_lock:
+            self.rows_dropped += len(rows) + sum(len(item[1]) for item in bulks)
+        for _, _, future in bulks + tasks:
+            future.set_exception(sqlite3.OperationalError(f"cannot open log database {self.db_path}"))
+
+    def _write_batch(self, conn, rows, bulks, tasks):
+        # Returns the connection to use for the next batch
+        if conn is None:
+            conn = self._try_connect()
+        if conn is None:
+            self._fail_batch(rows, bulks, tasks)
+            return None
+        self._commit(conn, rows)
+        self._commit_bulk(conn, bulks)
+        self._run_tasks(conn, tasks)
+        return conn
+
+    def _commit_bulk(self, conn, bulks):
+        for _, rows, future in bulks:
+            inserted = self._commit(conn, rows)
+            if inserted is None:
+                future.set_exception(sqlite3.DatabaseError("backlog insert failed"))
+            else:
+                future.set_result(inserted)
+
+    def _run_tasks(self, conn, tasks):
+        for _, task, future in tasks:
+            try:
+                future.set_result(task(conn))
+            except Exception as e:
+                future.set_exception(e)
+
+    def run(self):
+        # Reconnects on the next batch if the database cannot be opened now
+        conn = self._try_connect()
+        rows = []
+        waiters = []
+        bulks = []
+        tasks = []
+        stopping = False
+        try:
+            while not stopping:
+                item = self.queue.get()
+                deadline = time.monotonic() + self.batch_interval
+                while True:
+                    if item[0] is self._STOP:
+                        stopping = True
+                    elif item[0] is self._FLUSH:
+                        waiters.append(item[1])
+                    elif item[0] is self._BULK:
+                        bulks.append(item)
+                    elif item[0] is self._TASK:
+                        tasks.append(item)
+                    else:
+                        rows.append(item)
+                    if stopping or waiters or bulks or tasks or len(rows) >= self.batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self.queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                conn = self._write_batch(conn, rows, bulks, tasks)
+                rows = []
+                bulks = []
+                tasks = []
+                for done in waiters:
+                    done.set()
+                waiters = []
+            # Drain whatever producers managed to queue before the stop marker was seen.
+            while True:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item[0] is self._FLUSH:
+                    item[1].set()
+                elif item[0] is self._BULK:
+                    bulks.append(item)
+                elif item[0] is self._TASK:
+                    tasks.append(item)
+                elif item[0] is not self._STOP:
+                    rows.append(item)
+            conn = self._write_batch(conn, rows, bulks, tasks)
+        finally:
+            if conn is not None:
+                conn.close()
@@ -1,535 +1,604 @@
-import sys
-import datetime
-import json
-import threading
-import asyncio
-import os
-import sqlite3
-import uuid
-
-from PyQt5 import QtWidgets, QtGui, QtCore
-import jdatetime
-import cv2
-import numpy as np
-import websockets
-
-from user_management import init_db, UserManagementDialog
-
-FARSI_TEXTS = {
-    "dashboard": "کنترل دسترسی فرالایت",
-    "entrance": "ورودی",
-    "exit": "خروجی",
-    "last_inout": "آخرین ورود/خروج",
-    "no_feed": "بدون تصویر زنده",
-    "no_image": "بدون تصویر",
-    "live_logs": "گزارش ورود/خروج",
-    "settings": "تنظیمات",
-    "user_mgmt": "مدیریت کاربران",
-    "reports": "گزارش‌ها",
-    "logout": "خروج",
-    "device_status": "وضعیت دستگاه: {}",
-    "online": "آنلاین",
-    "offline": "آفلاین",
-    "last_sync_date": "تاریخ همگام‌سازی:",
-    "last_sync_time": "زمان همگام‌سازی:",
-    "language": "زبان:",
-    "english": "انگلیسی",
-    "farsi": "فارسی",
-    "table_headers": [
-        "تاریخ", "زمان", "نام کاربر", "کد کاربر",
-        "جهت", "واحد", "پلاک", "دسترسی", "وضعیت", "کد دستگاه"
-    ]
-}
-
-EN_TEXTS = {
-    "dashboard": "Faralite Access Control",
-    "entrance": "Entrance",
-    "exit": "Exit",
-    "last_inout": "Last In/Out",
-    "no_feed": "No feed",
-    "no_image": "No image",
-    "live_logs": "Live Access Logs",
-    "settings": "Settings",
-    "user_mgmt": "User Management",
-    "reports": "Reports",
-    "logout": "Logout",
-    "device_status": "Device Status: {}",
-    "online": "Online",
-    "offline": "Offline",
-    "last_sync_date": "Last Sync Date:",
-    "last_sync_time": "Last Sync Time:",
-    "language": "Language:",
-    "english": "English",
-    "farsi": "فارسی",
-    "table_headers": [
-        "Date", "Time", "User Name", "User ID",
-        "Direction", "Unit", "Plate", "Permission", "Status", "Device Code"
-    ]
-}
-
-PHOTO_SAVE_DIR = "photos"
-os.makedirs(PHOTO_SAVE_DIR, exist_ok=True)
-
-def get_datetimes(lang, dt=None):
-    now = dt if dt else datetime.datetime.now()
-    if lang == "fa":
-        jnow = jdatetime.datetime.fromgregorian(datetime=now)
-        date_str = jnow.strftime("%Y/%m/%d")
-        time_str = now.strftime("%H:%M:%S")
-    else:
-        date_str = now.strftime("%Y-%m-%d")
-        time_str = now.strftime("%H:%M:%S")
-    return date_str, time_str
-
-def save_photo(image_np, direction, timestamp, device_serial):
-    filename = f"{device_serial}_{direction}_{timestamp}_{uuid.uuid4().hex[:8]}.jpg"
-    filepath = os.path.join(PHOTO_SAVE_DIR, filename)
-    cv2.imwrite(filepath, image_np)
-    return filepath
-
-def insert_log_to_db(date, time, user_name, user_id, direction, unit, plate, permission, device_serial, photo_path, raw_data):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute(
-        """CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT, time TEXT, user_name TEXT, user_id TEXT,
-            direction TEXT, unit TEXT, plate TEXT, permission TEXT,
-            device_serial TEXT, photo_path TEXT, raw_data TEXT
-        )"""
-    )
-    c.execute(
-        """INSERT INTO logs
-            (date, time, user_name, user_id, direction, unit, plate, permission, device_serial, photo_path, raw_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (date, time, user_name, user_id, direction, unit, plate, permission, device_serial, photo_path, raw_data)
-    )
-    conn.commit()
-    conn.close()
-
-class CameraThread(QtCore.QThread):
-    image_update = QtCore.pyqtSignal(QtGui.QImage, np.ndarray)
-    error = QtCore.pyqtSignal(str)
-
-    def __init__(self, camera_url, width=320, height=180, parent=None):
-        super().__init__(parent)
-        self.camera_url = camera_url
-        self.width = width
-        self.height = height
-        self.running = False
-
-    def run(self):
-        self.running = True
-        cap = cv2.VideoCapture(self.camera_url)
-        if not cap.isOpened():
-            self.error.emit("Failed to open camera stream")
-            return
-        while self.running:
-            ret, frame = cap.read()
-            if not ret:
-                self.error.emit("No frame received")
-                break
-            rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_image.shape
-            bytes_per_line = ch * w
-            qt_image = QtGui.QImage(rgb_image.data, w, h, bytes_per_line, QtGui.QImage.Format_RGB888)
-            scaled_image = qt_image.scaled(self.width, self.height, QtCore.Qt.KeepAspectRatio)
-            self.image_update.emit(scaled_image, rgb_image.copy())
-            self.msleep(30)
-        cap.release()
-
-    def stop(self):
-        self.running = False
-        self.wait()
-
-class WebSocketServerThread(QtCore.QThread):
-    log_received = QtCore.pyqtSignal(dict)
-    device_status_changed = QtCore.pyqtSignal(set)
-
-    def __init__(self, host="0.0.0.0", port=8765, parent=None):
-        super().__init__(parent)
-        self.host = host
-        self.port = port
-        self._stop_event = threading.Event()
-        self.connected_devices = set()
-        self._lock = threading.Lock()
-
-    async def ws_handler(self, websocket, path=None):  # path=None for compatibility
-        device_serial = None
-        try:
-            async for message in websocket:
-                try:
-                    data = json.loads(message)
-                except Exception:
-                    continue
-                if not device_serial:
-                    device_serial = data.get("device_serial", None)
-                    if device_serial:
-                        with self._lock:
-                            self.connected_devices.add(device_serial)
-                        self.device_status_changed.emit(self.connected_devices.copy())
-                self.log_received.emit(data)
-        finally:
-            if device_serial:
-                with self._lock:
-                    self.connected_devices.discard(device_serial)
-                self.device_status_changed.emit(self.connected_devices.copy())
-
-    async def start_server(self):
-        async with websockets.serve(self.ws_handler, self.host, self.port):
-            while not self._stop_event.is_set():
-                await asyncio.sleep(0.2)
-
-    def run(self):
-        asyncio.run(self.start_server())
-
-    def stop(self):
-        self._stop_event.set()
-        self.wait()
-
-class MainDashboard(QtWidgets.QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.current_language = "en"
-        self.setWindowTitle(EN_TEXTS["dashboard"])
-        self.resize(1400, 900)
-        self.latest_entrance_frame = None
-        self.latest_exit_frame = None
-
-        central = QtWidgets.QWidget()
-        self.setCentralWidget(central)
-        self.vbox = QtWidgets.QVBoxLayout(central)
-
-        self.top_bar = QtWidgets.QHBoxLayout()
-        self.lbl_title = QtWidgets.QLabel(EN_TEXTS["dashboard"])
-        self.lbl_title.setStyleSheet("font-size: 16px; font-weight: bold;")
-        self.top_bar.addWidget(self.lbl_title)
-        self.status_frame = QtWidgets.QFrame()
-        self.status_frame.setFixedSize(20, 20)
-        self.status_frame.setStyleSheet("background: red; border-radius: 10px;")
-        self.top_bar.addWidget(self.status_frame)
-        self.lbl_status = QtWidgets.QLabel(EN_TEXTS["device_status"].format(EN_TEXTS["offline"]))
-        self.top_bar.addWidget(self.lbl_status)
-        self.top_bar.addStretch()
-        self.btn_settings = QtWidgets.QPushButton(EN_TEXTS["settings"])
-        self.btn_user_mgmt = QtWidgets.QPushButton(EN_TEXTS["user_mgmt"])
-        self.btn_reports = QtWidgets.QPushButton(EN_TEXTS["reports"])
-        self.btn_logout = QtWidgets.QPushButton(EN_TEXTS["logout"])
-        self.btn_settings.clicked.connect(self.open_settings)
-        self.btn_user_mgmt.clicked.connect(self.open_user_management)
-        self.btn_reports.clicked.connect(self.open_reports)
-        self.btn_logout.clicked.connect(self.logout)
-        self.top_bar.addWidget(self.btn_settings)
-        self.top_bar.addWidget(self.btn_user_mgmt)
-        self.top_bar.addWidget(self.btn_reports)
-        self.top_bar.addWidget(self.btn_logout)
-        self.vbox.addLayout(self.top_bar)
-
-        self.middle = QtWidgets.QHBoxLayout()
-        self.cam_vbox = QtWidgets.QVBoxLayout()
-        self.cam_vbox.setSpacing(10)
-        self.cam_vbox.setContentsMargins(0, 0, 0, 0)
-
-        self.lbl_entrance = QtWidgets.QLabel(EN_TEXTS["entrance"])
-        self.lbl_entrance.setStyleSheet("font-size: 14px;")
-        self.cam_vbox.addWidget(self.lbl_entrance)
-        self.entranceCameraFeed = QtWidgets.QLabel(EN_TEXTS["no_feed"])
-        self.entranceCameraFeed.setFixedSize(320, 180)
-        self.entranceCameraFeed.setStyleSheet("background: #333; color: #fff; border: 1px solid #999;")
-        self.entranceCameraFeed.setAlignment(QtCore.Qt.AlignCenter)
-        self.cam_vbox.addWidget(self.entranceCameraFeed)
-
-        self.lbl_exit = QtWidgets.QLabel(EN_TEXTS["exit"])
-        self.lbl_exit.setStyleSheet("font-size: 14px;")
-        self.cam_vbox.addWidget(self.lbl_exit)
-        self.exitCameraFeed = QtWidgets.QLabel(EN_TEXTS["no_feed"])
-        self.exitCameraFeed.setFixedSize(320, 180)
-        self.exitCameraFeed.setStyleSheet("background: #333; color: #fff; border: 1px solid #999;")
-        self.exitCameraFeed.setAlignment(QtCore.Qt.AlignCenter)
-        self.cam_vbox.addWidget(self.exitCameraFeed)
-
-        self.lbl_last_inout = QtWidgets.QLabel(EN_TEXTS["last_inout"])
-        self.lbl_last_inout.setStyleSheet("font-size: 14px;")
-        self.cam_vbox.addWidget(self.lbl_last_inout)
-        self.lastInOutImage = QtWidgets.QLabel(EN_TEXTS["no_image"])
-        self.lastInOutImage.setFixedSize(320, 180)
-        self.lastInOutImage.setStyleSheet("background: #222; color: #fff; border: 2px solid #39f;")
-        self.lastInOutImage.setAlignment(QtCore.Qt.AlignCenter)
-        self.cam_vbox.addWidget(self.lastInOutImage)
-        self.cam_vbox.addStretch()
-        self.middle.addLayout(self.cam_vbox, 1)
-
-        self.logs_vbox = QtWidgets.QVBoxLayout()
-        self.lbl_live_logs = QtWidgets.QLabel(EN_TEXTS["live_logs"])
-        self.lbl_live_logs.setStyleSheet("font-size: 16px; font-weight: bold;")
-        self.logs_vbox.addWidget(self.lbl_live_logs)
-        log_headers = [
-            EN_TEXTS["table_headers"][0],  # Date
-            EN_TEXTS["table_headers"][1],  # Time
-            EN_TEXTS["table_headers"][2],  # User Name
-            EN_TEXTS["table_headers"][3],  # User ID
-            EN_TEXTS["table_headers"][4],  # Direction
-            EN_TEXTS["table_headers"][5],  # Unit
-            EN_TEXTS["table_headers"][6],  # Plate
-            EN_TEXTS["table_headers"][7],  # Permission
-        ]
-        self.logTable = QtWidgets.QTableWidget(0, len(log_headers))
-        self.logTable.setHorizontalHeaderLabels(log_headers)
-        self.logTable.horizontalHeader().setStretchLastSection(True)
-        self.logTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
-        self.logTable.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
-        farsi_font = QtGui.QFont("Tahoma")
-        self.logTable.setFont(farsi_font)
-        self.logs_vbox.addWidget(self.logTable)
-        bold_font = QtGui.QFont()
-        bold_font.setBold(True)
-        for i in range(self.logTable.columnCount()):
-            item = self.logTable.horizontalHeaderItem(i)
-            if item:
-                item.setFont(bold_font)
-        self.middle.addLayout(self.logs_vbox, 2)
-
-        self.vbox.addLayout(self.middle, 1)
-
-        self.bottom_bar = QtWidgets.QHBoxLayout()
-        self.lbl_sync_date = QtWidgets.QLabel(EN_TEXTS["last_sync_date"] + " --")
-        self.lbl_sync_time = QtWidgets.QLabel(EN_TEXTS["last_sync_time"] + " --")
-        self.bottom_bar.addWidget(self.lbl_sync_date)
-        self.bottom_bar.addWidget(self.lbl_sync_time)
-        self.bottom_bar.addStretch()
-        self.lbl_language = QtWidgets.QLabel(EN_TEXTS["language"])
-        self.bottom_bar.addWidget(self.lbl_language)
-        self.combo_lang = QtWidgets.QComboBox()
-        self.combo_lang.addItems([EN_TEXTS["english"], EN_TEXTS["farsi"]])
-        self.combo_lang.currentIndexChanged.connect(self.change_language)
-        self.bottom_bar.addWidget(self.combo_lang)
-        self.vbox.addLayout(self.bottom_bar)
-
-        self.entrance_camera_thread = CameraThread("rtsp://192.168.2.18:8080/h264.sdp")
-        self.entrance_camera_thread.image_update.connect(self.update_entrance_camera)
-        self.entrance_camera_thread.error.connect(self.entrance_error)
-        self.entrance_camera_thread.start()
-
-        self.exit_camera_thread = CameraThread("rtsp://192.168.2.18:8080/h264.sdp")
-        self.exit_camera_thread.image_update.connect(self.update_exit_camera)
-        self.exit_camera_thread.error.connect(self.exit_error)
-        self.exit_camera_thread.start()
-
-        self.ws_server_thread = WebSocketServerThread()
-        self.ws_server_thread.log_received.connect(self.on_log_received)
-        self.ws_server_thread.device_status_changed.connect(self.on_device_status_changed)
-        self.ws_server_thread.start()
-
-    def on_device_status_changed(self, device_serials):
-        texts = FARSI_TEXTS if self.current_language == "fa" else EN_TEXTS
-        if device_serials:
-            status_text = texts["online"]
-            device_list = "، ".join(device_serials) if self.current_language == "fa" else ", ".join(device_serials)
-            self.status_frame.setStyleSheet("background: green; border-radius: 10px;")
-            self.lbl_status.setText(f"{texts['device_status'].format(status_text)} | {device_list}")
-        else:
-            status_text = texts["offline"]
-            self.status_frame.setStyleSheet("background: red; border-radius: 10px;")
-            self.lbl_status.setText(texts["device_status"].format(status_text))
-
-    def entrance_error(self, msg):
-        self.entranceCameraFeed.setText(FARSI_TEXTS["no_feed"] if self.current_language == "fa" else EN_TEXTS["no_feed"])
-
-    def exit_error(self, msg):
-        self.exitCameraFeed.setText(FARSI_TEXTS["no_feed"] if self.current_language == "fa" else EN_TEXTS["no_feed"])
-
-    def update_entrance_camera(self, image, raw_frame):
-        self.entranceCameraFeed.setPixmap(QtGui.QPixmap.fromImage(image))
-        self.latest_entrance_frame = raw_frame
-
-    def update_exit_camera(self, image, raw_frame):
-        self.exitCameraFeed.setPixmap(QtGui.QPixmap.fromImage(image))
-        self.latest_exit_frame = raw_frame
-
-    def closeEvent(self, event):
-        self.entrance_camera_thread.stop()
-        self.exit_camera_thread.stop()
-        self.ws_server_thread.stop()
-        super().closeEvent(event)
-
-    def on_log_received(self, data):
-        dt = datetime.datetime.fromtimestamp(data.get("timestamp", datetime.datetime.now().timestamp()))
-        date, time_str = get_datetimes(self.current_language, dt)
-        user_name = data.get("user_name", "")
-        user_id = data.get("user_id", data.get("card_number", ""))
-        device_direction = data.get("direction", "in")
-        direction_text = "ورود" if (self.current_language == "fa" and device_direction.lower() == "in") else (
-            "خروج" if self.current_language == "fa" else ("In" if device_direction.lower() == "in" else "Out"))
-        unit = data.get("unit_number", "")
-        plate = data.get("plate_number", "")
-        permission = data.get("permission", "")
-        device_serial = data.get("device_serial", "")
-
-        # If possible, look up user info by card_number
-        try:
-            conn = sqlite3.connect("users.db")
-            c = conn.cursor()
-            c.execute("SELECT name, id, unit_number, plate_number, permission FROM users WHERE card_number=?", (data.get("card_number", ""),))
-            row = c.fetchone()
-            conn.close()
-            if row:
-                user_name, db_id, db_unit, db_plate, db_perm = row
-                if not user_id: user_id = db_id
-                if not unit: unit = db_unit
-                if not plate: plate = db_plate
-                if not permission: permission = db_perm
-        except Exception:
-            pass
-
-        # Save photo if possible
-        frame = self.latest_entrance_frame if device_direction.lower() == "in" else self.latest_exit_frame
-        photo_path = ""
-        if frame is not None:
-            photo_path = save_photo(
-                frame, device_direction, data.get("timestamp", int(dt.timestamp())), device_serial
-            )
-
-        # Save log (including photo path) to database
-        insert_log_to_db(
-            date, time_str, user_name, user_id, direction_text, unit, plate, permission, device_serial,
-            photo_path, json.dumps(data, ensure_ascii=False)
-        )
-
-        # Build the row values (exclude status/device code)
-        row_values = [
-            date, time_str, user_name, str(user_id), direction_text, unit, plate, permission
-        ]
-        self.logTable.insertRow(0)
-        row_count = self.logTable.rowCount()
-        for row in range(row_count):
-            # The oldest log is at the bottom, which gets No. 1
-            index_number = row_count - row
-            index_item = QtWidgets.QTableWidgetItem(str(index_number))
-            index_item.setTextAlignment(QtCore.Qt.AlignCenter)
-            font = QtGui.QFont("Tahoma")
-            font.setBold(True)
-            index_item.setFont(font)
-            self.logTable.setVerticalHeaderItem(row, index_item)
-        for i, val in enumerate(row_values):
-            item = QtWidgets.QTableWidgetItem()
-            # Direction column: show arrow icon
-            if i == 4:
-                arrow_char = "→" if device_direction.lower() == "in" else "←"
-                item.setText(arrow_char)
-                if device_direction.lower() == "in":
-                    item.setForeground(QtGui.QBrush(QtGui.QColor("green")))
-                else:
-                    item.setForeground(QtGui.QBrush(QtGui.QColor("blue")))
-                item.setTextAlignment(QtCore.Qt.AlignCenter)
-                font = QtGui.QFont("Tahoma")
-                font.setPointSize(14)
-                font.setBold(True)
-                item.setFont(font)
-            # Permission column: color code
-            elif i == 7:
-                item.setText(str(val))
-                if permission.lower() == "open":
-                    item.setForeground(QtGui.QBrush(QtGui.QColor("green")))
-                elif permission.lower() == "limited":
-                    item.setForeground(QtGui.QBrush(QtGui.QColor("blue")))
-                elif permission.lower() == "restricted":
-                    item.setForeground(QtGui.QBrush(QtGui.QColor("red")))
-                item.setTextAlignment(QtCore.Qt.AlignCenter)
-                font = QtGui.QFont("Tahoma")
-                font.setBold(True)
-                item.setFont(font)
-            else:
-                item.setText(str(val))
-                item.setTextAlignment(QtCore.Qt.AlignCenter)
-                item.setFont(QtGui.QFont("Tahoma"))
-            self.logTable.setItem(0, i, item)
-
-        self.capture_picture_for_log(direction_text)
-
-    def capture_picture_for_log(self, direction):
-        if direction in ["In", "ورود"]:
-            frame = self.latest_entrance_frame
-        else:
-            frame = self.latest_exit_frame
-
-        if frame is not None:
-            h, w, ch = frame.shape
-            bytes_per_line = ch * w
-            qt_image = QtGui.QImage(
-                frame.data, w, h, bytes_per_line, QtGui.QImage.Format_RGB888)
-            scaled_img = qt_image.scaled(320, 180, QtCore.Qt.KeepAspectRatio)
-            self.lastInOutImage.setPixmap(QtGui.QPixmap.fromImage(scaled_img))
-        else:
-            texts = FARSI_TEXTS if self.current_language == "fa" else EN_TEXTS
-            self.lastInOutImage.setText(texts["no_image"])
-
-    def change_language(self, index):
-        if index == 1:
-            self.current_language = "fa"
-            self.setLayoutDirection(QtCore.Qt.RightToLeft)
-            texts = FARSI_TEXTS
-        else:
-            self.current_language = "en"
-            self.setLayoutDirection(QtCore.Qt.LeftToRight)
-            texts = EN_TEXTS
-
-        self.setWindowTitle(texts["dashboard"])
-        self.lbl_title.setText(texts["dashboard"])
-        self.lbl_entrance.setText(texts["entrance"])
-        self.lbl_exit.setText(texts["exit"])
-        self.lbl_last_inout.setText(texts["last_inout"])
-        self.entranceCameraFeed.setText(texts["no_feed"])
-        self.exitCameraFeed.setText(texts["no_feed"])
-        self.lastInOutImage.setText(texts["no_image"])
-        self.lbl_live_logs.setText(texts["live_logs"])
-        self.btn_settings.setText(texts["settings"])
-        self.btn_user_mgmt.setText(texts["user_mgmt"])
-        self.btn_reports.setText(texts["reports"])
-        self.btn_logout.setText(texts["logout"])
-        offline_txt = texts["offline"]
-        self.lbl_status.setText(texts["device_status"].format(offline_txt))
-        self.lbl_sync_date.setText(texts["last_sync_date"] + " --")
-        self.lbl_sync_time.setText(texts["last_sync_time"] + " --")
-        self.lbl_language.setText(texts["language"])
-        self.combo_lang.setItemText(0, EN_TEXTS["english"])
-        self.combo_lang.setItemText(1, EN_TEXTS["farsi"])
-        log_headers = [
-            texts["table_headers"][0],
-            texts["table_headers"][1],
-            texts["table_headers"][2],
-            texts["table_headers"][3],
-            texts["table_headers"][4],
-            texts["table_headers"][5],
-            texts["table_headers"][6],
-            texts["table_headers"][7],
-        ]
-        self.logTable.setHorizontalHeaderLabels(log_headers)
-        font = QtGui.QFont("Tahoma") if self.current_language == "fa" else QtGui.QFont()
-        self.logTable.setFont(font)
-        if self.current_language == "fa":
-            for col in range(self.logTable.columnCount()):
-                self.logTable.horizontalHeaderItem(col).setTextAlignment(QtCore.Qt.AlignRight)
-        else:
-            for col in range(self.logTable.columnCount()):
-                self.logTable.horizontalHeaderItem(col).setTextAlignment(QtCore.Qt.AlignLeft)
-
-    def open_settings(self):
-        QtWidgets.QMessageBox.information(self, "Settings", "Settings dialog not implemented.")
-
-    def open_user_management(self):
-        dlg = UserManagementDialog(self)
-        dlg.exec_()
-
-    def open_reports(self):
-        QtWidgets.QMessageBox.information(self, "Reports", "Reports dialog not implemented.")
-
-    def logout(self):
-        QtWidgets.QMessageBox.information(self, "Logout", "Logout not implemented.")
-
-if __name__ == "__main__":
-    # Requires: pip install websockets PyQt5 opencv-python jdatetime
-    init_db()
-    app = QtWidgets.QApplication(sys.argv)
-    window = MainDashboard()
-    QtCore.QTimer.singleShot(0, window.showMaximized)
+import sys
+import threading
+import asyncio
+import datetime
+import time
+
+from PyQt5 import QtWidgets, QtGui, QtCore
+import websockets
+
+from user_management import DB_PATH, init_db, UserManagementDialog
+from log_writer import LogWriter
+from user_cache import UserCache
+from event_pipeline import EventPipeline, get_datetimes
+from live_log_model import LiveLogModel, LiveLogRecord
+from camera import CameraRegistry
+from snapshots import SnapshotService
+from snapshot_encoder import SnapshotEncoder
+from reports import ReportsDialog, ReportsEngine
+from device_commands import DeviceRegistry, DeviceSession
+from device_sync import DeviceSync
+from log_catchup import LogCatchup
+from access_decision import AccessDecisionEngine
+from liveness import LivenessMonitor
+from metrics import METRICS, MetricsServer, MetricsDumper, DiagnosticsDialog
+from stall_watchdog import StallWatchdog
+from retention import RetentionManager
+
+FARSI_TEXTS = {
+    "dashboard": "کنترل دسترسی فرالایت",
+    "entrance": "ورودی",
+    "exit": "خروجی",
+    "last_inout": "آخرین ورود/خروج",
+    "no_feed": "بدون تصویر زنده",
+    "no_image": "بدون تصویر",
+    "live_logs": "گزارش ورود/خروج",
+    "settings": "تنظیمات",
+    "user_mgmt": "مدیریت کاربران",
+    "reports": "گزارش‌ها",
+    "diagnostics": "عیب‌یابی",
+    "logout": "خروج",
+    "device_status": "وضعیت دستگاه: {}",
+    "online": "آنلاین",
+    "offline": "آفلاین",
+    "last_sync_date": "تاریخ همگام‌سازی:",
+    "last_sync_time": "زمان همگام‌سازی:",
+    "language": "زبان:",
+    "english": "انگلیسی",
+    "farsi": "فارسی",
+    "table_headers": [
+        "تاریخ", "زمان", "نام کاربر", "کد کاربر",
+        "جهت", "واحد", "پلاک", "دسترسی", "وضعیت", "کد دستگاه"
+    ]
+}
+
+EN_TEXTS = {
+    "dashboard": "Faralite Access Control",
+    "entrance": "Entrance",
+    "exit": "Exit",
+    "last_inout": "Last In/Out",
+    "no_feed": "No feed",
+    "no_image": "No image",
+    "live_logs": "Live Access Logs",
+    "settings": "Settings",
+    "user_mgmt": "User Management",
+    "reports": "Reports",
+    "diagnostics": "Diagnostics",
+    "logout": "Logout",
+    "device_status": "Device Status: {}",
+    "online": "Online",
+    "offline": "Offline",
+    "last_sync_date": "Last Sync Date:",
+    "last_sync_time": "Last Sync Time:",
+    "language": "Language:",
+    "english": "English",
+    "farsi": "فارسی",
+    "table_headers": [
+        "Date", "Time", "User Name", "User ID",
+        "Direction", "Unit", "Plate", "Permission", "Status", "Device Code"
+    ]
+}
+
+WEBSOCKET_PORT = 8765
+# "synthetic://640x360@25" gives a generated test pattern instead
+ENTRANCE_CAMERA_URL = "rtsp://192.168.2.18:8080/h264.sdp"
+EXIT_CAMERA_URL = "rtsp://192.168.2.18:8080/h264.sdp"
+SNAPSHOT_RING_FPS = 5
+SNAPSHOT_RING_MAX_BYTES = 32 * 1024 * 1024
+SNAPSHOT_JPEG_QUALITY = 90
+LIVE_LOG_MAX_ROWS = 5000
+LIVE_LOG_FLUSH_MS = 50
+# A device silent this long is pinged, and dropped if it stays silent
+DEVICE_IDLE_PING_S = 10
+DEVICE_STALE_AFTER_S = 30
+# Prometheus text on http://127.0.0.1:9108/metrics (None disables it), and an
+# optional JSON file rewritten every METRICS_DUMP_INTERVAL_S
+METRICS_HTTP_PORT = 9108
+METRICS_DUMP_PATH = None
+METRICS_DUMP_INTERVAL_S = 60
+# The GUI thread's stack is sampled while the event loop is this late, and
+# each stall is written to STALL_LOG_PATH
+GUI_STALL_THRESHOLD_MS = 250
+STALL_LOG_PATH = "stalls.log"
+
+class WebSocketServerThread(QtCore.QThread):
+    record_ready = QtCore.pyqtSignal(dict)
+    # Sent once per change, not as a snapshot of every connected device
+    device_connected = QtCore.pyqtSignal(str)
+    device_disconnected = QtCore.pyqtSignal(str)
+
+    def __init__(self, pipeline, access=None, host="0.0.0.0", port=8765, parent=None):
+        super().__init__(parent)
+        self.host = host
+        self.port = port
+        self.pipeline = pipeline
+        # Decides each punch in-band, before it is queued to the pipeline
+        self.access = access
+        self._stop_event = threading.Event()
+        # device serial -> open sockets; a device that reconnects before its
+        # old socket is closed stays connected
+        self.connected_devices = {}
+        self._lock = threading.Lock()
+        # Outbound command channel to each connected device
+        self.devices = DeviceRegistry()
+        self.liveness = LivenessMonitor(DEVICE_IDLE_PING_S, DEVICE_STALE_AFTER_S)
+
+    async def ws_handler(self, websocket, path=None):  # path=None for compatibility
+        device_serial = None
+        session = None
+        try:
+            async for message in websocket:
+                received_ns = time.perf_counter_ns()
+                self.liveness.seen(websocket)
+                data = self.pipeline.decode(message)
+                METRICS.observe("ws_decode", (time.perf_counter_ns() - received_ns) / 1e6)
+                if data is None:
+                    METRICS.inc("ws_bad_messages")
+                    continue
+                # Replies to commands sent through the device's session
+                if "ret" in data:
+                    self.devices.dispatch_reply(data, session)
+                    continue
+                if data.get("cmd") == "reg":
+                    # Protocol devices identify themselves by "sn" and can be sent commands
+                    device_serial = device_serial or data.get("sn")
+                    await websocket.send(self.pipeline.encode({
+                        "ret": "reg", "result": True,
+                        "cloudtime": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    }))
+                    if device_serial and session is None:
+                        session = DeviceSession(device_serial, websocket, protocol=True)
+                        self.devices.add(session)
+                        self._device_connected(device_serial, websocket)
+                    continue
+                if data.get("cmd") == "sendlog" and self.access is not None:
+                    # The device holds the door until this reply arrives
+                    reply, events = self.access.answer_sendlog(data, device_serial)
+                    await websocket.send(self.pipeline.encode(reply))
+                    decision_us = self.access.record_latency(received_ns)
+                    METRICS.observe("access_reply", decision_us / 1000.0)
+                    for event in events:
+                        event["decision_us"] = decision_us
+                        await self.pipeline.submit(event, event["device_serial"])
+                    continue
+                if not device_serial:
+                    device_serial = data.get("device_serial", None)
+                    if device_serial:
+                        session = DeviceSession(device_serial, websocket)
+                        self.devices.add(session)
+                        self._device_connected(device_serial, websocket)
+                if self.access is not None and data.get("card_number"):
+                    data["decision"], _ = self.access.decide(card=data.get("card_number"))
+                    data["decision_us"] = self.access.record_latency(received_ns)
+                    METRICS.observe("access_decision", data["decision_us"] / 1000.0)
+                # Waits here when this device's queue is full, so a flooding device
+                # is throttled without holding up the others
+                await self.pipeline.submit(data, device_serial)
+        except websockets.ConnectionClosed:
+            # Closed while a reply was being sent
+            pass
+        finally:
+            if session is not None:
+                self.liveness.disconnected(websocket)
+                self.devices.remove(session)
+                self._device_disconnected(session.serial)
+
+    def _device_connected(self, device_serial, websocket):
+        self.liveness.connected(device_serial, websocket)
+        with self._lock:
+            count = self.connected_devices.get(device_serial, 0)
+            self.connected_devices[device_serial] = count + 1
+        if count == 0:
+            self.device_connected.emit(device_serial)
+
+    def _device_disconnected(self, device_serial):
+        with self._lock:
+            count = self.connected_devices.pop(device_serial, 0) - 1
+            if count > 0:
+                self.connected_devices[device_serial] = count
+        if count <= 0:
+            self.pipeline.device_disconnected(device_serial)
+            self.device_disconnected.emit(device_serial)
+
+    async def start_server(self):
+        self.devices.loop = asyncio.get_running_loop()
+        await self.pipeline.start(self.record_ready.emit)
+        liveness = asyncio.create_task(self.liveness.run())
+        try:
+            # Keepalive pings are sent by the liveness monitor
+            async with websockets.serve(self.ws_handler, self.host, self.port, ping_interval=None):
+                while not self._stop_event.is_set():
+                    await asyncio.sleep(0.2)
+        finally:
+            liveness.cancel()
+            await self.pipeline.stop()
+
+    def run(self):
+        asyncio.run(self.start_server())
+
+    def stop(self):
+        self._stop_event.set()
+        self.wait()
+
+class MainDashboard(QtWidgets.QMainWindow):
+    snapshot_encoder_done = QtCore.pyqtSignal(object)
+    log_sync_done = QtCore.pyqtSignal(str, float, int)
+
+    def __init__(self):
+        super().__init__()
+        self.current_language = "en"
+        self.setWindowTitle(EN_TEXTS["dashboard"])
+        self.resize(1400, 900)
+        self.log_writer = LogWriter()
+        self.log_writer.start()
+        # Moves old logs into monthly archives and ages out photos, in the background
+        self.retention = RetentionManager(self.log_writer)
+        self.user_cache = UserCache()
+        self.user_cache.load()
+        self.reports_engine = ReportsEngine()
+        self.access = AccessDecisionEngine(DB_PATH)
+
+        central = QtWidgets.QWidget()
+        self.setCentralWidget(central)
+        self.vbox = QtWidgets.QVBoxLayout(central)
+
+        self.top_bar = QtWidgets.QHBoxLayout()
+        self.lbl_title = QtWidgets.QLabel(EN_TEXTS["dashboard"])
+        self.lbl_title.setStyleSheet("font-size: 16px; font-weight: bold;")
+        self.top_bar.addWidget(self.lbl_title)
+        self.status_frame = QtWidgets.QFrame()
+        self.status_frame.setFixedSize(20, 20)
+        self.status_frame.setStyleSheet("background: red; border-radius: 10px;")
+        self.top_bar.addWidget(self.status_frame)
+        self.lbl_status = QtWidgets.QLabel(EN_TEXTS["device_status"].format(EN_TEXTS["offline"]))
+        self.top_bar.addWidget(self.lbl_status)
+        self.top_bar.addStretch()
+        self.btn_settings = QtWidgets.QPushButton(EN_TEXTS["settings"])
+        self.btn_user_mgmt = QtWidgets.QPushButton(EN_TEXTS["user_mgmt"])
+        self.btn_reports = QtWidgets.QPushButton(EN_TEXTS["reports"])
+        self.btn_diagnostics = QtWidgets.QPushButton(EN_TEXTS["diagnostics"])
+        self.btn_logout = QtWidgets.QPushButton(EN_TEXTS["logout"])
+        self.btn_settings.clicked.connect(self.open_settings)
+        self.btn_user_mgmt.clicked.connect(self.open_user_management)
+        self.btn_reports.clicked.connect(self.open_reports)
+        self.btn_diagnostics.clicked.connect(self.open_diagnostics)
+        self.btn_logout.clicked.connect(self.logout)
+        self.top_bar.addWidget(self.btn_settings)
+        self.top_bar.addWidget(self.btn_user_mgmt)
+        self.top_bar.addWidget(self.btn_reports)
+        self.top_bar.addWidget(self.btn_diagnostics)
+        self.top_bar.addWidget(self.btn_logout)
+        self.vbox.addLayout(self.top_bar)
+
+        self.middle = QtWidgets.QHBoxLayout()
+        self.cam_vbox = QtWidgets.QVBoxLayout()
+        self.cam_vbox.setSpacing(10)
+        self.cam_vbox.setContentsMargins(0, 0, 0, 0)
+
+        self.lbl_entrance = QtWidgets.QLabel(EN_TEXTS["entrance"])
+        self.lbl_entrance.setStyleSheet("font-size: 14px;")
+        self.cam_vbox.addWidget(self.lbl_entrance)
+        self.entranceCameraFeed = QtWidgets.QLabel(EN_TEXTS["no_feed"])
+        self.entranceCameraFeed.setFixedSize(320, 180)
+        self.entranceCameraFeed.setStyleSheet("background: #333; color: #fff; border: 1px solid #999;")
+        self.entranceCameraFeed.setAlignment(QtCore.Qt.AlignCenter)
+        self.cam_vbox.addWidget(self.entranceCameraFeed)
+
+        self.lbl_exit = QtWidgets.QLabel(EN_TEXTS["exit"])
+        self.lbl_exit.setStyleSheet("font-size: 14px;")
+        self.cam_vbox.addWidget(self.lbl_exit)
+        self.exitCameraFeed = QtWidgets.QLabel(EN_TEXTS["no_feed"])
+        self.exitCameraFeed.setFixedSize(320, 180)
+        self.exitCameraFeed.setStyleSheet("background: #333; color: #fff; border: 1px solid #999;")
+        self.exitCameraFeed.setAlignment(QtCore.Qt.AlignCenter)
+        self.cam_vbox.addWidget(self.exitCameraFeed)
+
+        self.lbl_last_inout = QtWidgets.QLabel(EN_TEXTS["last_inout"])
+        self.lbl_last_inout.setStyleSheet("font-size: 14px;")
+        self.cam_vbox.addWidget(self.lbl_last_inout)
+        self.lastInOutImage = QtWidgets.QLabel(EN_TEXTS["no_image"])
+        self.lastInOutImage.setFixedSize(320, 180)
+        self.lastInOutImage.setStyleSheet("background: #222; color: #fff; border: 2px solid #39f;")
+        self.lastInOutImage.setAlignment(QtCore.Qt.AlignCenter)
+        self.cam_vbox.addWidget(self.lastInOutImage)
+        self.cam_vbox.addStretch()
+        self.middle.addLayout(self.cam_vbox, 1)
+
+        self.logs_vbox = QtWidgets.QVBoxLayout()
+        self.lbl_live_logs = QtWidgets.QLabel(EN_TEXTS["live_logs"])
+        self.lbl_live_logs.setStyleSheet("font-size: 16px; font-weight: bold;")
+        self.logs_vbox.addWidget(self.lbl_live_logs)
+        log_headers = [
+            EN_TEXTS["table_headers"][0],  # Date
+            EN_TEXTS["table_headers"][1],  # Time
+            EN_TEXTS["table_headers"][2],  # User Name
+            EN_TEXTS["table_headers"][3],  # User ID
+            EN_TEXTS["table_headers"][4],  # Direction
+            EN_TEXTS["table_headers"][5],  # Unit
+            EN_TEXTS["table_headers"][6],  # Plate
+            EN_TEXTS["table_headers"][7],  # Permission
+        ]
+        self.logModel = LiveLogModel(log_headers, max_rows=LIVE_LOG_MAX_ROWS)
+        self.logTable = QtWidgets.QTableView()
+        self.logTable.setModel(self.logModel)
+        self.logTable.horizontalHeader().setStretchLastSection(True)
+        self.logTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.logTable.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
+        farsi_font = QtGui.QFont("Tahoma")
+        self.logTable.setFont(farsi_font)
+        self.logs_vbox.addWidget(self.logTable)
+        # Rows arriving within one flush interval are inserted in a single batch
+        self._pending_log_rows = []
+        self._log_flush_timer = QtCore.QTimer(self)
+        self._log_flush_timer.setSingleShot(True)
+        self._log_flush_timer.setInterval(LIVE_LOG_FLUSH_MS)
+        self._log_flush_timer.timeout.connect(self.flush_log_rows)
+        self.middle.addLayout(self.logs_vbox, 2)
+
+        self.vbox.addLayout(self.middle, 1)
+
+        self.bottom_bar = QtWidgets.QHBoxLayout()
+        self.lbl_sync_date = QtWidgets.QLabel(EN_TEXTS["last_sync_date"] + " --")
+        self.lbl_sync_time = QtWidgets.QLabel(EN_TEXTS["last_sync_time"] + " --")
+        self.bottom_bar.addWidget(self.lbl_sync_date)
+        self.bottom_bar.addWidget(self.lbl_sync_time)
+        self.bottom_bar.addStretch()
+        self.lbl_language = QtWidgets.QLabel(EN_TEXTS["language"])
+        self.bottom_bar.addWidget(self.lbl_language)
+        self.combo_lang = QtWidgets.QComboBox()
+        self.combo_lang.addItems([EN_TEXTS["english"], EN_TEXTS["farsi"]])
+        self.combo_lang.currentIndexChanged.connect(self.change_language)
+        self.bottom_bar.addWidget(self.combo_lang)
+        self.vbox.addLayout(self.bottom_bar)
+
+        # Both views share one decoder when the URLs are the same
+        self.cameras = CameraRegistry()
+        self.entrance_camera = self.cameras.subscribe(ENTRANCE_CAMERA_URL, 320, 180)
+        self.entrance_camera.image_update.connect(self.update_entrance_camera)
+        self.entrance_camera.camera.error.connect(self.entrance_error)
+
+        self.exit_camera = self.cameras.subscribe(EXIT_CAMERA_URL, 320, 180)
+        self.exit_camera.image_update.connect(self.update_exit_camera)
+        self.exit_camera.camera.error.connect(self.exit_error)
+        for camera in self.cameras.cameras():
+            camera.enable_ring(fps=SNAPSHOT_RING_FPS, max_bytes=SNAPSHOT_RING_MAX_BYTES)
+        self.snapshots = SnapshotService(self.camera_for_direction)
+
+        self.snapshot_encoder = SnapshotEncoder(quality=SNAPSHOT_JPEG_QUALITY)
+        self.snapshot_encoder_done.connect(self.on_snapshot_encoded)
+        self._last_snapshot = None
+        self.pipeline = EventPipeline(self.log_writer, self.user_cache, snapshots=self.snapshots,
+                                      encoder=self.snapshot_encoder)
+        self.ws_server_thread = WebSocketServerThread(self.pipeline, access=self.access, port=WEBSOCKET_PORT)
+        self.ws_server_thread.record_ready.connect(self.on_log_received)
+        self.online_devices = set()
+        self.ws_server_thread.device_connected.connect(self.on_device_connected)
+        self.ws_server_thread.device_disconnected.connect(self.on_device_disconnected)
+        self.device_sync = DeviceSync(self.ws_server_thread.devices, DB_PATH)
+        # Logs buffered on a device while it was offline are fetched when it registers
+        self.log_catchup = LogCatchup(self.ws_server_thread.devices, self.log_writer, DB_PATH,
+                                      on_synced=self.log_sync_done.emit)
+        self.log_sync_done.connect(self.on_log_sync_done)
+        self._last_sync = self.log_catchup.last_sync()
+        self.show_last_sync()
+        self.register_metrics()
+        self.retention.start()
+        self.watchdog = StallWatchdog(GUI_STALL_THRESHOLD_MS, log_path=STALL_LOG_PATH, parent=self)
+        self.watchdog.start()
+        self.ws_server_thread.start()
+
+    def register_metrics(self):
+        # Read only when the endpoint, dump or diagnostics dialog asks
+        METRICS.register("pipeline_queue_depth", lambda: self.pipeline.queue.qsize() if self.pipeline.queue else 0)
+        METRICS.register("log_writer_queue_depth", self.log_writer.queue.qsize)
+        METRICS.register("snapshot_encoder_pending", lambda: self.snapshot_encoder.stats()["pending"])
+        METRICS.register("snapshot_encoder_errors", lambda: self.snapshot_encoder.errors, counter=True)
+        METRICS.register("snapshot_encoder_dropped", lambda: self.snapshot_encoder.dropped, counter=True)
+        METRICS.register("gui_pending_rows", lambda: len(self._pending_log_rows))
+        METRICS.register("devices_online", lambda: len(self.online_devices))
+        METRICS.register("events_received", lambda: self.pipeline.received, counter=True)
+        METRICS.register("events_processed", lambda: self.pipeline.processed, counter=True)
+        METRICS.register("event_errors", lambda: self.pipeline.errors, counter=True)
+        METRICS.register("log_rows_written", lambda: self.log_writer.rows_written, counter=True)
+        METRICS.register("log_write_errors", lambda: self.log_writer.errors, counter=True)
+        METRICS.register("access_decisions", lambda: self.access.decisions, counter=True)
+        METRICS.register("device_pings", lambda: self.ws_server_thread.liveness.pings, counter=True)
+        METRICS.register("devices_dropped_stale", lambda: self.ws_server_thread.liveness.stale, counter=True)
+        METRICS.register("device_reconnects", lambda: sum(
+            device["reconnects"] for device in self.ws_server_thread.liveness.stats()["devices"].values()), counter=True)
+        METRICS.register("logs_archived", lambda: self.retention.rows_archived, counter=True)
+        METRICS.register("photo_files_deleted", lambda: self.retention.photo_files_deleted, counter=True)
+        METRICS.register("retention_errors", lambda: self.retention.errors, counter=True)
+        self.metrics_server = None
+        if METRICS_HTTP_PORT is not None:
+            self.metrics_server = MetricsServer(port=METRICS_HTTP_PORT)
+            try:
+                self.metrics_server.start()
+            except OSError:
+                # Port in use, e.g. a second instance; the dialog still works
+                self.metrics_server = None
+        self.metrics_dumper = None
+        if METRICS_DUMP_PATH:
+            self.metrics_dumper = MetricsDumper(METRICS_DUMP_PATH, interval=METRICS_DUMP_INTERVAL_S)
+            self.metrics_dumper.start()
+
+    def on_device_connected(self, device_serial):
+        self.online_devices.add(device_serial)
+        self.show_device_status()
+
+    def on_device_disconnected(self, device_serial):
+        self.online_devices.discard(device_serial)
+        self.show_device_status()
+
+    def show_device_status(self):
+        texts = FARSI_TEXTS if self.current_language == "fa" else EN_TEXTS
+        device_serials = sorted(self.online_devices)
+        if device_serials:
+            status_text = texts["online"]
+            device_list = "، ".join(device_serials) if self.current_language == "fa" else ", ".join(device_serials)
+            self.status_frame.setStyleSheet("background: green; border-radius: 10px;")
+            self.lbl_status.setText(f"{texts['device_status'].format(status_text)} | {device_list}")
+        else:
+            status_text = texts["offline"]
+            self.status_frame.setStyleSheet("background: red; border-radius: 10px;")
+            self.lbl_status.setText(texts["device_status"].format(status_text))
+
+    def on_log_sync_done(self, device_serial, synced_at, inserted):
+        self._last_sync = synced_at
+        self.show_last_sync()
+
+    def show_last_sync(self):
+        texts = FARSI_TEXTS if self.current_language == "fa" else EN_TEXTS
+        if self._last_sync:
+            date, time_str = get_datetimes(self.current_language, datetime.datetime.fromtimestamp(self._last_sync))
+        else:
+            date, time_str = "--", "--"
+        self.lbl_sync_date.setText(texts["last_sync_date"] + " " + date)
+        self.lbl_sync_time.setText(texts["last_sync_time"] + " " + time_str)
+
+    def entrance_error(self, msg):
+        self.entranceCameraFeed.setText(FARSI_TEXTS["no_feed"] if self.current_language == "fa" else EN_TEXTS["no_feed"])
+
+    def exit_error(self, msg):
+        self.exitCameraFeed.setText(FARSI_TEXTS["no_feed"] if self.current_language == "fa" else EN_TEXTS["no_feed"])
+
+    def update_entrance_camera(self, image):
+        self.entranceCameraFeed.setPixmap(QtGui.QPixmap.fromImage(image))
+
+    def update_exit_camera(self, image):
+        self.exitCameraFeed.setPixmap(QtGui.QPixmap.fromImage(image))
+
+    def camera_for_direction(self, direction):
+        # Called from the WebSocket server thread by the snapshot service
+        view = self.entrance_camera if direction.lower() == "in" else self.exit_camera
+        return view.camera
+
+    def closeEvent(self, event):
+        self.watchdog.stop()
+        self.cameras.stop_all()
+        self.ws_server_thread.stop()
+        self.snapshot_encoder.shutdown()
+        self.retention.stop()
+        self.log_writer.flush(timeout=5.0)
+        self.log_writer.shutdown()
+        self.reports_engine.close()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.metrics_dumper is not None:
+            self.metrics_dumper.stop()
+        super().closeEvent(event)
+
+    def on_log_received(self, record):
+        # record is built by EventPipeline; only widget updates happen here
+        METRICS.since("gui_delivery", record["ready_at"])
+        self._pending_log_rows.append(LiveLogRecord.from_display_record(record))
+        if not self._log_flush_timer.isActive():
+            self._log_flush_timer.start()
+
+        # The thumbnail is shown once the encoder has written it
+        future = record["snapshot"]
+        self._last_snapshot = future
+        if future is None:
+            self.capture_picture_for_log(None)
+        else:
+            future.add_done_callback(self.snapshot_encoder_done.emit)
+
+    def flush_log_rows(self):
+        rows, self._pending_log_rows = self._pending_log_rows, []
+        started = time.perf_counter()
+        self.logModel.add_records(rows)
+        METRICS.since("table_update", started)
+
+    def on_snapshot_encoded(self, future):
+        # Ignore thumbnails that finish after a newer event has arrived
+        if future is not self._last_snapshot:
+            return
+        frame = None if future.exception() else future.result().thumbnail
+        self.capture_picture_for_log(frame)
+
+    def capture_picture_for_log(self, frame):
+        # frame is the encoder's RGB thumbnail, already scaled to the label size
+        if frame is not None:
+            h, w, ch = frame.shape
+            bytes_per_line = ch * w
+            qt_image = QtGui.QImage(
+                frame.data, w, h, bytes_per_line, QtGui.QImage.Format_RGB888)
+            self.lastInOutImage.setPixmap(QtGui.QPixmap.fromImage(qt_image))
+        else:
+            texts = FARSI_TEXTS if self.current_language == "fa" else EN_TEXTS
+            self.lastInOutImage.setText(texts["no_image"])
+
+    def change_language(self, index):
+        if index == 1:
+            self.current_language = "fa"
+            self.setLayoutDirection(QtCore.Qt.RightToLeft)
+            texts = FARSI_TEXTS
+        else:
+            self.current_language = "en"
+            self.setLayoutDirection(QtCore.Qt.LeftToRight)
+            texts = EN_TEXTS
+        self.pipeline.language = self.current_language
+        self.log_catchup.language = self.current_language
+
+        self.setWindowTitle(texts["dashboard"])
+        self.lbl_title.setText(texts["dashboard"])
+        self.lbl_entrance.setText(texts["entrance"])
+        self.lbl_exit.setText(texts["exit"])
+        self.lbl_last_inout.setText(texts["last_inout"])
+        self.entranceCameraFeed.setText(texts["no_feed"])
+        self.exitCameraFeed.setText(texts["no_feed"])
+        self.lastInOutImage.setText(texts["no_image"])
+        self.lbl_live_logs.setText(texts["live_logs"])
+        self.btn_settings.setText(texts["settings"])
+        self.btn_user_mgmt.setText(texts["user_mgmt"])
+        self.btn_reports.setText(texts["reports"])
+        self.btn_diagnostics.setText(texts["diagnostics"])
+        self.btn_logout.setText(texts["logout"])
+        self.show_device_status()
+        self.show_last_sync()
+        self.lbl_language.setText(texts["language"])
+        self.combo_lang.setItemText(0, EN_TEXTS["english"])
+        self.combo_lang.setItemText(1, EN_TEXTS["farsi"])
+        log_headers = [
+            texts["table_headers"][0],
+            texts["table_headers"][1],
+            texts["table_headers"][2],
+            texts["table_headers"][3],
+            texts["table_headers"][4],
+            texts["table_headers"][5],
+            texts["table_headers"][6],
+            texts["table_headers"][7],
+        ]
+        font = QtGui.QFont("Tahoma") if self.current_language == "fa" else QtGui.QFont()
+        self.logTable.setFont(font)
+        alignment = QtCore.Qt.AlignRight if self.current_language == "fa" else QtCore.Qt.AlignLeft
+        self.logModel.set_headers(log_headers, alignment)
+
+    def open_settings(self):
+        QtWidgets.QMessageBox.information(self, "Settings", "Settings dialog not implemented.")
+
+    def open_user_management(self):
+        dlg = UserManagementDialog(self, user_cache=self.user_cache, device_sync=self.device_sync,
+                                   access=self.access)
+        dlg.exec_()
+
+    def open_reports(self):
+        dlg = ReportsDialog(self, language=self.current_language, engine=self.reports_engine)
+        dlg.exec_()
+
+    def open_diagnostics(self):
+        dlg = DiagnosticsDialog(self, watchdog=self.watchdog, liveness=self.ws_server_thread.liveness)
+        dlg.exec_()
+
+    def logout(self):
+        QtWidgets.QMessageBox.information(self, "Logout", "Logout not implemented.")
+
+if __name__ == "__main__":
+    # Requires: pip install websockets PyQt5 opencv-python jdatetime (openpyxl for .xlsx exports)
+    init_db()
+    app = QtWidgets.QApplication(sys.argv)
+    window = MainDashboard()
+    # kill -USR2 <pid> starts/stops the sampling profiler (written to profiles/)
+    window.watchdog.install_signal_toggle()
+    QtCore.QTimer.singleShot(0, window.showMaximized)
     sys.exit(app.exec_())
\ No newline at end of file
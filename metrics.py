@@ -0,0 +1,380 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PyQt5 import QtWidgets, QtCore
+
+# Upper bounds in milliseconds. A stage keeps one counter per bucket instead
+# of every sample, so observing is a bisect and an increment and memory does
+# not grow with traffic.
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+METRIC_PREFIX = "faralite_"
+
+def bucket_percentile(counts, q, max_ms):
+    # Estimated q-quantile (0..1) from bucket counts, interpolating inside the bucket
+    total = sum(counts)
+    if not total:
+        return 0.0
+    target = q * total
+    seen = 0
+    lower = 0.0
+    for bound, count in zip(BUCKETS_MS, counts):
+        if count and seen + count >= target:
+            if bound == float("inf"):
+                return max_ms
+            return min(max_ms, lower + (bound - lower) * (target - seen) / count)
+        seen += count
+        lower = bound
+    return max_ms
+
+class StageHistogram:
+    __slots__ = ("counts", "count", "total_ms", "max_ms", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms):
+        i = bisect.bisect_left(BUCKETS_MS, ms)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total_ms += ms
+            if ms > self.max_ms:
+                self.max_ms = ms
+
+    def snapshot(self):
+        with self._lock:
+            return {"count": self.count, "total_ms": self.total_ms, "max_ms": self.max_ms,
+                    "buckets": list(self.counts)}
+
+class MetricsRegistry:
+    # Per-stage latency histograms, event counters, and gauges that are only
+    # evaluated when someone reads them (queue depths, existing stats()), so
+    # the hot paths pay for a perf_counter() call and one histogram update.
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def stage(self, name):
+        histogram = self._stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(name, StageHistogram())
+        return histogram
+
+    def observe(self, name, ms):
+        self.stage(name).observe(ms)
+
+    def since(self, name, started):
+        # started is a time.perf_counter() value; returns the elapsed ms
+        ms = (time.perf_counter() - started) * 1000.0
+        self.stage(name).observe(ms)
+        return ms
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def register(self, name, read, counter=False):
+        # read() returns a number; counter=True for values that only grow
+        with self._lock:
+            self._gauges[name] = (read, counter)
+
+    def unregister(self, name):
+        with self._lock:
+            self._gauges.pop(name, None)
+
+    def snapshot(self):
+        with self._lock:
+            stages = list(self._stages.items())
+            counters = dict(self._counters)
+            gauges = list(self._gauges.items())
+        values = {}
+        for name, (read, counter) in gauges:
+            try:
+                value = read()
+            except Exception:
+                continue
+            if counter:
+                counters[name] = value
+            else:
+                values[name] = value
+        return {
+            "time": time.time(),
+            "uptime_s": time.time() - self.started,
+            "stages": {name: histogram.snapshot() for name, histogram in sorted(stages)},
+            "counters": counters,
+            "gauges": values,
+        }
+
+    def summary(self):
+        # snapshot() with p50/p90/p99 per stage instead of raw buckets
+        snapshot = self.snapshot()
+        for stats in snapshot["stages"].values():
+            buckets = stats.pop("buckets")
+            for q in (50, 90, 99):
+                stats[f"p{q}_ms"] = bucket_percentile(buckets, q / 100, stats["max_ms"])
+            stats["avg_ms"] = stats["total_ms"] / stats["count"] if stats["count"] else 0.0
+        return snapshot
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {METRIC_PREFIX}stage_seconds Time spent in each stage of event handling and capture",
+            f"# TYPE {METRIC_PREFIX}stage_seconds histogram",
+        ]
+        for name, stats in snapshot["stages"].items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS_MS, stats["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound / 1000.0)
+                lines.append(f'{METRIC_PREFIX}stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{METRIC_PREFIX}stage_seconds_sum{{stage="{name}"}} {stats["total_ms"] / 1000.0!r}')
+            lines.append(f'{METRIC_PREFIX}stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name}_total counter")
+            lines.append(f"{METRIC_PREFIX}{name}_total {value}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} gauge")
+            lines.append(f"{METRIC_PREFIX}{name} {value}")
+        lines.append(f"# TYPE {METRIC_PREFIX}uptime_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}uptime_seconds {snapshot['uptime_s']:.3f}")
+        return "\n".join(lines) + "\n"
+
+# Shared by every module; stages are created on first use
+METRICS = MetricsRegistry()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = METRICS
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = self.registry.prometheus_text().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(self.registry.summary(), indent=2).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MetricsServer:
+    # GET /metrics (Prometheus text) and /metrics.json on a local port, served
+    # from its own thread. Bound to localhost unless told otherwise.
+    def __init__(self, registry=METRICS, host="127.0.0.1", port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        # Raises OSError if the port is taken
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": self.registry})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+class MetricsDumper(threading.Thread):
+    # Rewrites path with registry.summary() every interval seconds, for sites
+    # where nothing scrapes the HTTP endpoint
+    def __init__(self, path, registry=METRICS, interval=60.0):
+        super().__init__(name="MetricsDumper", daemon=True)
+        self.path = path
+        self.registry = registry
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.registry.summary(), f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def stop(self):
+        self._stop_event.set()
+        self.dump()
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+
+class DiagnosticsDialog(QtWidgets.QDialog):
+    # Per-stage latency over the last WINDOW_S seconds (from bucket count
+    # differences, so the numbers follow what is happening now), plus the
+    # current queue depths and counters
+    REFRESH_MS = 1000
+    WINDOW_S = 10.0
+
+    def __init__(self, parent=None, registry=METRICS, watchdog=None, liveness=None):
+        super().__init__(parent)
+        self.registry = registry
+        # Optional StallWatchdog: shows the last stall and toggles its profiler
+        self.watchdog = watchdog
+        # Optional LivenessMonitor: per-device uptime and reconnects
+        self.liveness = liveness
+        self.setWindowTitle("Diagnostics")
+        self.resize(760, 560)
+        self.layout = QtWidgets.QVBoxLayout(self)
+
+        self.layout.addWidget(QtWidgets.QLabel(f"Stage latency (last {int(self.WINDOW_S)} s)"))
+        self.stage_table = QtWidgets.QTableWidget(0, 7)
+        self.stage_table.setHorizontalHeaderLabels(
+            ["Stage", "Count", "Per Second", "p50 ms", "p90 ms", "p99 ms", "Max ms (all time)"])
+        self.stage_table.horizontalHeader().setStretchLastSection(True)
+        self.stage_table.setEditTriggers(QtWidgets.QTableWidget.NoEditTriggers)
+        self.stage_table.verticalHeader().setVisible(False)
+        self.layout.addWidget(self.stage_table, 2)
+
+        self.layout.addWidget(QtWidgets.QLabel("Queues and counters"))
+        self.value_table = QtWidgets.QTableWidget(0, 2)
+        self.value_table.setHorizontalHeaderLabels(["Name", "Value"])
+        self.value_table.horizontalHeader().setStretchLastSection(True)
+        self.value_table.setEditTriggers(QtWidgets.QTableWidget.NoEditTriggers)
+        self.value_table.verticalHeader().setVisible(False)
+        self.layout.addWidget(self.value_table, 1)
+
+        self.lbl_devices = QtWidgets.QLabel("Devices")
+        self.layout.addWidget(self.lbl_devices)
+        self.device_table = QtWidgets.QTableWidget(0, 7)
+        self.device_table.setHorizontalHeaderLabels(
+            ["Serial", "Online", "Uptime", "Availability", "Reconnects", "Dropped Stale", "Last Seen"])
+        self.device_table.horizontalHeader().setStretchLastSection(True)
+        self.device_table.setEditTriggers(QtWidgets.QTableWidget.NoEditTriggers)
+        self.device_table.verticalHeader().setVisible(False)
+        self.layout.addWidget(self.device_table, 1)
+        self.lbl_devices.setVisible(liveness is not None)
+        self.device_table.setVisible(liveness is not None)
+
+        self.lbl_stall = QtWidgets.QLabel("")
+        self.lbl_stall.setWordWrap(True)
+        self.lbl_stall.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
+        self.layout.addWidget(self.lbl_stall)
+
+        btn_layout = QtWidgets.QHBoxLayout()
+        self.lbl_uptime = QtWidgets.QLabel("")
+        btn_layout.addWidget(self.lbl_uptime)
+        btn_layout.addStretch()
+        self.btn_profile = QtWidgets.QPushButton("Start Profiling")
+        self.btn_profile.clicked.connect(self.toggle_profiler)
+        btn_layout.addWidget(self.btn_profile)
+        self.lbl_stall.setVisible(watchdog is not None)
+        self.btn_profile.setVisible(watchdog is not None)
+        self.btn_close = QtWidgets.QPushButton("Close")
+        self.btn_close.clicked.connect(self.accept)
+        btn_layout.addWidget(self.btn_close)
+        self.layout.addLayout(btn_layout)
+
+        self._history = deque()
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(self.REFRESH_MS)
+        self.refresh()
+
+    def refresh(self):
+        snapshot = self.registry.snapshot()
+        now = time.monotonic()
+        self._history.append((now, snapshot["stages"]))
+        while len(self._history) > 1 and now - self._history[1][0] >= self.WINDOW_S:
+            self._history.popleft()
+        then, old_stages = self._history[0]
+        elapsed = now - then
+
+        self.stage_table.setRowCount(len(snapshot["stages"]))
+        for row, (name, stats) in enumerate(snapshot["stages"].items()):
+            old = old_stages.get(name)
+            if old is not None:
+                buckets = [new - prev for new, prev in zip(stats["buckets"], old["buckets"])]
+            else:
+                buckets = stats["buckets"]
+            count = sum(buckets)
+            values = [name, str(count), f"{count / elapsed:.1f}" if elapsed > 0 else "--"]
+            values += [f"{bucket_percentile(buckets, q, stats['max_ms']):.2f}" if count else "--"
+                       for q in (0.5, 0.9, 0.99)]
+            values.append(f"{stats['max_ms']:.2f}")
+            for column, value in enumerate(values):
+                self.stage_table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+
+        values = sorted(snapshot["gauges"].items()) + sorted(snapshot["counters"].items())
+        self.value_table.setRowCount(len(values))
+        for row, (name, value) in enumerate(values):
+            self.value_table.setItem(row, 0, QtWidgets.QTableWidgetItem(name))
+            text = f"{value:.2f}" if isinstance(value, float) else str(value)
+            self.value_table.setItem(row, 1, QtWidgets.QTableWidgetItem(text))
+        self.lbl_uptime.setText(f"Uptime: {int(snapshot['uptime_s'])} s")
+        if self.watchdog is not None:
+            self.show_watchdog()
+        if self.liveness is not None:
+            self.show_devices()
+
+    def show_devices(self):
+        devices = sorted(self.liveness.stats()["devices"].items())
+        self.device_table.setRowCount(len(devices))
+        for row, (serial, stats) in enumerate(devices):
+            last_seen = stats["last_seen"]
+            values = [
+                serial,
+                "Yes" if stats["online"] else "No",
+                format_duration(stats["uptime_s"]),
+                f"{stats['availability'] * 100:.1f}%",
+                str(stats["reconnects"]),
+                str(stats["stale"]),
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_seen)) if last_seen else "--",
+            ]
+            for column, value in enumerate(values):
+                self.device_table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
+
+    def show_watchdog(self):
+        profiler = self.watchdog.profiler
+        report = self.watchdog.last_report()
+        lines = [f"GUI stalls over {self.watchdog.threshold_ms} ms: {self.watchdog.stalls}, "
+                 f"longest {self.watchdog.longest_ms:.0f} ms"]
+        if report is not None:
+            when = time.strftime("%H:%M:%S", time.localtime(report["time"]))
+            lines.append(f"Last at {when}, {report['duration_ms']:.0f} ms in {report['slot']}")
+        if profiler.running:
+            lines.append(f"Profiling: {profiler.samples} samples")
+        elif profiler.last_path:
+            lines.append(f"Last profile: {os.path.abspath(profiler.last_path)}")
+        self.lbl_stall.setText("\n".join(lines))
+        self.btn_profile.setText("Stop Profiling" if profiler.running else "Start Profiling")
+
+    def toggle_profiler(self):
+        self.watchdog.profiler.toggle()
+        self.show_watchdog()
@@ -0,0 +1,284 @@
+import datetime
+import sqlite3
+
+from PyQt5 import QtWidgets, QtCore
+
+from user_management import DB_PATH
+from event_pipeline import get_datetimes
+from log_export import LogExportThread
+from retention import LogArchive, attach_archives, month_bounds, union_select
+
+REPORT_COLUMNS = (
+    "id", "ts", "user_name", "user_id", "direction", "unit", "plate", "permission", "device_serial", "photo_path"
+)
+
+class ReportFilter:
+    __slots__ = ("start_ts", "end_ts", "user_id", "device_serial", "direction")
+
+    def __init__(self, start_ts=None, end_ts=None, user_id=None, device_serial=None, direction=None):
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.user_id = user_id
+        self.device_serial = device_serial
+        # "in" / "out"; logs store the localized label, so both spellings are matched
+        self.direction = direction
+
+    def where(self):
+        clauses = []
+        params = []
+        if self.user_id:
+            clauses.append("user_id = ?")
+            params.append(str(self.user_id))
+        if self.device_serial:
+            clauses.append("device_serial = ?")
+            params.append(self.device_serial)
+        if self.start_ts is not None:
+            clauses.append("ts >= ?")
+            params.append(int(self.start_ts))
+        if self.end_ts is not None:
+            clauses.append("ts < ?")
+            params.append(int(self.end_ts))
+        if self.direction:
+            clauses.append("direction IN (?, ?)")
+            params.extend(("In", "ورود") if self.direction == "in" else ("Out", "خروج"))
+        return clauses, params
+
+class ReportPage:
+    __slots__ = ("rows", "next_cursor")
+
+    def __init__(self, rows, next_cursor):
+        self.rows = rows
+        # (ts, id) of the last row, passed back as `after` for the next page
+        self.next_cursor = next_cursor
+
+class ReportsEngine:
+    # Read side of the logs table. Pages are ordered newest first on
+    # (ts, id) and served from idx_logs_ts / idx_logs_user_ts /
+    # idx_logs_device_ts, so keyset scrolling costs the same at any depth.
+    # Months moved out by retention are attached from their archive files and
+    # queried in the same UNION ALL as the live table.
+    def __init__(self, db_path=DB_PATH, archive=None):
+        self.db_path = db_path
+        self.archive = archive or LogArchive()
+        self._conn = None
+        # schema -> month of the archives attached to _conn
+        self._attached = {}
+
+    def connection(self):
+        if self._conn is None:
+            # The schema and indexes are created by LogWriter at startup
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self._attached = {}
+
+    def _tables(self, months, live):
+        tables = attach_archives(self.connection(), self.archive, months, self._attached)
+        return ["main.logs"] + tables if live else tables
+
+    def _newest_first(self, report_filter, clauses, params, limit):
+        # Up to limit rows over the live table and the archives in range. The
+        # archive groups are newest first and each archive only holds its own
+        # month, so older groups are skipped once they cannot reach the page.
+        rows = []
+        groups = self.archive.groups(report_filter.start_ts, report_filter.end_ts)
+        for index, months in enumerate(groups):
+            if len(rows) == limit and months and month_bounds(months[0])[1] <= (rows[-1][1] or 0):
+                break
+            tables = self._tables(months, index == 0)
+            sql = union_select(REPORT_COLUMNS, tables, clauses) + " ORDER BY ts DESC, id DESC LIMIT ?"
+            rows.extend(self.connection().execute(sql, params * len(tables) + [limit]).fetchall())
+            if len(groups) > 1:
+                rows.sort(key=lambda row: (row[1] or 0, row[0]), reverse=True)
+                del rows[limit:]
+        return rows
+
+    def query(self, report_filter, after=None, limit=100):
+        clauses, params = report_filter.where()
+        if after is not None:
+            clauses.append("(ts, id) < (?, ?)")
+            params.extend(after)
+        rows = self._newest_first(report_filter, clauses, params, limit)
+        next_cursor = (rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+        return ReportPage(rows, next_cursor)
+
+    def page(self, report_filter, page, page_size=100):
+        # Offset paging for jumping to a page number; prefer query(after=...) for scrolling
+        clauses, params = report_filter.where()
+        rows = self._newest_first(report_filter, clauses, params, (page + 1) * page_size)
+        return rows[page * page_size:]
+
+    def count(self, report_filter):
+        clauses, params = report_filter.where()
+        total = 0
+        for index, months in enumerate(self.archive.groups(report_filter.start_ts, report_filter.end_ts)):
+            tables = self._tables(months, index == 0)
+            sql = "SELECT COUNT(*) FROM (" + union_select(("id",), tables, clauses) + ")"
+            total += self.connection().execute(sql, params * len(tables)).fetchone()[0]
+        return total
+
+class ReportsDialog(QtWidgets.QDialog):
+    PAGE_SIZE = 100
+
+    def __init__(self, parent=None, language="en", engine=None):
+        super().__init__(parent)
+        self.language = language
+        self.engine = engine or ReportsEngine()
+        self.setWindowTitle("Reports")
+        self.resize(900, 600)
+        self.layout = QtWidgets.QVBoxLayout(self)
+
+        form_layout = QtWidgets.QGridLayout()
+        now = QtCore.QDateTime.currentDateTime()
+        self.edit_from = QtWidgets.QDateTimeEdit(now.addDays(-1))
+        self.edit_from.setCalendarPopup(True)
+        form_layout.addWidget(QtWidgets.QLabel("From:"), 0, 0)
+        form_layout.addWidget(self.edit_from, 0, 1)
+        self.edit_to = QtWidgets.QDateTimeEdit(now.addSecs(60))
+        self.edit_to.setCalendarPopup(True)
+        form_layout.addWidget(QtWidgets.QLabel("To:"), 0, 2)
+        form_layout.addWidget(self.edit_to, 0, 3)
+        self.edit_user = QtWidgets.QLineEdit()
+        form_layout.addWidget(QtWidgets.QLabel("User ID:"), 1, 0)
+        form_layout.addWidget(self.edit_user, 1, 1)
+        self.edit_device = QtWidgets.QLineEdit()
+        form_layout.addWidget(QtWidgets.QLabel("Device:"), 1, 2)
+        form_layout.addWidget(self.edit_device, 1, 3)
+        self.combo_direction = QtWidgets.QComboBox()
+        self.combo_direction.addItems(["All", "In", "Out"])
+        form_layout.addWidget(QtWidgets.QLabel("Direction:"), 2, 0)
+        form_layout.addWidget(self.combo_direction, 2, 1)
+        self.btn_search = QtWidgets.QPushButton("Search")
+        self.btn_search.clicked.connect(self.search)
+        form_layout.addWidget(self.btn_search, 2, 3)
+        self.btn_export = QtWidgets.QPushButton("Export")
+        self.btn_export.clicked.connect(self.export)
+        form_layout.addWidget(self.btn_export, 2, 2)
+        self.layout.addLayout(form_layout)
+
+        self.table = QtWidgets.QTableWidget(0, 9)
+        self.table.setHorizontalHeaderLabels(
+            ["Date", "Time", "User Name", "User ID", "Direction", "Unit", "Plate", "Permission", "Device Code"])
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setEditTriggers(QtWidgets.QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QtWidgets.QTableWidget.SelectRows)
+        self.layout.addWidget(self.table)
+
+        nav_layout = QtWidgets.QHBoxLayout()
+        self.lbl_page = QtWidgets.QLabel("")
+        self.btn_prev = QtWidgets.QPushButton("Previous")
+        self.btn_next = QtWidgets.QPushButton("Next")
+        self.btn_prev.clicked.connect(self.prev_page)
+        self.btn_next.clicked.connect(self.next_page)
+        nav_layout.addWidget(self.lbl_page)
+        nav_layout.addStretch()
+        nav_layout.addWidget(self.btn_prev)
+        nav_layout.addWidget(self.btn_next)
+        self.layout.addLayout(nav_layout)
+
+        self.report_filter = None
+        self.total = 0
+        # Cursor that produced each page shown so far; None for the first page
+        self.cursors = []
+        self.next_cursor = None
+        self.export_thread = None
+        self.export_progress = None
+        self.search()
+
+    def current_filter(self):
+        direction = {1: "in", 2: "out"}.get(self.combo_direction.currentIndex())
+        return ReportFilter(
+            start_ts=self.edit_from.dateTime().toSecsSinceEpoch(),
+            end_ts=self.edit_to.dateTime().toSecsSinceEpoch(),
+            user_id=self.edit_user.text().strip() or None,
+            device_serial=self.edit_device.text().strip() or None,
+            direction=direction,
+        )
+
+    def search(self):
+        self.report_filter = self.current_filter()
+        try:
+            self.total = self.engine.count(self.report_filter)
+        except sqlite3.Error as e:
+            QtWidgets.QMessageBox.warning(self, "Error", f"Could not read logs: {e}")
+            return
+        self.cursors = []
+        self.show_page(None)
+
+    def next_page(self):
+        if self.next_cursor is not None:
+            self.show_page(self.next_cursor)
+
+    def prev_page(self):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+            self.show_page(self.cursors.pop())
+
+    def show_page(self, cursor):
+        try:
+            page = self.engine.query(self.report_filter, after=cursor, limit=self.PAGE_SIZE)
+        except sqlite3.Error as e:
+            QtWidgets.QMessageBox.warning(self, "Error", f"Could not read logs: {e}")
+            return
+        self.cursors.append(cursor)
+        self.next_cursor = page.next_cursor
+        self.table.setRowCount(len(page.rows))
+        for row_idx, row in enumerate(page.rows):
+            _, ts, user_name, user_id, direction, unit, plate, permission, device_serial, _ = row
+            date, time_str = get_datetimes(self.language, datetime.datetime.fromtimestamp(ts)) if ts else ("", "")
+            values = [date, time_str, user_name, user_id, direction, unit, plate, permission, device_serial]
+            for col_idx, value in enumerate(values):
+                self.table.setItem(row_idx, col_idx, QtWidgets.QTableWidgetItem(str(value) if value is not None else ""))
+        first = (len(self.cursors) - 1) * self.PAGE_SIZE
+        self.lbl_page.setText(f"{first + 1 if page.rows else 0}-{first + len(page.rows)} of {self.total}")
+        self.btn_prev.setEnabled(len(self.cursors) > 1)
+        self.btn_next.setEnabled(self.next_cursor is not None)
+
+    def export(self):
+        if self.export_thread is not None:
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export Logs", "logs.csv", "CSV (*.csv);;Excel (*.xlsx)")
+        if not path:
+            return
+        self.export_thread = LogExportThread(path, self.current_filter(), language=self.language,
+                                             db_path=self.engine.db_path, archive=self.engine.archive)
+        self.export_progress = QtWidgets.QProgressDialog("Exporting logs...", "Cancel", 0, 100, self)
+        self.export_progress.setWindowModality(QtCore.Qt.WindowModal)
+        self.export_progress.canceled.connect(self.export_thread.cancel)
+        self.export_thread.progress.connect(self.on_export_progress)
+        self.export_thread.finished_ok.connect(self.on_export_finished)
+        self.export_thread.failed.connect(self.on_export_failed)
+        self.export_thread.start()
+
+    def on_export_progress(self, done, total):
+        if self.export_progress and total:
+            self.export_progress.setValue(int(done * 100 / total))
+
+    def on_export_finished(self, path, rows):
+        self._end_export()
+        QtWidgets.QMessageBox.information(self, "Export", f"Exported {rows} rows to {path}.")
+
+    def on_export_failed(self, message):
+        self._end_export()
+        QtWidgets.QMessageBox.warning(self, "Export", message)
+
+    def _end_export(self):
+        self.export_thread.wait()
+        self.export_thread = None
+        if self.export_progress:
+            self.export_progress.close()
+            self.export_progress = None
+
+    def reject(self):
+        # Leave no export thread running behind a closed dialog
+        if self.export_thread is not None:
+            self.export_thread.cancel()
+            self.export_thread.wait()
+        super().reject()
@@ -0,0 +1,501 @@
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import cv2
+
+from log_writer import LOG_COLUMNS, init_logs_table
+from metrics import METRICS
+from snapshot_encoder import PHOTO_SAVE_DIR, photo_dir
+
+ARCHIVE_DIR = "archive"
+# Months kept in users.db besides the current one; older rows move to archive/logs-YYYY-MM.db
+LIVE_MONTHS = 1
+ARCHIVE_BATCH_ROWS = 1000
+# Archive files past this many months, or the oldest ones while the archive is
+# over ARCHIVE_MAX_BYTES, are deleted. None disables either limit.
+ARCHIVE_KEEP_MONTHS = 36
+ARCHIVE_MAX_BYTES = None
+# Event photos are recompressed (and their burst frames dropped) after
+# PHOTO_COMPRESS_AFTER_DAYS and deleted after PHOTO_KEEP_DAYS, or oldest day
+# first while photos/ is over PHOTO_MAX_BYTES. None disables a limit.
+PHOTO_COMPRESS_AFTER_DAYS = 30
+PHOTO_COMPRESS_QUALITY = 60
+PHOTO_COMPRESS_MAX_WIDTH = 960
+PHOTO_KEEP_DAYS = 365
+PHOTO_MAX_BYTES = None
+PHOTO_BATCH_FILES = 500
+# Each step stops taking on more files after this long
+STEP_BUDGET_S = 0.25
+STEP_PAUSE_S = 0.5
+IDLE_INTERVAL_S = 600
+VACUUM_PAGES_PER_STEP = 2000
+# users.db files created before auto_vacuum=INCREMENTAL are converted with
+# one full VACUUM once they have space to give back. Log writes wait while
+# it runs; False leaves them as they are (freed pages are then only reused).
+VACUUM_MIGRATE = True
+# SQLite allows 10 attached databases per connection
+ARCHIVE_ATTACH_LIMIT = 8
+
+ARCHIVE_NAME = re.compile(r"^logs-(\d{4}-\d{2})\.db$")
+# <serial>_<direction>_<timestamp>_<uuid8>[_thumb|_burstNN_+Xms].jpg, as written by SnapshotEncoder
+PHOTO_NAME = re.compile(r"_(?P<ts>\d+(?:\.\d+)?)_[0-9a-f]{8}(?:_thumb|_burst\d+_[+-]\d+ms)?\.jpg$")
+COMPRESSED_MARKER = ".compressed"
+COMPRESSING_MARKER = ".compressing"
+
+def month_key(ts):
+    return time.strftime("%Y-%m", time.localtime(ts))
+
+def add_months(month, count):
+    index = int(month[:4]) * 12 + int(month[5:7]) - 1 + count
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def month_bounds(month):
+    # (first second, first second of the next month) in local time
+    start = datetime.datetime(int(month[:4]), int(month[5:7]), 1)
+    end = datetime.datetime.strptime(add_months(month, 1), "%Y-%m")
+    return int(start.timestamp()), int(end.timestamp())
+
+def schema_name(month):
+    return "archive_" + month.replace("-", "_")
+
+class LogArchive:
+    # One SQLite file per month under archive_dir (logs-2026-08.db) with that
+    # month's rows, their original ids, and the live table's schema and
+    # indexes, so the same queries run against either.
+    def __init__(self, archive_dir=ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+
+    def path(self, month):
+        return os.path.join(self.archive_dir, f"logs-{month}.db")
+
+    def months(self):
+        try:
+            names = os.listdir(self.archive_dir)
+        except OSError:
+            return []
+        return sorted(match.group(1) for match in map(ARCHIVE_NAME.match, names) if match)
+
+    def create(self, month):
+        path = self.path(month)
+        if not os.path.exists(path):
+            os.makedirs(self.archive_dir, exist_ok=True)
+            conn = sqlite3.connect(path)
+            try:
+                init_logs_table(conn)
+            finally:
+                conn.close()
+        return path
+
+    def groups(self, start_ts=None, end_ts=None):
+        # Archived months overlapping [start_ts, end_ts), newest first, in
+        # groups that can be attached to one connection together. The first
+        # group is queried together with the live table, so there is always one.
+        months = []
+        for month in reversed(self.months()):
+            start, end = month_bounds(month)
+            if (end_ts is None or start < end_ts) and (start_ts is None or end > start_ts):
+                months.append(month)
+        return [months[i:i + ARCHIVE_ATTACH_LIMIT] for i in range(0, len(months), ARCHIVE_ATTACH_LIMIT)] or [[]]
+
+def attach_archives(conn, archive, months, attached):
+    # Attaches the months' archives to conn, detaching any others first.
+    # `attached` is the caller's schema -> month dict for this connection.
+    # Returns the table names to query.
+    wanted = {schema_name(month): month for month in months}
+    for schema in [schema for schema in attached if schema not in wanted]:
+        conn.execute(f"DETACH DATABASE {schema}")
+        del attached[schema]
+    for schema, month in wanted.items():
+        if schema not in attached:
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (archive.path(month),))
+            attached[schema] = month
+    return [f"{schema}.logs" for schema in wanted]
+
+def union_select(columns, tables, clauses):
+    # The same filtered SELECT over each table, as one UNION ALL; the caller
+    # repeats the parameters once per table
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return " UNION ALL ".join(f"SELECT {', '.join(columns)} FROM {table}{where}" for table in tables)
+
+def _remove_empty_dirs(path, stop):
+    # Removes path and then its parents up to (not including) stop while they are empty
+    while os.path.abspath(path) != os.path.abspath(stop):
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+        path = os.path.dirname(path)
+
+class RetentionManager(threading.Thread):
+    # Keeps users.db and photos/ from growing without bound. Work is done in
+    # small steps with a pause between them: moving one batch of old log rows
+    # into their month's archive, moving a batch of legacy flat photos into
+    # their day directory, freeing pages, or deleting/recompressing a batch of
+    # old photos. Writes to the logs table go through the LogWriter so they
+    # never contend with live inserts.
+    def __init__(self, log_writer, archive=None, photos=PHOTO_SAVE_DIR):
+        super().__init__(name="Retention", daemon=True)
+        self.log_writer = log_writer
+        self.archive = archive or LogArchive()
+        self.photos = photos
+        self._stop_event = threading.Event()
+        # Bytes per finished photo day directory
+        self._day_bytes = {}
+        self.steps = 0
+        self.errors = 0
+        self.last_step_ms = 0.0
+        self.rows_archived = 0
+        self.photos_moved = 0
+        self.photos_compressed = 0
+        self.photo_files_deleted = 0
+        # Photos that could not be moved or recompressed and were skipped
+        self.photo_errors = 0
+        self.archives_deleted = 0
+        self.pages_freed = 0
+        self._vacuum_migration_tried = False
+
+    def run(self):
+        while not self._stop_event.is_set():
+            started = time.perf_counter()
+            try:
+                busy = self.step()
+            except Exception:
+                self.errors += 1
+                busy = False
+            self.steps += 1
+            self.last_step_ms = METRICS.since("retention_step", started)
+            self._stop_event.wait(STEP_PAUSE_S if busy else IDLE_INTERVAL_S)
+
+    def stop(self, timeout=10.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def step(self):
+        # One bounded unit of work, most useful first; False when there is nothing to do
+        if self._migrate_flat_photos() or self._archive_logs() or self._free_pages() or self._purge_archives():
+            return True
+        days = self._photo_days()
+        return self._purge_photos(days) or self._compress_photos(days)
+
+    def stats(self):
+        return {
+            "steps": self.steps,
+            "errors": self.errors,
+            "last_step_ms": self.last_step_ms,
+            "rows_archived": self.rows_archived,
+            "archive_months": len(self.archive.months()),
+            "archives_deleted": self.archives_deleted,
+            "pages_freed": self.pages_freed,
+            "photos_moved": self.photos_moved,
+            "photos_compressed": self.photos_compressed,
+            "photo_files_deleted": self.photo_files_deleted,
+            "photo_errors": self.photo_errors,
+        }
+
+    # Logs
+
+    def _archive_logs(self):
+        cutoff = month_bounds(add_months(month_key(time.time()), -LIVE_MONTHS))[0]
+        return self.log_writer.run_task(lambda conn: self._archive_batch(conn, cutoff)).result() > 0
+
+    def _archive_batch(self, conn, cutoff):
+        # Runs on the LogWriter thread. Copies the oldest rows before cutoff
+        # into their month's archive, then deletes them here. A COMMIT across
+        # an attached database is not atomic in WAL mode, so these are two
+        # transactions: the copy is committed first, and only rows the
+        # archive holds are deleted. A crash in between leaves the rows in
+        # both files, and INSERT OR IGNORE on the kept ids makes the retry
+        # harmless.
+        oldest = conn.execute("SELECT MIN(ts) FROM logs WHERE ts < ?", (cutoff,)).fetchone()[0]
+        if oldest is None:
+            return 0
+        month = month_key(oldest)
+        start, end = month_bounds(month)
+        self.archive.create(month)
+        batch = "SELECT id FROM main.logs WHERE ts >= ? AND ts < ? ORDER BY ts LIMIT ?"
+        params = (start, min(end, cutoff), ARCHIVE_BATCH_ROWS)
+        columns = ", ".join(("id",) + LOG_COLUMNS)
+        conn.execute("ATTACH DATABASE ? AS retention_target", (self.archive.path(month),))
+        try:
+            conn.execute(f"INSERT OR IGNORE INTO retention_target.logs ({columns}) "
+                         f"SELECT {columns} FROM main.logs WHERE id IN ({batch})", params)
+            conn.commit()
+            moved = conn.execute(f"DELETE FROM main.logs WHERE id IN ({batch}) "
+                                 f"AND id IN (SELECT id FROM retention_target.logs)", params).rowcount
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("DETACH DATABASE retention_target")
+        self.rows_archived += moved
+        return moved
+
+    def _free_pages(self):
+        return self.log_writer.run_task(self._incremental_vacuum).result()
+
+    def _incremental_vacuum(self, conn):
+        # Only databases with auto_vacuum=INCREMENTAL can shrink in steps
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free < VACUUM_PAGES_PER_STEP:
+            return False
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return self._migrate_auto_vacuum(conn, free)
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP})").fetchall()
+        conn.commit()
+        self.pages_freed += VACUUM_PAGES_PER_STEP
+        return True
+
+    def _migrate_auto_vacuum(self, conn, free):
+        # auto_vacuum of an existing database only changes with a VACUUM,
+        # which rewrites the whole file. Tried once per run.
+        if not VACUUM_MIGRATE or self._vacuum_migration_tried:
+            return False
+        self._vacuum_migration_tried = True
+        conn.commit()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        self.pages_freed += free
+        return True
+
+    def _purge_archives(self):
+        months = self.archive.months()
+        if not months:
+            return False
+        oldest = months[0]
+        expired = ARCHIVE_KEEP_MONTHS is not None and oldest < add_months(month_key(time.time()), -ARCHIVE_KEEP_MONTHS)
+        over_budget = ARCHIVE_MAX_BYTES is not None and len(months) > 1 and sum(
+            os.path.getsize(self.archive.path(month)) for month in months) > ARCHIVE_MAX_BYTES
+        if not (expired or over_budget):
+            return False
+        path = self.archive.path(oldest)
+        try:
+            os.remove(path)
+        except OSError:
+            # Still open elsewhere (Windows); tried again next time
+            return False
+        for suffix in ("-journal", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        self.archives_deleted += 1
+        return True
+
+    # Photos
+
+    def _migrate_flat_photos(self):
+        # Photos written before the day directories existed sit directly in
+        # photos/; move a batch into photos/YYYY/MM/DD and repoint their rows
+        moved = []
+        deadline = time.monotonic() + STEP_BUDGET_S
+        try:
+            entries = os.scandir(self.photos)
+        except OSError:
+            return False
+        with entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(".jpg"):
+                    continue
+                match = PHOTO_NAME.search(entry.name)
+                ts = int(float(match.group("ts"))) if match else int(entry.stat().st_mtime)
+                directory = photo_dir(ts, self.photos)
+                new_path = os.path.join(directory, entry.name)
+                try:
+                    os.makedirs(directory, exist_ok=True)
+                    os.replace(entry.path, new_path)
+                except OSError:
+                    self.photo_errors += 1
+                    continue
+                moved.append((ts, entry.path, new_path))
+                if len(moved) >= PHOTO_BATCH_FILES or time.monotonic() > deadline:
+                    break
+        if not moved:
+            return False
+        repointed = set()
+        try:
+            self.log_writer.run_task(lambda conn: self._repoint_photos(conn, moved, repointed)).result()
+        except Exception:
+            # Rows of months that were not repointed still name the old
+            # paths, so put those files back for the next step to retry
+            for ts, old_path, new_path in moved:
+                if month_key(ts) not in repointed:
+                    try:
+                        os.replace(new_path, old_path)
+                    except OSError:
+                        self.photo_errors += 1
+            raise
+        self.photos_moved += len(moved)
+        return True
+
+    def _repoint_photos(self, conn, moved, repointed):
+        # Runs on the LogWriter thread; rows are found through idx_logs_ts.
+        # Each month is its own transaction and is added to repointed once committed.
+        by_month = {}
+        for ts, old_path, new_path in moved:
+            by_month.setdefault(month_key(ts), []).append((new_path, ts, old_path))
+        archived = set(self.archive.months())
+        for month, updates in by_month.items():
+            tables = ["main.logs"]
+            if month in archived:
+                conn.execute("ATTACH DATABASE ? AS retention_target", (self.archive.path(month),))
+                tables.append("retention_target.logs")
+            try:
+                for table in tables:
+                    conn.executemany(f"UPDATE {table} SET photo_path = ? WHERE ts = ? AND photo_path = ?", updates)
+                    conn.executemany(f"UPDATE {table} SET thumb_path = ? WHERE ts = ? AND thumb_path = ?", updates)
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+            finally:
+                if month in archived:
+                    conn.execute("DETACH DATABASE retention_target")
+            repointed.add(month)
+
+    def _photo_days(self):
+        # [(date, path)] of the photos/YYYY/MM/DD directories, oldest first
+        days = []
+        for year in self._numbered_dirs(self.photos):
+            for month in self._numbered_dirs(os.path.join(self.photos, year)):
+                for day in self._numbered_dirs(os.path.join(self.photos, year, month)):
+                    try:
+                        date = datetime.date(int(year), int(month), int(day))
+                    except ValueError:
+                        continue
+                    days.append((date, os.path.join(self.photos, year, month, day)))
+        days.sort()
+        return days
+
+    def _numbered_dirs(self, path):
+        try:
+            with os.scandir(path) as entries:
+                return [entry.name for entry in entries if entry.is_dir() and entry.name.isdigit()]
+        except OSError:
+            return []
+
+    def _photo_bytes(self, days):
+        # Total size, or None while finished days are still being measured
+        # (one more per call, so the first pass is spread over several steps)
+        today = datetime.date.today()
+        total = 0
+        for date, path in days:
+            size = self._day_bytes.get(path)
+            if size is None:
+                size = self._dir_bytes(path)
+                if date >= today:
+                    total += size
+                    continue
+                self._day_bytes[path] = size
+                return None
+            total += size
+        return total
+
+    def _dir_bytes(self, path):
+        total = 0
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    total += entry.stat().st_size
+        return total
+
+    def _purge_photos(self, days):
+        if not days:
+            return False
+        today = datetime.date.today()
+        oldest, path = days[0]
+        expired = PHOTO_KEEP_DAYS is not None and oldest < today - datetime.timedelta(days=PHOTO_KEEP_DAYS)
+        if not expired and PHOTO_MAX_BYTES is not None and len(days) > 1:
+            total = self._photo_bytes(days)
+            if total is None:
+                return True
+            expired = total > PHOTO_MAX_BYTES
+        if not expired:
+            return False
+        deadline = time.monotonic() + STEP_BUDGET_S
+        removed = 0
+        with os.scandir(path) as entries:
+            for entry in entries:
+                os.remove(entry.path)
+                removed += 1
+                if removed >= PHOTO_BATCH_FILES or time.monotonic() > deadline:
+                    break
+        self.photo_files_deleted += removed
+        self._day_bytes.pop(path, None)
+        if not os.listdir(path):
+            _remove_empty_dirs(path, self.photos)
+        return True
+
+    def _compress_photos(self, days):
+        if PHOTO_COMPRESS_AFTER_DAYS is None:
+            return False
+        cutoff = datetime.date.today() - datetime.timedelta(days=PHOTO_COMPRESS_AFTER_DAYS)
+        for date, path in days:
+            if date >= cutoff:
+                return False
+            if not os.path.exists(os.path.join(path, COMPRESSED_MARKER)):
+                self._compress_day(path)
+                return True
+        return False
+
+    def _compress_day(self, path):
+        # Names are processed in sorted order and the last one done is kept in
+        # .compressing, so a restart does not recompress a photo twice
+        progress_path = os.path.join(path, COMPRESSING_MARKER)
+        try:
+            with open(progress_path) as f:
+                last = f.read().strip()
+        except OSError:
+            last = ""
+        names = sorted(name for name in os.listdir(path) if name.endswith(".jpg") and name > last)
+        deadline = time.monotonic() + STEP_BUDGET_S
+        done = 0
+        for name in names:
+            file_path = os.path.join(path, name)
+            try:
+                if "_burst" in name:
+                    os.remove(file_path)
+                    self.photo_files_deleted += 1
+                elif not name.endswith("_thumb.jpg"):
+                    self._recompress(file_path)
+            except (OSError, cv2.error):
+                # A corrupt or unreadable photo is left as it is
+                self.photo_errors += 1
+            last = name
+            done += 1
+            if done >= PHOTO_BATCH_FILES or time.monotonic() > deadline:
+                break
+        self._day_bytes.pop(path, None)
+        if done == len(names):
+            with open(os.path.join(path, COMPRESSED_MARKER), "w"):
+                pass
+            if os.path.exists(progress_path):
+                os.remove(progress_path)
+        else:
+            with open(progress_path, "w") as f:
+                f.write(last)
+
+    def _recompress(self, path):
+        image = cv2.imread(path)
+        if image is None:
+            return
+        h, w = image.shape[:2]
+        if w > PHOTO_COMPRESS_MAX_WIDTH:
+            scale = PHOTO_COMPRESS_MAX_WIDTH / w
+            image = cv2.resize(image, (PHOTO_COMPRESS_MAX_WIDTH, int(h * scale)), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, PHOTO_COMPRESS_QUALITY])
+        if not ok or len(encoded) >= os.path.getsize(path):
+            return
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(encoded.tobytes())
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.photos_compressed += 1
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from metrics import METRICS
+
+PHOTO_SAVE_DIR = "photos"
+os.makedirs(PHOTO_SAVE_DIR, exist_ok=True)
+
+THUMBNAIL_SIZE = (320, 180)
+
+def photo_dir(timestamp, root=PHOTO_SAVE_DIR):
+    # photos/YYYY/MM/DD by event date, so no directory grows without bound and
+    # old photos can be removed a day at a time
+    day = time.localtime(float(timestamp))
+    return os.path.join(root, f"{day.tm_year:04d}", f"{day.tm_mon:02d}", f"{day.tm_mday:02d}")
+
+class EncodedSnapshot:
+    __slots__ = ("photo_path", "thumb_path", "thumbnail")
+
+    def __init__(self, photo_path, thumb_path, thumbnail):
+        self.photo_path = photo_path
+        self.thumb_path = thumb_path
+        # Small RGB array for the "Last In/Out" label
+        self.thumbnail = thumbnail
+
+class SnapshotEncoder:
+    # Writes event snapshots on a background pool. File names are chosen at
+    # submit time, so the log row can be persisted right away while the JPEG
+    # and its thumbnail are still being written. At most max_pending
+    # snapshots (each may hold a full-resolution frame) wait at a time;
+    # past that, events are logged without a photo.
+    def __init__(self, workers=2, quality=90, thumb_quality=75, thumb_size=THUMBNAIL_SIZE, max_pending=64):
+        self.quality = quality
+        self.thumb_quality = thumb_quality
+        self.thumb_size = thumb_size
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="snapshot")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._completed_at = deque(maxlen=256)
+        self._day_dir = None
+        self.submitted = 0
+        self.completed = 0
+        self.errors = 0
+        self.dropped = 0
+        self.total_encode_ms = 0.0
+        self.max_encode_ms = 0.0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def submit(self, snapshot, direction, timestamp, device_serial):
+        # Returns (photo_path, thumb_path, future); the future resolves to an
+        # EncodedSnapshot. ("", "", None) when too many are already pending.
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.dropped += 1
+            return "", "", None
+        try:
+            return self._submit(snapshot, direction, timestamp, device_serial)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _submit(self, snapshot, direction, timestamp, device_serial):
+        directory = photo_dir(timestamp)
+        if directory != self._day_dir:
+            os.makedirs(directory, exist_ok=True)
+            self._day_dir = directory
+        base = os.path.join(directory, f"{device_serial}_{direction}_{timestamp}_{uuid.uuid4().hex[:8]}")
+        photo_path = base + ".jpg"
+        thumb_path = base + "_thumb.jpg"
+        with self._lock:
+            self.submitted += 1
+        future = self._executor.submit(self._encode, snapshot, base, photo_path, thumb_path, time.perf_counter())
+        return photo_path, thumb_path, future
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            completed = self.completed
+            recent = list(self._completed_at)
+            span = recent[-1] - recent[0] if len(recent) > 1 else 0.0
+            return {
+                "pending": self.submitted - completed - self.errors,
+                "completed": completed,
+                "errors": self.errors,
+                "dropped": self.dropped,
+                "per_second": (len(recent) - 1) / span if span else 0.0,
+                "avg_encode_ms": self.total_encode_ms / completed if completed else 0.0,
+                "max_encode_ms": self.max_encode_ms,
+                "avg_queue_ms": self.total_wait_ms / completed if completed else 0.0,
+                "max_queue_ms": self.max_wait_ms,
+            }
+
+    def _encode(self, snapshot, base, photo_path, thumb_path, submitted_at):
+        started = time.perf_counter()
+        written = []
+        try:
+            # Ring snapshots are already JPEG encoded and are written as-is
+            written.append(photo_path)
+            if snapshot.jpeg is None:
+                _imwrite(photo_path, snapshot.frame, self.quality)
+            else:
+                _write_file(photo_path, snapshot.jpeg)
+            for i, (frame_time, jpeg) in enumerate(snapshot.burst):
+                offset_ms = int(round((frame_time - snapshot.frame_time) * 1000))
+                written.append(f"{base}_burst{i:02d}_{offset_ms:+d}ms.jpg")
+                _write_file(written[-1], jpeg)
+
+            image = snapshot.image()
+            h, w = image.shape[:2]
+            scale = min(self.thumb_size[0] / w, self.thumb_size[1] / h)
+            thumb = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+            written.append(thumb_path)
+            _imwrite(thumb_path, thumb, self.thumb_quality)
+            thumbnail = cv2.cvtColor(thumb, cv2.COLOR_BGR2RGB)
+        except Exception:
+            # Don't leave a partial snapshot behind; the caller clears the
+            # log row's paths. The day directory may have been removed.
+            for path in written:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._lock:
+                self.errors += 1
+                self._day_dir = None
+            raise
+        finally:
+            self._slots.release()
+        finished = time.perf_counter()
+        encode_ms = (finished - started) * 1000.0
+        wait_ms = (started - submitted_at) * 1000.0
+        METRICS.observe("snapshot_encode", encode_ms)
+        METRICS.observe("snapshot_queue_wait", wait_ms)
+        with self._lock:
+            self.completed += 1
+            self._completed_at.append(finished)
+            self.total_encode_ms += encode_ms
+            self.max_encode_ms = max(self.max_encode_ms, encode_ms)
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        return EncodedSnapshot(photo_path, thumb_path, thumbnail)
+
+def _imwrite(path, image, quality):
+    # cv2.imwrite reports most failures (disk full, missing directory) by returning False
+    if not cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, quality]):
+        raise OSError(f"could not write {path}")
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import cv2
+import numpy as np
+
+# Least time a ring may go without a new frame before it counts as stalled
+STALL_SLACK_S = 0.2
+
+class Snapshot:
+    __slots__ = ("jpeg", "frame", "frame_time", "skew_ms", "burst")
+
+    def __init__(self, jpeg, frame, frame_time, event_time, burst=()):
+        self.jpeg = jpeg
+        self.frame = frame
+        self.frame_time = frame_time
+        # Positive when the chosen frame was captured after the event
+        self.skew_ms = int(round((frame_time - event_time) * 1000))
+        self.burst = list(burst)
+
+    def image(self):
+        # Decoded BGR frame, whichever form the snapshot was taken in
+        if self.frame is None:
+            self.frame = cv2.imdecode(np.frombuffer(self.jpeg, np.uint8), cv2.IMREAD_COLOR)
+        return self.frame
+
+class SnapshotService:
+    # Picks the frame closest to an access event's own timestamp from the
+    # camera's FrameRing instead of whatever frame is current when the event
+    # is processed. camera_lookup(direction) returns the CameraThread to use.
+    def __init__(self, camera_lookup, burst_before=0.0, burst_after=0.0, max_wait=0.5, max_skew=1.0):
+        self.camera_lookup = camera_lookup
+        self.burst_before = burst_before
+        self.burst_after = burst_after
+        self.max_wait = max_wait
+        # A ring frame further than this (or one frame interval, if longer)
+        # from the event was not taken at the event
+        self.max_skew = max_skew
+        self.captured = 0
+        self.fallbacks = 0
+        self.total_abs_skew_ms = 0
+        self.max_abs_skew_ms = 0
+
+    async def capture(self, direction, event_time):
+        camera = self.camera_lookup(direction)
+        if camera is None:
+            return None
+        ring = camera.ring
+        if ring is None:
+            return self._latest(camera, event_time)
+
+        # Wait (bounded) until the ring holds frames from after the event. A
+        # device clock running ahead of ours is not worth waiting for, and
+        # neither is a ring that is empty or no longer advancing (camera
+        # down, stream stalled): that would cost max_wait on every event.
+        wait_until = event_time + self.burst_after
+        now = time.time()
+        advancing = ring.newest_time() >= now - max(2 * ring.interval, STALL_SLACK_S)
+        if advancing and wait_until - now <= self.max_wait:
+            give_up = time.monotonic() + self.max_wait
+            while ring.newest_time() < wait_until and time.monotonic() < give_up:
+                await asyncio.sleep(0.05)
+
+        chosen = ring.closest(event_time)
+        if chosen is None:
+            return self._latest(camera, event_time)
+        # The event is outside what the ring holds, e.g. a device clock that
+        # is behind by more than the ring's span: its oldest frame would be
+        # just as wrong as any other, so take the live one
+        if abs(chosen[0] - event_time) > max(self.max_skew, ring.interval):
+            return self._latest(camera, event_time)
+        burst = ()
+        if self.burst_before or self.burst_after:
+            burst = [item for item in ring.between(event_time - self.burst_before, event_time + self.burst_after)
+                     if item[0] != chosen[0]]
+        return self._record(Snapshot(chosen[1], None, chosen[0], event_time, burst))
+
+    def _latest(self, camera, event_time):
+        frame, frame_time = camera.snapshot_with_time()
+        if frame is None:
+            return None
+        self.fallbacks += 1
+        return self._record(Snapshot(None, frame, frame_time, event_time))
+
+    def _record(self, snapshot):
+        skew = abs(snapshot.skew_ms)
+        self.captured += 1
+        self.total_abs_skew_ms += skew
+        self.max_abs_skew_ms = max(self.max_abs_skew_ms, skew)
+        return snapshot
+
+    def stats(self):
+        return {
+            "captured": self.captured,
+            "fallbacks": self.fallbacks,
+            "avg_abs_skew_ms": self.total_abs_skew_ms / self.captured if self.captured else 0.0,
+            "max_abs_skew_ms": self.max_abs_skew_ms,
+        }
@@ -0,0 +1,222 @@
+import datetime
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+from PyQt5 import QtCore
+
+from metrics import METRICS
+
+HEARTBEAT_MS = 50
+STALL_THRESHOLD_MS = 250
+# How often the watchdog thread checks the heartbeat and, during a stall,
+# samples the GUI thread's stack
+STALL_SAMPLE_INTERVAL_S = 0.01
+MAX_STALL_SAMPLES = 1000
+PROFILE_INTERVAL_S = 0.005
+PROFILE_DIR = "profiles"
+
+def describe(entry):
+    return f"{entry.name} ({os.path.basename(entry.filename)}:{entry.lineno})"
+
+def running_slot(stack):
+    # The Python function the Qt event loop called into: the frame right after
+    # the innermost exec_() call (a modal dialog runs its own loop). None when
+    # the GUI thread is inside exec_() itself, i.e. busy in Qt's C++ code.
+    slot = None
+    for i, entry in enumerate(stack):
+        if ".exec" in (entry.line or ""):
+            slot = stack[i + 1] if i + 1 < len(stack) else None
+    if slot is None and stack and ".exec" not in (stack[-1].line or ""):
+        # Before the event loop started
+        slot = stack[0]
+    return slot
+
+class SamplingProfiler:
+    # Samples the Python stack of every thread every interval seconds and
+    # counts identical stacks. stop() writes them in the "folded" format
+    # (frames joined by ';', then the count), which flamegraph.pl and
+    # speedscope read. Costs nothing while stopped.
+    def __init__(self, interval=PROFILE_INTERVAL_S, output_dir=PROFILE_DIR):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.samples = 0
+        self.started_at = None
+        self.last_path = None
+        self._counts = Counter()
+        self._labels = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._counts = Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # Returns the path of the written profile, or None if it was not running
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return None
+        self._stop_event.set()
+        thread.join()
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = "profile-" + datetime.datetime.fromtimestamp(self.started_at).strftime("%Y%m%d-%H%M%S") + ".folded"
+        path = os.path.join(self.output_dir, name)
+        with open(path, "w") as f:
+            for stack, count in self._counts.most_common():
+                f.write(";".join(stack) + f" {count}\n")
+        self.last_path = path
+        return path
+
+    def toggle(self):
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._counts[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+class StallWatchdog(QtCore.QObject):
+    # A heartbeat timer on the GUI thread records when the event loop last
+    # ran; a plain thread watches that time. Once the heartbeat is
+    # threshold_ms late the thread samples the GUI thread's stack until it
+    # comes back, then appends a report to log_path naming the slot that was
+    # running and where it spent the time. Must be created on the GUI thread.
+    def __init__(self, threshold_ms=STALL_THRESHOLD_MS, heartbeat_ms=HEARTBEAT_MS, log_path="stalls.log",
+                 parent=None):
+        super().__init__(parent)
+        self.threshold_ms = threshold_ms
+        self.heartbeat_ms = heartbeat_ms
+        self.log_path = log_path
+        self.profiler = SamplingProfiler()
+        self.stalls = 0
+        self.longest_ms = 0.0
+        self.reports = deque(maxlen=20)
+        self._gui_ident = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._timer = QtCore.QTimer(self)
+        self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._timer.timeout.connect(self._beat)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._last_beat = time.monotonic()
+        self._timer.start(self.heartbeat_ms)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, name="StallWatchdog", daemon=True)
+        self._thread.start()
+        METRICS.register("gui_stalls", lambda: self.stalls, counter=True)
+        METRICS.register("gui_longest_stall_ms", lambda: self.longest_ms)
+        METRICS.register("profiler_running", lambda: int(self.profiler.running))
+
+    def stop(self):
+        self._timer.stop()
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.profiler.stop()
+
+    def install_signal_toggle(self, signum=getattr(signal, "SIGUSR2", None)):
+        # `kill -USR2 <pid>` starts the profiler, a second one stops it and
+        # writes the profile. POSIX only; call from the main thread.
+        if signum is not None:
+            signal.signal(signum, lambda *args: self.profiler.toggle())
+
+    def last_report(self):
+        return self.reports[-1] if self.reports else None
+
+    def _beat(self):
+        now = time.monotonic()
+        METRICS.observe("gui_loop_lag", max(0.0, (now - self._last_beat) * 1000.0 - self.heartbeat_ms))
+        self._last_beat = now
+
+    def _watch(self):
+        late_after = (self.heartbeat_ms + self.threshold_ms) / 1000.0
+        stall_from = None
+        samples = []
+        while not self._stop_event.wait(STALL_SAMPLE_INTERVAL_S):
+            last_beat = self._last_beat
+            if time.monotonic() - last_beat >= late_after:
+                if stall_from is None:
+                    stall_from = last_beat
+                if len(samples) < MAX_STALL_SAMPLES:
+                    frame = sys._current_frames().get(self._gui_ident)
+                    if frame is not None:
+                        samples.append(traceback.extract_stack(frame))
+                    del frame
+            elif stall_from is not None:
+                duration_ms = max(0.0, (last_beat - stall_from) * 1000.0 - self.heartbeat_ms)
+                self._report(duration_ms, samples)
+                stall_from = None
+                samples = []
+
+    def _report(self, duration_ms, samples):
+        self.stalls += 1
+        self.longest_ms = max(self.longest_ms, duration_ms)
+        METRICS.observe("gui_stall", duration_ms)
+        slots = Counter()
+        hot = Counter()
+        stacks = Counter()
+        for stack in samples:
+            slot = running_slot(stack)
+            slots[describe(slot) if slot else "Qt (no Python slot running)"] += 1
+            if stack:
+                hot[describe(stack[-1])] += 1
+            stacks[tuple((entry.filename, entry.lineno, entry.name, entry.line) for entry in stack)] += 1
+        slot = slots.most_common(1)[0][0] if slots else "unknown"
+        lines = [f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} GUI thread stalled {duration_ms:.0f} ms "
+                 f"({len(samples)} samples); running: {slot}"]
+        for name, count in slots.most_common(5):
+            lines.append(f"  slot {count * 100 // len(samples):3d}%  {name}")
+        for name, count in hot.most_common(5):
+            lines.append(f"  at   {count * 100 // len(samples):3d}%  {name}")
+        if stacks:
+            lines.append("  most frequent stack:")
+            frames = traceback.StackSummary.from_list(list(stacks.most_common(1)[0][0]))
+            lines.extend("  " + line for line in "".join(frames.format()).rstrip().splitlines())
+        text = "\n".join(lines)
+        self.reports.append({"time": time.time(), "duration_ms": duration_ms, "slot": slot,
+                             "samples": len(samples), "text": text})
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(text + "\n\n")
+        except OSError:
+            pass
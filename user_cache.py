@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from user_management import DB_PATH
+
+_USER_FIELDS = "id, name, card_number, unit_number, plate_number, permission"
+_MISSING = object()
+
+class UserCache:
+    # card_number -> user record, bounded with LRU eviction. Unknown cards are
+    # cached as misses too, so a badge that is not enrolled does not hit the
+    # disk on every swipe; add/update/delete in UserManagementDialog must call
+    # invalidate_card/invalidate_user to keep this in step with the table.
+    def __init__(self, db_path=DB_PATH, max_size=10000):
+        self.db_path = db_path
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._card_by_id = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT " + _USER_FIELDS + " FROM users ORDER BY id DESC LIMIT ?", (self.max_size,)
+            ).fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            self._entries.clear()
+            self._card_by_id.clear()
+            for row in rows:
+                self._store(row[2], self._record(row))
+
+    def get(self, card_number):
+        # Returns a dict with name/id/unit_number/plate_number/permission, or None.
+        card_number = str(card_number or "")
+        if not card_number:
+            return None
+        with self._lock:
+            record = self._entries.get(card_number, _MISSING)
+            if record is not _MISSING:
+                self._entries.move_to_end(card_number)
+                self.hits += 1
+                return record
+            self.misses += 1
+            generation = self._generation
+        try:
+            record = self._fetch(card_number)
+        except sqlite3.Error:
+            return None
+        with self._lock:
+            # Skip caching if the row was edited while we were reading it.
+            if generation == self._generation:
+                self._store(card_number, record)
+        return record
+
+    def peek(self, card_number):
+        # Memory-only lookup for callers that must not touch SQLite (the
+        # asyncio loop). Returns (found, record); on a miss call get().
+        card_number = str(card_number or "")
+        if not card_number:
+            return True, None
+        with self._lock:
+            record = self._entries.get(card_number, _MISSING)
+            if record is _MISSING:
+                return False, None
+            self._entries.move_to_end(card_number)
+            self.hits += 1
+            return True, record
+
+    def invalidate_card(self, card_number):
+        with self._lock:
+            self._generation += 1
+            record = self._entries.pop(str(card_number), None)
+            if record:
+                self._card_by_id.pop(record["id"], None)
+
+    def invalidate_user(self, user_id):
+        # Card numbers can change on update, so edits are also invalidated by id.
+        with self._lock:
+            self._generation += 1
+            card_number = self._card_by_id.pop(int(user_id), None)
+            if card_number is not None:
+                self._entries.pop(card_number, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._card_by_id.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _fetch(self, card_number):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT " + _USER_FIELDS + " FROM users WHERE card_number=?", (card_number,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return self._record(row) if row else None
+
+    def _record(self, row):
+        return {
+            "id": row[0],
+            "name": row[1],
+            "card_number": row[2],
+            "unit_number": row[3],
+            "plate_number": row[4],
+            "permission": row[5],
+        }
+
+    def _store(self, card_number, record):
+        old = self._entries.pop(card_number, None)
+        if old:
+            self._card_by_id.pop(old["id"], None)
+        self._entries[card_number] = record
+        if record:
+            self._card_by_id[record["id"]] = card_number
+        while len(self._entries) > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            if evicted:
+                self._card_by_id.pop(evicted["id"], None)
+            self.evictions += 1
@@ -0,0 +1,303 @@
+import csv
+import json
+import os
+import sqlite3
+
+from PyQt5 import QtCore
+
+from user_photos import normalize_photo, photo_hash
+from user_validation import PERMISSIONS, validate_user
+
+USER_COLUMNS = ("id", "name", "card_number", "unit_number", "plate_number", "permission", "photo")
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+# Flush a batch early once its photos add up to this many bytes
+BATCH_MAX_PHOTO_BYTES = 32 * 1024 * 1024
+
+UPSERT_SQL = """
+    INSERT INTO users (id, name, card_number, unit_number, plate_number, permission, photo_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(card_number) DO UPDATE SET
+        name=excluded.name, unit_number=excluded.unit_number, plate_number=excluded.plate_number,
+        permission=excluded.permission,
+        photo_hash=coalesce(excluded.photo_hash, photo_hash)
+"""
+# Rows without a photo keep the one already stored
+PHOTO_UPSERT_SQL = """
+    INSERT OR REPLACE INTO user_photos (user_id, photo, photo_thumb)
+    SELECT id, ?, ? FROM users WHERE card_number = ?
+"""
+
+class TransferCancelled(Exception):
+    pass
+
+def _column_key(name):
+    # "Card Number", "card_number" and "CARD NUMBER" all name the same column
+    return (name or "").strip().lower().replace(" ", "_")
+
+def read_user_rows(path):
+    # Yields (line number, {column: text}) from a CSV or JSON file
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8-sig") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("users", [])
+        for index, item in enumerate(data, start=1):
+            if isinstance(item, dict):
+                yield index, {_column_key(k): "" if v is None else str(v).strip() for k, v in item.items()}
+            else:
+                yield index, None
+        return
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = [_column_key(name) for name in next(reader, [])]
+        for values in reader:
+            if not any(value.strip() for value in values):
+                continue
+            yield reader.line_num, {key: value.strip() for key, value in zip(header, values)}
+
+def count_user_rows(path):
+    if path.lower().endswith(".json"):
+        return 0
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+class UserImportThread(QtCore.QThread):
+    # Validates and upserts users from CSV/JSON in large single-transaction
+    # batches. Rows that fail are collected into an error report instead of
+    # stopping the import.
+    progress = QtCore.pyqtSignal(int, int)
+    finished_ok = QtCore.pyqtSignal(int, int, str)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, path, db_path, photo_dir=None, batch_size=500, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.db_path = db_path
+        self.photo_dir = photo_dir
+        self.batch_size = batch_size
+        self.errors = []
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        # An exception escaping QThread.run aborts the whole application
+        try:
+            self._import()
+        except Exception as e:
+            self.failed.emit(f"Import failed: {e}")
+
+    def _import(self):
+        try:
+            total = count_user_rows(self.path)
+            conn = sqlite3.connect(self.db_path, timeout=10)
+        except UnicodeDecodeError:
+            self.failed.emit("Import failed: the file is not UTF-8 encoded. Save it as \"CSV UTF-8\" and try again.")
+            return
+        except (OSError, ValueError, csv.Error, sqlite3.Error) as e:
+            self.failed.emit(f"Import failed: {e}")
+            return
+        imported = 0
+        try:
+            batch = []
+            batch_bytes = 0
+            done = 0
+            for line, row in read_user_rows(self.path):
+                if self._cancelled:
+                    raise TransferCancelled()
+                done += 1
+                values = self._prepare(line, row)
+                if values is None:
+                    continue
+                batch.append((line, values))
+                batch_bytes += len(values[6] or b"")
+                if len(batch) >= self.batch_size or batch_bytes >= BATCH_MAX_PHOTO_BYTES:
+                    imported += self._write_batch(conn, batch)
+                    batch = []
+                    batch_bytes = 0
+                    self.progress.emit(done, total)
+            if batch:
+                imported += self._write_batch(conn, batch)
+            self.progress.emit(done, total)
+        except TransferCancelled:
+            self.failed.emit(f"Import cancelled after {imported} users.")
+        except (OSError, ValueError, csv.Error, sqlite3.Error) as e:
+            self.failed.emit(f"Import failed after {imported} users: {e}")
+        else:
+            report = self._write_report() if self.errors else ""
+            self.finished_ok.emit(imported, len(self.errors), report)
+        finally:
+            conn.close()
+
+    def _prepare(self, line, row):
+        if row is None:
+            self.errors.append((line, "", "", "Row is not an object."))
+            return None
+        id_val = row.get("id", "")
+        name = row.get("name", "")
+        card = row.get("card_number", "")
+        permission = row.get("permission") or PERMISSIONS[0]
+        error = validate_user(id_val, name, card, permission)
+        photo = thumb = None
+        if error is None:
+            try:
+                photo, thumb = self._load_photo(row.get("photo", ""), card)
+            except ValueError as e:
+                error = str(e)
+        if error:
+            self.errors.append((line, card, name, error))
+            return None
+        return (int(id_val) if id_val else None, name.strip(), card, row.get("unit_number", ""),
+                row.get("plate_number", ""), permission, photo, photo_hash(photo), thumb)
+
+    def _load_photo(self, name, card):
+        if not self.photo_dir:
+            return None, None
+        if name:
+            path = os.path.join(self.photo_dir, name)
+            if not os.path.isfile(path):
+                raise ValueError(f"Photo file not found: {name}")
+        else:
+            # Without a photo column, <card_number>.jpg (or .png, ...) is used if present
+            path = next((os.path.join(self.photo_dir, card + ext) for ext in PHOTO_EXTENSIONS
+                         if os.path.isfile(os.path.join(self.photo_dir, card + ext))), None)
+            if path is None:
+                return None, None
+        with open(path, "rb") as f:
+            photo, thumb = normalize_photo(f.read())
+        if photo is None:
+            raise ValueError(f"Photo is not a supported image: {os.path.basename(path)}")
+        return photo, thumb
+
+    def _write_batch(self, conn, batch):
+        # values are (id, name, card, unit, plate, permission, photo, photo_hash, thumb)
+        try:
+            with conn:
+                conn.executemany(UPSERT_SQL, [_user_values(values) for _, values in batch])
+                conn.executemany(PHOTO_UPSERT_SQL, [_photo_values(values) for _, values in batch
+                                                    if values[6] is not None])
+            return len(batch)
+        except sqlite3.IntegrityError:
+            pass
+        # Some row conflicts on id; redo this batch row by row to find it
+        written = 0
+        with conn:
+            for line, values in batch:
+                try:
+                    conn.execute(UPSERT_SQL, _user_values(values))
+                except sqlite3.IntegrityError:
+                    self.errors.append((line, values[2], values[1], "ID already exists for another card."))
+                    continue
+                if values[6] is not None:
+                    conn.execute(PHOTO_UPSERT_SQL, _photo_values(values))
+                written += 1
+        return written
+
+    def _write_report(self):
+        report = os.path.splitext(self.path)[0] + "_errors.csv"
+        try:
+            with open(report, "w", newline="", encoding="utf-8-sig") as f:
+                writer = csv.writer(f)
+                writer.writerow(["Line", "Card Number", "Name", "Error"])
+                writer.writerows(self.errors)
+        except OSError:
+            return ""
+        return report
+
+def _user_values(values):
+    return values[:6] + (values[7],)
+
+def _photo_values(values):
+    return values[6], values[8], values[2]
+
+class UserExportThread(QtCore.QThread):
+    # Streams users to CSV or JSON in the import format. With photo_dir set,
+    # photos are written there as <card_number>.jpg and named in the photo column.
+    progress = QtCore.pyqtSignal(int, int)
+    finished_ok = QtCore.pyqtSignal(str, int)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, path, db_path, photo_dir=None, chunk_size=500, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.db_path = db_path
+        self.photo_dir = photo_dir
+        self.chunk_size = chunk_size
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            self._export()
+        except Exception as e:
+            self.failed.emit(f"Export failed: {e}")
+
+    def _export(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            total = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            photo_column = "user_photos.photo" if self.photo_dir else "NULL"
+            cursor = conn.execute(
+                "SELECT users.id, name, card_number, unit_number, plate_number, permission, " + photo_column
+                + " FROM users LEFT JOIN user_photos ON user_photos.user_id = users.id ORDER BY users.id"
+            )
+            if self.photo_dir:
+                os.makedirs(self.photo_dir, exist_ok=True)
+            if self.path.lower().endswith(".json"):
+                written = self._write_json(cursor, total)
+            else:
+                written = self._write_csv(cursor, total)
+        except TransferCancelled:
+            self.failed.emit("Export cancelled.")
+        except (sqlite3.Error, OSError) as e:
+            self.failed.emit(f"Export failed: {e}")
+        else:
+            self.finished_ok.emit(self.path, written)
+        finally:
+            conn.close()
+
+    def _chunks(self, cursor, total):
+        written = 0
+        while True:
+            if self._cancelled:
+                raise TransferCancelled()
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                return
+            yield [self._export_row(row) for row in rows]
+            written += len(rows)
+            self.progress.emit(written, total)
+
+    def _export_row(self, row):
+        values = ["" if value is None else str(value) for value in row[:6]]
+        photo_name = ""
+        if row[6]:
+            photo_name = row[2] + ".jpg"
+            with open(os.path.join(self.photo_dir, photo_name), "wb") as f:
+                f.write(row[6])
+        return values + [photo_name]
+
+    def _write_csv(self, cursor, total):
+        written = 0
+        with open(self.path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(USER_COLUMNS)
+            for chunk in self._chunks(cursor, total):
+                writer.writerows(chunk)
+                written += len(chunk)
+        return written
+
+    def _write_json(self, cursor, total):
+        written = 0
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for chunk in self._chunks(cursor, total):
+                for values in chunk:
+                    f.write(",\n" if written else "\n")
+                    f.write(json.dumps(dict(zip(USER_COLUMNS, values)), ensure_ascii=False))
+                    written += 1
+            f.write("\n]\n")
+        return written
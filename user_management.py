@@ -1,330 +1,477 @@
-import os
-import sqlite3
-import re
-from PyQt5 import QtWidgets, QtCore, QtGui
-
-DB_PATH = "users.db"
-PERMISSIONS = ["Open", "Limited", "Restricted"]
-
-def init_db():
-    if not os.path.exists(DB_PATH):
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                card_number TEXT UNIQUE NOT NULL,
-                photo BLOB,
-                unit_number TEXT,
-                plate_number TEXT,
-                permission TEXT NOT NULL
-            )
-        """)
-        conn.commit()
-        conn.close()
-    else:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        columns = [r[1] for r in c.execute("PRAGMA table_info(users)")]
-        add_cols = []
-        if "photo" not in columns:
-            add_cols.append("ALTER TABLE users ADD COLUMN photo BLOB")
-        if "unit_number" not in columns:
-            add_cols.append("ALTER TABLE users ADD COLUMN unit_number TEXT")
-        if "plate_number" not in columns:
-            add_cols.append("ALTER TABLE users ADD COLUMN plate_number TEXT")
-        if "permission" not in columns:
-            add_cols.append("ALTER TABLE users ADD COLUMN permission TEXT NOT NULL DEFAULT 'Open'")
-        for sql in add_cols:
-            c.execute(sql)
-        conn.commit()
-        conn.close()
-
-class UserManagementDialog(QtWidgets.QDialog):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("User Management")
-        self.resize(700, 530)
-        self.layout = QtWidgets.QVBoxLayout(self)
-
-        # --- Editable fields area ---
-        form_layout = QtWidgets.QGridLayout()
-        self.edit_id = QtWidgets.QLineEdit()
-        self.edit_id.setPlaceholderText("ID (auto or edit)")
-        form_layout.addWidget(QtWidgets.QLabel("ID:"), 0, 0)
-        form_layout.addWidget(self.edit_id, 0, 1)
-
-        self.edit_name = QtWidgets.QLineEdit()
-        form_layout.addWidget(QtWidgets.QLabel("Name:"), 0, 2)
-        form_layout.addWidget(self.edit_name, 0, 3)
-
-        self.edit_card = QtWidgets.QLineEdit()
-        form_layout.addWidget(QtWidgets.QLabel("Card Number:"), 1, 0)
-        form_layout.addWidget(self.edit_card, 1, 1)
-
-        self.edit_unit = QtWidgets.QLineEdit()
-        form_layout.addWidget(QtWidgets.QLabel("Unit Number:"), 1, 2)
-        form_layout.addWidget(self.edit_unit, 1, 3)
-
-        self.edit_plate = QtWidgets.QLineEdit()
-        form_layout.addWidget(QtWidgets.QLabel("Plate Number:"), 2, 0)
-        form_layout.addWidget(self.edit_plate, 2, 1)
-
-        self.combo_permission = QtWidgets.QComboBox()
-        self.combo_permission.addItems(PERMISSIONS)
-        form_layout.addWidget(QtWidgets.QLabel("Permission:"), 2, 2)
-        form_layout.addWidget(self.combo_permission, 2, 3)
-
-        # Photo
-        self.photo_label = QtWidgets.QLabel("No Photo")
-        self.photo_label.setFixedSize(80, 100)
-        self.photo_label.setStyleSheet("border:1px solid #999; background:#eee;")
-        self.photo_label.setAlignment(QtCore.Qt.AlignCenter)
-        form_layout.addWidget(self.photo_label, 0, 4, 3, 1)
-        self.btn_browse_photo = QtWidgets.QPushButton("Browse Photo")
-        form_layout.addWidget(self.btn_browse_photo, 3, 4)
-        self.btn_browse_photo.clicked.connect(self.browse_photo)
-        self.current_photo_data = None  # raw bytes
-
-        # Add, Update, Search, Delete, Clear
-        self.btn_add = QtWidgets.QPushButton("Add")
-        self.btn_update = QtWidgets.QPushButton("Update")
-        self.btn_search = QtWidgets.QPushButton("Search")
-        self.btn_delete = QtWidgets.QPushButton("Delete")
-        self.btn_clear = QtWidgets.QPushButton("Clear")
-        btn_layout = QtWidgets.QHBoxLayout()
-        btn_layout.addWidget(self.btn_add)
-        btn_layout.addWidget(self.btn_update)
-        btn_layout.addWidget(self.btn_search)
-        btn_layout.addWidget(self.btn_delete)
-        btn_layout.addWidget(self.btn_clear)
-        form_layout.addLayout(btn_layout, 4, 0, 1, 5)
-
-        self.btn_add.clicked.connect(self.add_user)
-        self.btn_update.clicked.connect(self.update_user)
-        self.btn_search.clicked.connect(self.search_user)
-        self.btn_delete.clicked.connect(self.delete_user)
-        self.btn_clear.clicked.connect(self.clear_fields)
-
-        self.layout.addLayout(form_layout)
-
-        # --- Table area ---
-        self.table = QtWidgets.QTableWidget(0, 7)
-        self.table.setHorizontalHeaderLabels(["ID", "Name", "Card Number", "Unit Number", "Plate Number", "Permission", "Photo"])
-        self.table.horizontalHeader().setStretchLastSection(True)
-        self.table.setSelectionBehavior(QtWidgets.QTableWidget.SelectRows)
-        self.table.setEditTriggers(QtWidgets.QTableWidget.NoEditTriggers)
-        self.table.setColumnWidth(6, 70)
-        self.layout.addWidget(self.table)
-
-        self.table.itemSelectionChanged.connect(self.fill_fields_from_selection)
-
-        self.load_users()
-
-    def browse_photo(self):
-        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Select Photo", "", "Images (*.png *.jpg *.jpeg *.bmp)")
-        if path:
-            pixmap = QtGui.QPixmap(path).scaled(self.photo_label.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
-            self.photo_label.setPixmap(pixmap)
-            with open(path, "rb") as f:
-                self.current_photo_data = f.read()
-
-    def fill_fields_from_selection(self):
-        selected = self.table.selectedItems()
-        if not selected:
-            return
-        row = self.table.currentRow()
-        self.edit_id.setText(self.table.item(row, 0).text())
-        self.edit_name.setText(self.table.item(row, 1).text())
-        self.edit_card.setText(self.table.item(row, 2).text())
-        self.edit_unit.setText(self.table.item(row, 3).text())
-        self.edit_plate.setText(self.table.item(row, 4).text())
-        self.combo_permission.setCurrentText(self.table.item(row, 5).text())
-        # Load photo from db
-        user_id = self.table.item(row, 0).text()
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT photo FROM users WHERE id=?", (user_id,))
-        row_photo = c.fetchone()
-        conn.close()
-        if row_photo and row_photo[0]:
-            pixmap = QtGui.QPixmap()
-            pixmap.loadFromData(row_photo[0])
-            self.photo_label.setPixmap(pixmap.scaled(self.photo_label.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation))
-            self.current_photo_data = row_photo[0]
-        else:
-            self.photo_label.setText("No Photo")
-            self.photo_label.setPixmap(QtGui.QPixmap())
-            self.current_photo_data = None
-
-    def clear_fields(self):
-        self.edit_id.clear()
-        self.edit_name.clear()
-        self.edit_card.clear()
-        self.edit_unit.clear()
-        self.edit_plate.clear()
-        self.combo_permission.setCurrentIndex(0)
-        self.photo_label.setText("No Photo")
-        self.photo_label.setPixmap(QtGui.QPixmap())
-        self.current_photo_data = None
-        self.table.clearSelection()
-
-    def load_users(self, filter_clause="", params=()):
-        self.table.setRowCount(0)
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        query = "SELECT id, name, card_number, unit_number, plate_number, permission, photo FROM users"
-        if filter_clause:
-            query += " WHERE " + filter_clause
-        query += " ORDER BY id"
-        for row in c.execute(query, params):
-            row_idx = self.table.rowCount()
-            self.table.insertRow(row_idx)
-            for col_idx, value in enumerate(row[:-1]):
-                self.table.setItem(row_idx, col_idx, QtWidgets.QTableWidgetItem(str(value) if value is not None else ""))
-            # Photo preview
-            photo_data = row[-1]
-            photo_item = QtWidgets.QTableWidgetItem()
-            if photo_data:
-                pixmap = QtGui.QPixmap()
-                pixmap.loadFromData(photo_data)
-                icon = QtGui.QIcon(pixmap.scaled(48, 60, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation))
-                photo_item.setIcon(icon)
-            else:
-                photo_item.setText("No Photo")
-            self.table.setItem(row_idx, 6, photo_item)
-        conn.close()
-
-    def validate_fields(self, id_val, name, card):
-        # Name cannot be empty, only letters (unicode), allow spaces; must not be blank
-        if not name.strip():
-            QtWidgets.QMessageBox.warning(self, "Validation Error", "Name cannot be empty.")
-            return False
-        # Unicode letters and spaces only
-        if not re.match(r"^[^\W\d_]+(?: [^\W\d_]+)*$", name.strip(), re.UNICODE):
-            QtWidgets.QMessageBox.warning(self, "Validation Error", "Name must contain only letters and spaces.")
-            return False
-
-        # Card Number cannot be empty, only digits
-        if not card.strip():
-            QtWidgets.QMessageBox.warning(self, "Validation Error", "Card Number cannot be empty.")
-            return False
-        if not card.isdigit():
-            QtWidgets.QMessageBox.warning(self, "Validation Error", "Card Number must contain only digits.")
-            return False
-
-        # ID, if provided, must be digits between 1 and 5000
-        if id_val:
-            if not id_val.isdigit():
-                QtWidgets.QMessageBox.warning(self, "Validation Error", "ID must contain only digits.")
-                return False
-            id_int = int(id_val)
-            if not (1 <= id_int <= 5000):
-                QtWidgets.QMessageBox.warning(self, "Validation Error", "ID must be between 1 and 5000.")
-                return False
-        return True
-
-    def add_user(self):
-        id_val = self.edit_id.text().strip()
-        name = self.edit_name.text().strip()
-        card = self.edit_card.text().strip()
-        unit = self.edit_unit.text().strip()
-        plate = self.edit_plate.text().strip()
-        perm = self.combo_permission.currentText()
-        photo = self.current_photo_data
-
-        if not self.validate_fields(id_val, name, card):
-            return
-
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        try:
-            # If ID is manually set, attempt to use it
-            if id_val:
-                c.execute("""INSERT INTO users (id, name, card_number, unit_number, plate_number, permission, photo)
-                             VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                          (int(id_val), name, card, unit, plate, perm, photo))
-            else:
-                c.execute("""INSERT INTO users (name, card_number, unit_number, plate_number, permission, photo)
-                             VALUES (?, ?, ?, ?, ?, ?)""",
-                          (name, card, unit, plate, perm, photo))
-            conn.commit()
-        except sqlite3.IntegrityError:
-            QtWidgets.QMessageBox.warning(self, "Error", "Card number must be unique or ID already exists.")
-        finally:
-            conn.close()
-        self.load_users()
-        self.clear_fields()
-
-    def update_user(self):
-        id_val = self.edit_id.text().strip()
-        if not id_val:
-            QtWidgets.QMessageBox.warning(self, "Error", "Select or enter user ID to update.")
-            return
-        name = self.edit_name.text().strip()
-        card = self.edit_card.text().strip()
-        unit = self.edit_unit.text().strip()
-        plate = self.edit_plate.text().strip()
-        perm = self.combo_permission.currentText()
-        photo = self.current_photo_data
-        if not self.validate_fields(id_val, name, card):
-            return
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        try:
-            c.execute("""UPDATE users SET name=?, card_number=?, unit_number=?, plate_number=?, permission=?, photo=?
-                         WHERE id=?""",
-                      (name, card, unit, plate, perm, photo, int(id_val)))
-            if c.rowcount == 0:
-                QtWidgets.QMessageBox.warning(self, "Error", "User ID does not exist.")
-        except sqlite3.IntegrityError:
-            QtWidgets.QMessageBox.warning(self, "Error", "Card number must be unique.")
-        finally:
-            conn.commit()
-            conn.close()
-        self.load_users()
-        self.clear_fields()
-
-    def search_user(self):
-        filters = []
-        params = []
-        if self.edit_id.text().strip():
-            filters.append("id=?")
-            params.append(self.edit_id.text().strip())
-        if self.edit_name.text().strip():
-            filters.append("name LIKE ?")
-            params.append('%'+self.edit_name.text().strip()+'%')
-        if self.edit_card.text().strip():
-            filters.append("card_number LIKE ?")
-            params.append('%'+self.edit_card.text().strip()+'%')
-        if self.edit_unit.text().strip():
-            filters.append("unit_number LIKE ?")
-            params.append('%'+self.edit_unit.text().strip()+'%')
-        if self.edit_plate.text().strip():
-            filters.append("plate_number LIKE ?")
-            params.append('%'+self.edit_plate.text().strip()+'%')
-        if self.combo_permission.currentText():
-            filters.append("permission=?")
-            params.append(self.combo_permission.currentText())
-        filter_clause = " AND ".join(filters)
-        self.load_users(filter_clause, tuple(params))
-
-    def delete_user(self):
-        selected = self.table.selectedItems()
-        if not selected:
-            # Do nothing if no row is selected
-            return
-        row = self.table.currentRow()
-        user_id = self.table.item(row, 0).text()
-        reply = QtWidgets.QMessageBox.question(self, "Delete User",
-                                               "Are you sure you want to delete this user?",
-                                               QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
-        if reply == QtWidgets.QMessageBox.Yes:
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            c.execute("DELETE FROM users WHERE id=?", (user_id,))
-            conn.commit()
-            conn.close()
-            self.load_users()
-            self.clear_fields()
\ No newline at end of file
+import os
+import sqlite3
+from PyQt5 import QtWidgets, QtCore, QtGui
+
+from user_table_model import UserTableModel, PHOTO_COLUMN
+from user_photos import init_user_photos, normalize_photo, photo_hash, store_photo, user_thumbnail
+from user_search import UserSearch, init_user_search
+from user_validation import PERMISSIONS, validate_user
+from user_import import UserExportThread, UserImportThread
+
+DB_PATH = "users.db"
+
+def init_db():
+    if not os.path.exists(DB_PATH):
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        # Lets retention give space freed by archived logs back in small steps
+        c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        c.execute("""
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                card_number TEXT UNIQUE NOT NULL,
+                unit_number TEXT,
+                plate_number TEXT,
+                permission TEXT NOT NULL,
+                photo_hash TEXT
+            )
+        """)
+        conn.commit()
+        init_user_photos(conn)
+        init_user_search(conn)
+        conn.close()
+    else:
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        columns = [r[1] for r in c.execute("PRAGMA table_info(users)")]
+        add_cols = []
+        if "unit_number" not in columns:
+            add_cols.append("ALTER TABLE users ADD COLUMN unit_number TEXT")
+        if "plate_number" not in columns:
+            add_cols.append("ALTER TABLE users ADD COLUMN plate_number TEXT")
+        if "permission" not in columns:
+            add_cols.append("ALTER TABLE users ADD COLUMN permission TEXT NOT NULL DEFAULT 'Open'")
+        if "photo_hash" not in columns:
+            add_cols.append("ALTER TABLE users ADD COLUMN photo_hash TEXT")
+        for sql in add_cols:
+            c.execute(sql)
+        conn.commit()
+        init_user_photos(conn)
+        backfill_photo_hashes(conn)
+        init_user_search(conn)
+        conn.close()
+
+def backfill_photo_hashes(conn, batch_size=200):
+    # Rows stored before photo_hash existed; one batch of BLOBs in memory at a time
+    while True:
+        rows = conn.execute(
+            "SELECT users.id, user_photos.photo FROM users JOIN user_photos ON user_photos.user_id = users.id"
+            " WHERE user_photos.photo IS NOT NULL AND users.photo_hash IS NULL LIMIT ?", (batch_size,)
+        ).fetchall()
+        if not rows:
+            break
+        conn.executemany("UPDATE users SET photo_hash=? WHERE id=?",
+                         [(photo_hash(photo) or "", user_id) for user_id, photo in rows])
+        conn.commit()
+
+class UserManagementDialog(QtWidgets.QDialog):
+    def __init__(self, parent=None, user_cache=None, device_sync=None, access=None):
+        super().__init__(parent)
+        self.user_cache = user_cache
+        # Pushes saved changes to the connected devices
+        self.device_sync = device_sync
+        # In-memory door decision state, patched on every change
+        self.access = access
+        self.setWindowTitle("User Management")
+        self.resize(700, 530)
+        self.layout = QtWidgets.QVBoxLayout(self)
+
+        # --- Editable fields area ---
+        form_layout = QtWidgets.QGridLayout()
+        self.edit_id = QtWidgets.QLineEdit()
+        self.edit_id.setPlaceholderText("ID (auto or edit)")
+        form_layout.addWidget(QtWidgets.QLabel("ID:"), 0, 0)
+        form_layout.addWidget(self.edit_id, 0, 1)
+
+        self.edit_name = QtWidgets.QLineEdit()
+        form_layout.addWidget(QtWidgets.QLabel("Name:"), 0, 2)
+        form_layout.addWidget(self.edit_name, 0, 3)
+
+        self.edit_card = QtWidgets.QLineEdit()
+        form_layout.addWidget(QtWidgets.QLabel("Card Number:"), 1, 0)
+        form_layout.addWidget(self.edit_card, 1, 1)
+
+        self.edit_unit = QtWidgets.QLineEdit()
+        form_layout.addWidget(QtWidgets.QLabel("Unit Number:"), 1, 2)
+        form_layout.addWidget(self.edit_unit, 1, 3)
+
+        self.edit_plate = QtWidgets.QLineEdit()
+        form_layout.addWidget(QtWidgets.QLabel("Plate Number:"), 2, 0)
+        form_layout.addWidget(self.edit_plate, 2, 1)
+
+        self.combo_permission = QtWidgets.QComboBox()
+        self.combo_permission.addItems(PERMISSIONS)
+        form_layout.addWidget(QtWidgets.QLabel("Permission:"), 2, 2)
+        form_layout.addWidget(self.combo_permission, 2, 3)
+
+        # Photo
+        self.photo_label = QtWidgets.QLabel("No Photo")
+        self.photo_label.setFixedSize(80, 100)
+        self.photo_label.setStyleSheet("border:1px solid #999; background:#eee;")
+        self.photo_label.setAlignment(QtCore.Qt.AlignCenter)
+        form_layout.addWidget(self.photo_label, 0, 4, 3, 1)
+        self.btn_browse_photo = QtWidgets.QPushButton("Browse Photo")
+        form_layout.addWidget(self.btn_browse_photo, 3, 4)
+        self.btn_browse_photo.clicked.connect(self.browse_photo)
+        self.current_photo_data = None  # normalized JPEG bytes of a newly browsed photo
+        self.current_photo_thumb = None
+
+        # Add, Update, Search, Delete, Clear
+        self.btn_add = QtWidgets.QPushButton("Add")
+        self.btn_update = QtWidgets.QPushButton("Update")
+        self.btn_search = QtWidgets.QPushButton("Search")
+        self.btn_delete = QtWidgets.QPushButton("Delete")
+        self.btn_clear = QtWidgets.QPushButton("Clear")
+        self.btn_import = QtWidgets.QPushButton("Import")
+        self.btn_export = QtWidgets.QPushButton("Export")
+        btn_layout = QtWidgets.QHBoxLayout()
+        btn_layout.addWidget(self.btn_add)
+        btn_layout.addWidget(self.btn_update)
+        btn_layout.addWidget(self.btn_search)
+        btn_layout.addWidget(self.btn_delete)
+        btn_layout.addWidget(self.btn_clear)
+        btn_layout.addWidget(self.btn_import)
+        btn_layout.addWidget(self.btn_export)
+        form_layout.addLayout(btn_layout, 4, 0, 1, 5)
+
+        self.btn_add.clicked.connect(self.add_user)
+        self.btn_update.clicked.connect(self.update_user)
+        self.btn_search.clicked.connect(self.search_user)
+        self.btn_delete.clicked.connect(self.delete_user)
+        self.btn_clear.clicked.connect(self.clear_fields)
+        self.btn_import.clicked.connect(self.import_users)
+        self.btn_export.clicked.connect(self.export_users)
+        self.transfer_thread = None
+        self.transfer_progress = None
+
+        self.layout.addLayout(form_layout)
+
+        # --- Table area ---
+        self.edit_quick_search = QtWidgets.QLineEdit()
+        self.edit_quick_search.setPlaceholderText("Search name, card, unit or plate...")
+        self.edit_quick_search.setClearButtonEnabled(True)
+        self.layout.addWidget(self.edit_quick_search)
+        # Search as you type, once typing pauses
+        self.search_timer = QtCore.QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.quick_search)
+        self.edit_quick_search.textChanged.connect(self.search_timer.start)
+        self.user_search = UserSearch(DB_PATH)
+
+        self.model = UserTableModel(DB_PATH, parent=self)
+        self.table = QtWidgets.QTableView()
+        self.table.setModel(self.model)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setSelectionBehavior(QtWidgets.QTableView.SelectRows)
+        self.table.setSelectionMode(QtWidgets.QTableView.SingleSelection)
+        self.table.setEditTriggers(QtWidgets.QTableView.NoEditTriggers)
+        self.table.setColumnWidth(PHOTO_COLUMN, 70)
+        self.table.verticalHeader().setDefaultSectionSize(62)
+        self.layout.addWidget(self.table)
+
+        self.table.selectionModel().selectionChanged.connect(self.fill_fields_from_selection)
+
+        self.load_users()
+
+    def browse_photo(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Select Photo", "", "Images (*.png *.jpg *.jpeg *.bmp)")
+        if path:
+            with open(path, "rb") as f:
+                photo, thumb = normalize_photo(f.read())
+            if photo is None:
+                QtWidgets.QMessageBox.warning(self, "Error", "Selected file is not a supported image.")
+                return
+            self.current_photo_data = photo
+            self.current_photo_thumb = thumb
+            self.show_photo(thumb)
+
+    def show_photo(self, data):
+        pixmap = QtGui.QPixmap()
+        if data and pixmap.loadFromData(data):
+            self.photo_label.setPixmap(pixmap.scaled(self.photo_label.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation))
+        else:
+            self.photo_label.setText("No Photo")
+            self.photo_label.setPixmap(QtGui.QPixmap())
+
+    def selected_row(self):
+        rows = self.table.selectionModel().selectedRows()
+        return self.model.row_values(rows[0].row()) if rows else None
+
+    def fill_fields_from_selection(self):
+        selected = self.selected_row()
+        if selected is None:
+            return
+        user_id, name, card, unit, plate, perm, _ = ["" if v is None else str(v) for v in selected]
+        self.edit_id.setText(user_id)
+        self.edit_name.setText(name)
+        self.edit_card.setText(card)
+        self.edit_unit.setText(unit)
+        self.edit_plate.setText(plate)
+        self.combo_permission.setCurrentText(perm)
+        # The preview only needs the stored thumbnail; the full photo stays in the db
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            thumb = user_thumbnail(conn, user_id)
+        finally:
+            conn.close()
+        self.show_photo(thumb)
+        self.current_photo_data = None
+        self.current_photo_thumb = None
+
+    def clear_fields(self):
+        self.edit_id.clear()
+        self.edit_name.clear()
+        self.edit_card.clear()
+        self.edit_unit.clear()
+        self.edit_plate.clear()
+        self.combo_permission.setCurrentIndex(0)
+        self.photo_label.setText("No Photo")
+        self.photo_label.setPixmap(QtGui.QPixmap())
+        self.current_photo_data = None
+        self.current_photo_thumb = None
+        self.table.clearSelection()
+
+    def load_users(self, filter_clause="", params=()):
+        # Rows are paged in as the table scrolls; photos are thumbnailed lazily
+        self.model.set_filter(filter_clause, params)
+
+    def validate_fields(self, id_val, name, card):
+        error = validate_user(id_val, name, card)
+        if error:
+            QtWidgets.QMessageBox.warning(self, "Validation Error", error)
+            return False
+        return True
+
+    def add_user(self):
+        id_val = self.edit_id.text().strip()
+        name = self.edit_name.text().strip()
+        card = self.edit_card.text().strip()
+        unit = self.edit_unit.text().strip()
+        plate = self.edit_plate.text().strip()
+        perm = self.combo_permission.currentText()
+        photo = self.current_photo_data
+        thumb = self.current_photo_thumb
+
+        if not self.validate_fields(id_val, name, card):
+            return
+
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        try:
+            # If ID is manually set, attempt to use it
+            if id_val:
+                c.execute("""INSERT INTO users (id, name, card_number, unit_number, plate_number, permission,
+                             photo_hash) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                          (int(id_val), name, card, unit, plate, perm, photo_hash(photo)))
+            else:
+                c.execute("""INSERT INTO users (name, card_number, unit_number, plate_number, permission,
+                             photo_hash) VALUES (?, ?, ?, ?, ?, ?)""",
+                          (name, card, unit, plate, perm, photo_hash(photo)))
+            if photo is not None:
+                store_photo(conn, c.lastrowid, photo, thumb)
+            conn.commit()
+            if self.user_cache:
+                self.user_cache.invalidate_card(card)
+            if self.access:
+                self.access.reload_users([c.lastrowid])
+            if self.device_sync:
+                self.device_sync.request_sync([c.lastrowid])
+        except sqlite3.IntegrityError:
+            QtWidgets.QMessageBox.warning(self, "Error", "Card number must be unique or ID already exists.")
+        finally:
+            conn.close()
+        self.load_users()
+        self.clear_fields()
+
+    def update_user(self):
+        id_val = self.edit_id.text().strip()
+        if not id_val:
+            QtWidgets.QMessageBox.warning(self, "Error", "Select or enter user ID to update.")
+            return
+        name = self.edit_name.text().strip()
+        card = self.edit_card.text().strip()
+        unit = self.edit_unit.text().strip()
+        plate = self.edit_plate.text().strip()
+        perm = self.combo_permission.currentText()
+        photo = self.current_photo_data
+        thumb = self.current_photo_thumb
+        if not self.validate_fields(id_val, name, card):
+            return
+        conn = sqlite3.connect(DB_PATH)
+        c = conn.cursor()
+        try:
+            # The stored photo is only rewritten when a new one was browsed
+            if photo is not None:
+                c.execute("""UPDATE users SET name=?, card_number=?, unit_number=?, plate_number=?, permission=?,
+                             photo_hash=? WHERE id=?""",
+                          (name, card, unit, plate, perm, photo_hash(photo), int(id_val)))
+            else:
+                c.execute("""UPDATE users SET name=?, card_number=?, unit_number=?, plate_number=?, permission=?
+                             WHERE id=?""",
+                          (name, card, unit, plate, perm, int(id_val)))
+            if c.rowcount == 0:
+                QtWidgets.QMessageBox.warning(self, "Error", "User ID does not exist.")
+            else:
+                if photo is not None:
+                    store_photo(conn, int(id_val), photo, thumb)
+                # Committed before other threads are told to re-read the user
+                conn.commit()
+                if self.user_cache:
+                    self.user_cache.invalidate_user(id_val)
+                    self.user_cache.invalidate_card(card)
+                if self.access:
+                    self.access.reload_users([int(id_val)])
+                if self.device_sync:
+                    self.device_sync.request_sync([int(id_val)])
+        except sqlite3.IntegrityError:
+            QtWidgets.QMessageBox.warning(self, "Error", "Card number must be unique.")
+        finally:
+            conn.commit()
+            conn.close()
+        self.load_users()
+        self.clear_fields()
+
+    def quick_search(self):
+        text = self.edit_quick_search.text().strip()
+        if not text:
+            self.load_users()
+            return
+        self.model.set_ids(self.user_search.search(text))
+
+    def search_user(self):
+        filters = []
+        params = []
+        if self.edit_id.text().strip():
+            filters.append("id=?")
+            params.append(self.edit_id.text().strip())
+        if self.combo_permission.currentText():
+            filters.append("permission=?")
+            params.append(self.combo_permission.currentText())
+        filter_clause = " AND ".join(filters)
+        # Text fields match word prefixes through the search index, ranked
+        fields = {
+            "name": self.edit_name.text(),
+            "card_number": self.edit_card.text(),
+            "unit_number": self.edit_unit.text(),
+            "plate_number": self.edit_plate.text(),
+        }
+        if not any(value.strip() for value in fields.values()):
+            self.load_users(filter_clause, tuple(params))
+            return
+        self.model.set_ids(self.user_search.search(fields=fields, filter_clause=filter_clause, params=params))
+
+    def delete_user(self):
+        selected = self.selected_row()
+        if selected is None:
+            # Do nothing if no row is selected
+            return
+        user_id = str(selected[0])
+        reply = QtWidgets.QMessageBox.question(self, "Delete User",
+                                               "Are you sure you want to delete this user?",
+                                               QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
+        if reply == QtWidgets.QMessageBox.Yes:
+            conn = sqlite3.connect(DB_PATH)
+            c = conn.cursor()
+            c.execute("DELETE FROM users WHERE id=?", (user_id,))
+            conn.commit()
+            conn.close()
+            if self.user_cache:
+                self.user_cache.invalidate_user(user_id)
+            if self.access:
+                self.access.reload_users([int(user_id)])
+            if self.device_sync:
+                self.device_sync.request_sync([int(user_id)])
+            self.load_users()
+            self.clear_fields()
+
+    def import_users(self):
+        if self.transfer_thread is not None:
+            return
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Import Users", "", "Users (*.csv *.json)")
+        if not path:
+            return
+        photo_dir = None
+        reply = QtWidgets.QMessageBox.question(self, "Import Users", "Import photos from a folder too?",
+                                               QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
+        if reply == QtWidgets.QMessageBox.Yes:
+            photo_dir = QtWidgets.QFileDialog.getExistingDirectory(self, "Photo Folder") or None
+        thread = UserImportThread(path, DB_PATH, photo_dir=photo_dir)
+        thread.finished_ok.connect(self.on_import_finished)
+        self.start_transfer(thread, "Importing users...")
+
+    def export_users(self):
+        if self.transfer_thread is not None:
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export Users", "users.csv", "CSV (*.csv);;JSON (*.json)")
+        if not path:
+            return
+        photo_dir = None
+        reply = QtWidgets.QMessageBox.question(self, "Export Users", "Export photos too?",
+                                               QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
+        if reply == QtWidgets.QMessageBox.Yes:
+            photo_dir = os.path.splitext(path)[0] + "_photos"
+        thread = UserExportThread(path, DB_PATH, photo_dir=photo_dir)
+        thread.finished_ok.connect(self.on_export_finished)
+        self.start_transfer(thread, "Exporting users...")
+
+    def start_transfer(self, thread, label):
+        self.transfer_thread = thread
+        self.transfer_progress = QtWidgets.QProgressDialog(label, "Cancel", 0, 100, self)
+        self.transfer_progress.setWindowModality(QtCore.Qt.WindowModal)
+        self.transfer_progress.canceled.connect(thread.cancel)
+        thread.progress.connect(self.on_transfer_progress)
+        thread.failed.connect(self.on_transfer_failed)
+        thread.start()
+
+    def on_transfer_progress(self, done, total):
+        if self.transfer_progress:
+            # JSON imports are not counted up front
+            self.transfer_progress.setValue(int(done * 100 / total) if total else 0)
+
+    def on_import_finished(self, imported, failed, report):
+        self.end_transfer()
+        # Many cards may have changed at once
+        if self.user_cache:
+            self.user_cache.clear()
+        if self.access:
+            self.access.reload_users()
+        if self.device_sync:
+            self.device_sync.request_sync()
+        self.load_users()
+        message = f"Imported {imported} users."
+        if failed:
+            message += f"\n{failed} rows were rejected"
+            message += f"; see {report}." if report else "."
+        QtWidgets.QMessageBox.information(self, "Import Users", message)
+
+    def on_export_finished(self, path, rows):
+        self.end_transfer()
+        QtWidgets.QMessageBox.information(self, "Export Users", f"Exported {rows} users to {path}.")
+
+    def on_transfer_failed(self, message):
+        self.end_transfer()
+        # A failed or cancelled import keeps the batches it already committed
+        if self.user_cache:
+            self.user_cache.clear()
+        if self.access:
+            self.access.reload_users()
+        if self.device_sync:
+            self.device_sync.request_sync()
+        self.load_users()
+        QtWidgets.QMessageBox.warning(self, "Users", message)
+
+    def end_transfer(self):
+        self.transfer_thread.wait()
+        self.transfer_thread = None
+        if self.transfer_progress:
+            self.transfer_progress.close()
+            self.transfer_progress = None
+
+    def reject(self):
+        # Leave no import/export thread running behind a closed dialog
+        if self.transfer_thread is not None:
+            self.transfer_thread.cancel()
+            self.transfer_thread.wait()
+        super().reject()
\ No newline at end of file
@@ -0,0 +1,103 @@
+import hashlib
+
+from PyQt5 import QtCore, QtGui
+
+PHOTO_MAX_SIZE = (1024, 1024)
+PHOTO_QUALITY = 85
+# Twice the table icon size, and large enough for the 80x100 edit preview
+PHOTO_THUMB_SIZE = (96, 120)
+PHOTO_THUMB_QUALITY = 80
+
+# Written with INSERT OR REPLACE: a new photo replaces the user's old one
+STORE_PHOTO_SQL = "INSERT OR REPLACE INTO user_photos (user_id, photo, photo_thumb) VALUES (?, ?, ?)"
+
+def init_user_photos(conn, batch_size=20):
+    # Photos live in their own table keyed by user id, so listing users never
+    # walks a row's BLOB overflow pages to reach the columns stored after it.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_photos (
+            user_id INTEGER PRIMARY KEY,
+            photo BLOB,
+            photo_thumb BLOB
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_photos_ad AFTER DELETE ON users BEGIN
+            DELETE FROM user_photos WHERE user_id = old.id;
+        END
+    """)
+    conn.commit()
+    # Databases from before the side table keep photos in users; move them
+    # over a batch at a time and clear the old columns (not dropped, so an
+    # older version can still open the file)
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(users)")]
+    legacy = [name for name in ("photo", "photo_thumb") if name in columns]
+    if not legacy:
+        return
+    selected = ", ".join(name if name in legacy else "NULL" for name in ("photo", "photo_thumb"))
+    pending = " OR ".join(f"{name} IS NOT NULL" for name in legacy)
+    cleared = ", ".join(f"{name} = NULL" for name in legacy)
+    while True:
+        rows = conn.execute(f"SELECT id, {selected} FROM users WHERE {pending} LIMIT ?", (batch_size,)).fetchall()
+        if not rows:
+            break
+        conn.executemany(STORE_PHOTO_SQL, rows)
+        conn.executemany(f"UPDATE users SET {cleared} WHERE id = ?", [(row[0],) for row in rows])
+        conn.commit()
+
+def store_photo(conn, user_id, photo, thumb):
+    # Not committed here; part of the caller's users write
+    conn.execute(STORE_PHOTO_SQL, (user_id, photo, thumb))
+
+def photo_hash(photo):
+    return hashlib.sha1(photo).hexdigest() if photo else None
+
+def load_image(data):
+    # Applies the EXIF orientation, which camera JPEGs rely on
+    buf = QtCore.QBuffer()
+    buf.setData(QtCore.QByteArray(data))
+    buf.open(QtCore.QIODevice.ReadOnly)
+    reader = QtGui.QImageReader(buf)
+    reader.setAutoTransform(True)
+    return reader.read()
+
+def encode_jpeg(image, quality):
+    buf = QtCore.QBuffer()
+    buf.open(QtCore.QIODevice.WriteOnly)
+    if image.hasAlphaChannel():
+        image = image.convertToFormat(QtGui.QImage.Format_RGB32)
+    image.save(buf, "JPG", quality)
+    return bytes(buf.data())
+
+def fit(image, size):
+    if image.width() <= size[0] and image.height() <= size[1]:
+        return image
+    return image.scaled(size[0], size[1], QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+
+def normalize_photo(data):
+    # Returns (photo, thumbnail) JPEG bytes, or (None, None) if data is not an image.
+    # Done once at write time so listings never touch the full photo.
+    image = load_image(data)
+    if image.isNull():
+        return None, None
+    image = fit(image, PHOTO_MAX_SIZE)
+    return encode_jpeg(image, PHOTO_QUALITY), encode_jpeg(fit(image, PHOTO_THUMB_SIZE), PHOTO_THUMB_QUALITY)
+
+def make_thumbnail(data):
+    image = load_image(data)
+    if image.isNull():
+        return None
+    return encode_jpeg(fit(image, PHOTO_THUMB_SIZE), PHOTO_THUMB_QUALITY)
+
+def user_thumbnail(conn, user_id):
+    # Thumbnail bytes for a user, generating and storing it the first time for
+    # photos saved before photo_thumb existed. Only that path reads the full photo.
+    row = conn.execute("SELECT photo_thumb, photo IS NOT NULL FROM user_photos WHERE user_id=?", (user_id,)).fetchone()
+    if row is None or row[0] is not None or not row[1]:
+        return row[0] if row else None
+    photo = conn.execute("SELECT photo FROM user_photos WHERE user_id=?", (user_id,)).fetchone()[0]
+    thumb = make_thumbnail(photo)
+    if thumb is not None:
+        conn.execute("UPDATE user_photos SET photo_thumb=? WHERE user_id=?", (thumb, user_id))
+        conn.commit()
+    return thumb
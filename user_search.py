@@ -0,0 +1,153 @@
+import sqlite3
+
+SEARCH_COLUMNS = ("name", "card_number", "unit_number", "plate_number")
+MAX_RESULTS = 2000
+# Above this many matches (a one- or two-letter prefix) bm25 ordering costs more
+# than it is worth, and results come back in id order instead
+RANK_MAX_MATCHES = 4000
+
+# Arabic yeh/kaf are folded to the Persian letters, harakat are dropped and
+# ZWNJ splits words, both when indexing and querying. Kept short: the folding
+# is inlined into the triggers as nested replace() calls.
+_FOLD = {"ي": "ی", "ى": "ی", "ك": "ک", "\u200c": " "}
+_FOLD.update({chr(c): "" for c in range(0x064B, 0x0653)})
+_FOLD_TABLE = str.maketrans(_FOLD)
+
+# Digits are not folded in the index; a query term with digits matches the
+# ASCII, Persian and Arabic-Indic spellings instead
+_TO_ASCII = str.maketrans({chr(base + i): str(i) for base in (0x06F0, 0x0660) for i in range(10)})
+_TO_PERSIAN = str.maketrans({str(i): chr(0x06F0 + i) for i in range(10)})
+_TO_ARABIC = str.maketrans({str(i): chr(0x0660 + i) for i in range(10)})
+
+# bm25 weights per column: a card or name hit ranks above a unit/plate hit
+_RANK_WEIGHTS = "10.0, 8.0, 2.0, 2.0"
+
+def fold_text(text):
+    return (text or "").translate(_FOLD_TABLE)
+
+def _fold_sql(expr):
+    # Same folding as fold_text, as nested replace() calls for the triggers
+    for src, dst in _FOLD.items():
+        expr = f"replace({expr}, '{src}', '{dst}')"
+    return expr
+
+def _folded_values(prefix):
+    return ", ".join(_fold_sql(f"coalesce({prefix}.{col}, '')") for col in SEARCH_COLUMNS)
+
+def init_user_search(conn):
+    # Prefix indexes serve the fallback path and exact card lookups either way
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_name ON users(name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_unit ON users(unit_number)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_plate ON users(plate_number)")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='users_fts'").fetchone():
+        conn.commit()
+        return True
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE users_fts USING fts5("
+            + ", ".join(SEARCH_COLUMNS)
+            + ", content='users', content_rowid='id',"
+            " tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')"
+        )
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5; UserSearch falls back to the prefix indexes
+        conn.commit()
+        return False
+    columns = ", ".join(SEARCH_COLUMNS)
+    conn.executescript(f"""
+        CREATE TRIGGER users_fts_ai AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts(rowid, {columns}) VALUES (new.id, {_folded_values("new")});
+        END;
+        CREATE TRIGGER users_fts_ad AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts(users_fts, rowid, {columns}) VALUES ('delete', old.id, {_folded_values("old")});
+        END;
+        CREATE TRIGGER users_fts_au AFTER UPDATE OF {columns} ON users BEGIN
+            INSERT INTO users_fts(users_fts, rowid, {columns}) VALUES ('delete', old.id, {_folded_values("old")});
+            INSERT INTO users_fts(rowid, {columns}) VALUES (new.id, {_folded_values("new")});
+        END;
+    """)
+    # Not 'rebuild': that would index the unfolded text straight from users
+    conn.execute(f"INSERT INTO users_fts(rowid, {columns}) SELECT id, {_folded_values('users')} FROM users")
+    conn.commit()
+    return True
+
+def _digit_variants(token):
+    ascii_token = token.translate(_TO_ASCII)
+    if ascii_token == ascii_token.translate(_TO_PERSIAN):
+        return [token]
+    return [ascii_token, ascii_token.translate(_TO_PERSIAN), ascii_token.translate(_TO_ARABIC)]
+
+def _fts_terms(text, column=None):
+    terms = []
+    for token in fold_text(text).split():
+        variants = " OR ".join('"' + v.replace('"', '""') + '"*' for v in _digit_variants(token))
+        terms.append(f"{column} : ({variants})" if column else f"({variants})")
+    return terms
+
+def _glob_prefix(text):
+    for ch in "[*?":
+        text = text.replace(ch, f"[{ch}]")
+    return text + "*"
+
+class UserSearch:
+    # Ranked user search over users_fts (bm25), or over the B-tree prefix
+    # indexes when FTS5 is not available. Returns matching user ids, best first.
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._fts = None
+
+    def has_fts(self, conn):
+        if self._fts is None:
+            self._fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name='users_fts'").fetchone() is not None
+        return self._fts
+
+    def search(self, text="", fields=None, filter_clause="", params=(), limit=MAX_RESULTS):
+        # text matches any column; fields maps a SEARCH_COLUMNS name to its own text.
+        # filter_clause/params are extra conditions on users, e.g. "permission=?".
+        fields = {col: value for col, value in (fields or {}).items() if value and value.strip()}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if self.has_fts(conn):
+                return self._search_fts(conn, text, fields, filter_clause, params, limit)
+            return self._search_prefix(conn, text, fields, filter_clause, params, limit)
+        finally:
+            conn.close()
+
+    def _search_fts(self, conn, text, fields, filter_clause, params, limit):
+        terms = _fts_terms(text)
+        for col, value in fields.items():
+            terms.extend(_fts_terms(value, col))
+        if not terms:
+            return []
+        match = " AND ".join(terms)
+        query = "SELECT users_fts.rowid FROM users_fts"
+        if filter_clause:
+            query += " JOIN users ON users.id = users_fts.rowid"
+        query += " WHERE users_fts MATCH ?"
+        if filter_clause:
+            query += " AND (" + filter_clause + ")"
+        matches = conn.execute("SELECT COUNT(*) FROM users_fts WHERE users_fts MATCH ?", (match,)).fetchone()[0]
+        if matches <= RANK_MAX_MATCHES:
+            query += f" ORDER BY bm25(users_fts, {_RANK_WEIGHTS})"
+        else:
+            query += " ORDER BY users_fts.rowid"
+        query += " LIMIT ?"
+        args = (match,) + tuple(params) + (limit,)
+        return [row[0] for row in conn.execute(query, args)]
+
+    def _search_prefix(self, conn, text, fields, filter_clause, params, limit):
+        clauses = []
+        args = []
+        for token in fold_text(text).translate(_TO_ASCII).split():
+            clauses.append("(" + " OR ".join(f"{col} GLOB ?" for col in SEARCH_COLUMNS) + ")")
+            args.extend([_glob_prefix(token)] * len(SEARCH_COLUMNS))
+        for col, value in fields.items():
+            clauses.append(f"{col} GLOB ?")
+            args.append(_glob_prefix(fold_text(value).translate(_TO_ASCII).strip()))
+        if not clauses:
+            return []
+        if filter_clause:
+            clauses.append("(" + filter_clause + ")")
+            args.extend(params)
+        query = "SELECT id FROM users WHERE " + " AND ".join(clauses) + " ORDER BY id LIMIT ?"
+        return [row[0] for row in conn.execute(query, tuple(args) + (limit,))]
@@ -0,0 +1,198 @@
+import sqlite3
+from collections import OrderedDict
+
+from PyQt5 import QtCore, QtGui
+
+from user_photos import user_thumbnail
+
+USER_HEADERS = ["ID", "Name", "Card Number", "Unit Number", "Plate Number", "Permission", "Photo"]
+PHOTO_COLUMN = 6
+THUMBNAIL_SIZE = (48, 60)
+
+class ThumbnailCache:
+    # Scaled user photos keyed by (user id, photo hash), so an edited photo
+    # never serves a stale thumbnail. Shared by every UserTableModel.
+    def __init__(self, max_size=500):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        pixmap = self._entries.get(key)
+        if pixmap is not None:
+            self._entries.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        self._entries[key] = pixmap
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+_thumbnail_cache = ThumbnailCache()
+
+class _ThumbnailSignals(QtCore.QObject):
+    loaded = QtCore.pyqtSignal(int, str, QtGui.QImage)
+
+class _ThumbnailJob(QtCore.QRunnable):
+    # Reads one stored thumbnail off the GUI thread. Only QImage is used
+    # here; QPixmap must be created on the GUI thread.
+    def __init__(self, db_path, user_id, photo_hash, signals):
+        super().__init__()
+        self.db_path = db_path
+        self.user_id = user_id
+        self.photo_hash = photo_hash
+        self.signals = signals
+
+    def run(self):
+        image = QtGui.QImage()
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            try:
+                thumb = user_thumbnail(conn, self.user_id)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            thumb = None
+        if thumb:
+            image.loadFromData(thumb)
+            if not image.isNull():
+                image = image.scaled(THUMBNAIL_SIZE[0], THUMBNAIL_SIZE[1],
+                                     QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+        self.signals.loaded.emit(self.user_id, self.photo_hash, image)
+
+class UserTableModel(QtCore.QAbstractTableModel):
+    # Users are fetched page by page (without any photo BLOB) as the view
+    # scrolls. Stored thumbnails are decoded on a worker pool only when the
+    # view asks for a visible row's decoration.
+    PAGE_SIZE = 200
+    COLUMNS = "id, name, card_number, unit_number, plate_number, permission, photo_hash"
+
+    def __init__(self, db_path, thumbnail_cache=None, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.thumbnails = thumbnail_cache or _thumbnail_cache
+        self._rows = []
+        self._row_by_id = {}
+        self._filter_clause = ""
+        self._params = ()
+        self._ids = None
+        self._id_pos = 0
+        self._has_more = False
+        self._pending = set()
+        self._pool = QtCore.QThreadPool(self)
+        self._pool.setMaxThreadCount(2)
+        self._signals = _ThumbnailSignals(self)
+        self._signals.loaded.connect(self._on_thumbnail_loaded)
+
+    def set_filter(self, filter_clause="", params=()):
+        self._reset(filter_clause, params, None)
+
+    def set_ids(self, ids):
+        # Shows exactly these users in this order, e.g. ranked search results
+        self._reset("", (), list(ids))
+
+    def _reset(self, filter_clause, params, ids):
+        self.beginResetModel()
+        self._rows = []
+        self._row_by_id = {}
+        self._filter_clause = filter_clause
+        self._params = tuple(params)
+        self._ids = ids
+        self._id_pos = 0
+        self._has_more = True
+        self.endResetModel()
+        self.fetchMore()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(USER_HEADERS)
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and self._has_more
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or not self._has_more:
+            return
+        conn = sqlite3.connect(self.db_path)
+        try:
+            page = self._fetch_ids(conn) if self._ids is not None else self._fetch_page(conn)
+        finally:
+            conn.close()
+        if not page:
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(page) - 1)
+        for offset, row in enumerate(page):
+            self._row_by_id[row[0]] = first + offset
+        self._rows.extend(page)
+        self.endInsertRows()
+
+    def _fetch_page(self, conn):
+        # Keyset on id rather than OFFSET, so later pages cost the same as the first
+        last_id = self._rows[-1][0] if self._rows else -1
+        query = "SELECT " + self.COLUMNS + " FROM users WHERE id > ?"
+        if self._filter_clause:
+            query += " AND (" + self._filter_clause + ")"
+        query += " ORDER BY id LIMIT ?"
+        page = conn.execute(query, (last_id,) + self._params + (self.PAGE_SIZE,)).fetchall()
+        self._has_more = len(page) == self.PAGE_SIZE
+        return page
+
+    def _fetch_ids(self, conn):
+        wanted = self._ids[self._id_pos:self._id_pos + self.PAGE_SIZE]
+        self._id_pos += len(wanted)
+        self._has_more = self._id_pos < len(self._ids)
+        if not wanted:
+            return []
+        placeholders = ", ".join("?" * len(wanted))
+        by_id = {row[0]: row for row in conn.execute(
+            "SELECT " + self.COLUMNS + " FROM users WHERE id IN (" + placeholders + ")", wanted)}
+        return [by_id[user_id] for user_id in wanted if user_id in by_id]
+
+    def row_values(self, row):
+        # (id, name, card_number, unit_number, plate_number, permission, photo_hash)
+        return self._rows[row]
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        column = index.column()
+        if column == PHOTO_COLUMN:
+            photo_hash = row[6]
+            if role == QtCore.Qt.DisplayRole:
+                return "" if photo_hash else "No Photo"
+            if role == QtCore.Qt.DecorationRole and photo_hash:
+                return self._thumbnail(row[0], photo_hash)
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            value = row[column]
+            return str(value) if value is not None else ""
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return USER_HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def _thumbnail(self, user_id, photo_hash):
+        key = (user_id, photo_hash)
+        pixmap = self.thumbnails.get(key)
+        if pixmap is None:
+            if key not in self._pending:
+                self._pending.add(key)
+                self._pool.start(_ThumbnailJob(self.db_path, user_id, photo_hash, self._signals))
+            return None
+        # Undecodable photos are cached as null pixmaps so they are not retried
+        return None if pixmap.isNull() else pixmap
+
+    def _on_thumbnail_loaded(self, user_id, photo_hash, image):
+        key = (user_id, photo_hash)
+        self._pending.discard(key)
+        self.thumbnails.put(key, QtGui.QPixmap.fromImage(image))
+        row = self._row_by_id.get(user_id)
+        if row is not None and self._rows[row][6] == photo_hash:
+            index = self.index(row, PHOTO_COLUMN)
+            self.dataChanged.emit(index, index, [QtCore.Qt.DecorationRole])
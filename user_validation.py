@@ -0,0 +1,30 @@
+import re
+
+PERMISSIONS = ["Open", "Limited", "Restricted"]
+
+def validate_user(id_val, name, card, permission=None):
+    # Returns an error message, or None when the fields are valid
+    # Name cannot be empty, only letters (unicode), allow spaces; must not be blank
+    if not name.strip():
+        return "Name cannot be empty."
+    # Unicode letters and spaces only
+    if not re.match(r"^[^\W\d_]+(?: [^\W\d_]+)*$", name.strip(), re.UNICODE):
+        return "Name must contain only letters and spaces."
+
+    # Card Number cannot be empty, only digits
+    if not card.strip():
+        return "Card Number cannot be empty."
+    if not card.isdigit():
+        return "Card Number must contain only digits."
+
+    # ID, if provided, must be digits between 1 and 5000
+    if id_val:
+        if not id_val.isdigit():
+            return "ID must contain only digits."
+        id_int = int(id_val)
+        if not (1 <= id_int <= 5000):
+            return "ID must be between 1 and 5000."
+
+    if permission is not None and permission not in PERMISSIONS:
+        return "Permission must be one of: " + ", ".join(PERMISSIONS) + "."
+    return None